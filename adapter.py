@@ -9,12 +9,25 @@ all other connections are made as children to this DBAdapter function
 """
 
 # adapter.py
+import hashlib
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+from psycopg2.extensions import parse_dsn
+from secretstore import SecretStore, buildProvider
+from pool import ConnectionPool, PoolError
+from replicas import Replica, ReplicaRouter
+from notifier import FakeTransport, SendGridTransport, TransportError
+from outbox import OutboxDrainer, jobStatus
+from changefeed import ChangeFeed
+from emailtemplates import UnsubscribeLinks
+from migrations import runMigrations
+import metrics
+
+logger = logging.getLogger(__name__)
 
 
 # Singleton metaclass to ensure only one instance is created.
@@ -26,92 +39,405 @@ class SingletonMeta(type):
             cls._instances[cls] = instance
         return cls._instances[cls]
 
+# Attribute name -> secret name, fetched together the first time each group is needed
+DB_SECRETS = {
+    "DB_HOST": "db-host",
+    "DB_NAME": "db-name",
+    "DB_USER": "db-user",
+    "DB_PASSWORD": "azure-postgresql-password-bf846",
+}
+EMAIL_SECRETS = {
+    "email_api_key": "email-api-key",
+    "email_address": "email-sender",
+}
+
+def _secretProperty(attr, group):
+    return property(lambda self: self._secretGroup(group)[attr])
+
 class Adapter(metaclass=SingletonMeta):
     def __init__(self):
-        # Azure Key Vault Configuration
-        self.keyVault = "https://meetezkeyvault.vault.azure.net"
-        self.credential = DefaultAzureCredential()
-        self.client = SecretClient(vault_url=self.keyVault, credential=self.credential)
-        
-        self._secrets_cache = {}
-        # Retrieve and validate database credentials
-        self.DB_HOST = self.getSecret("db-host")
-        self.DB_NAME = self.getSecret("db-name")
-        self.DB_USER = self.getSecret("db-user")
-        self.DB_PASSWORD = self.getSecret("azure-postgresql-password-bf846")
-        
-        if None in [self.DB_HOST, self.DB_NAME, self.DB_USER, self.DB_PASSWORD]:
-            raise ValueError("ERROR: One or more database secrets are missing!")
-        
-        # Initialize email provider API connection details
-        self.email_api_key = self.getSecret("email-api-key")
-        self.email_address = self.getSecret("email-sender")
-        
-        if None in [self.email_api_key, self.email_address]:
-            raise ValueError("ERROR: One or more email secrets are missing!")
+        # Secrets are fetched lazily (and concurrently) on first use, never at import time
+        self.secrets = SecretStore(buildProvider(), ttl=float(os.environ.get("SECRETS_TTL", 3600)))
+        if os.environ.get("SECRETS_PREFETCH", "1") == "1":
+            self.secrets.prefetch(list(DB_SECRETS.values()) + list(EMAIL_SECRETS.values()))
+
+        # Connection pool is created on first use so importing the module stays cheap
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._router = None  # read replicas, built on first use when DB_REPLICAS is set
+
+        # Email transport (one reused SendGrid client) and outbox drainer, also lazy
+        self._transport = None
+        self._drainer = None
+        self._feed = None
+        self._links = None
+        self._email_lock = threading.RLock()  # the drainer builds the transport while holding it
+
+    DB_HOST = _secretProperty("DB_HOST", DB_SECRETS)
+    DB_NAME = _secretProperty("DB_NAME", DB_SECRETS)
+    DB_USER = _secretProperty("DB_USER", DB_SECRETS)
+    DB_PASSWORD = _secretProperty("DB_PASSWORD", DB_SECRETS)
+    email_api_key = _secretProperty("email_api_key", EMAIL_SECRETS)
+    email_address = _secretProperty("email_address", EMAIL_SECRETS)
             
     def getSecret(self, secretName):
-        """Fetch a secret from Azure Key Vault with caching"""
-        if secretName in self._secrets_cache:
-            return self._secrets_cache[secretName]
+        """Fetch a secret through the cached secret store"""
+        return self.secrets.get(secretName)
+
+    def _secretGroup(self, group):
+        """Resolve a group of secrets in one concurrent fetch, failing loudly if any is missing."""
+        values = self.secrets.getMany(list(group.values()))
+        missing = [name for name, value in values.items() if value is None]
+        if missing:
+            kind = "database" if group is DB_SECRETS else "email"
+            raise ValueError(f"ERROR: One or more {kind} secrets are missing: {', '.join(missing)}")
+        return {attr: values[name] for attr, name in group.items()}
+
+    def dbConnectArgs(self):
+        """Keyword arguments for a PostgreSQL connection (shared by the sync and async drivers)."""
+        # Read secrets per connection so a rotated password is used by the next connect
+        db = self._secretGroup(DB_SECRETS)
+        return {
+            "dbname": db["DB_NAME"],
+            "user": db["DB_USER"],
+            "password": db["DB_PASSWORD"],
+            "host": db["DB_HOST"],
+            "port": 5432,  # Default PostgreSQL port
+            "connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", 10)),
+        }
+
+    def _newConnection(self, overrides=None):
+        """Open a brand new PostgreSQL connection (only the pools should call this).
+
+        ``overrides`` replaces connect arguments for a replica; its connections are read-only.
+        """
+        started = time.perf_counter()
+        conn = psycopg2.connect(cursor_factory=metrics.InstrumentedCursor,
+                                **dict(self.dbConnectArgs(), **(overrides or {})))
+        if overrides is not None:
+            conn.set_session(readonly=True)
+        metrics.CONNECT_SECONDS.observe(time.perf_counter() - started)
+        return conn
+
+    @staticmethod
+    def _fill(pool, name):
+        """Open a new pool's ``minconn`` connections now; a failure is left to the first checkout."""
+        try:
+            pool.fill()
+        except PoolError as e:
+            logger.warning("Could not pre-open %s connections: %s", name, e)
+
+    @property
+    def pool(self):
+        """Shared, bounded connection pool (sized via DB_POOL_MIN / DB_POOL_MAX)."""
+        pool = None
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pool = ConnectionPool(
+                        self._newConnection,
+                        minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+                        maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+                        timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+                        max_idle=float(os.environ.get("DB_POOL_MAX_IDLE", 300)),
+                    )
+        if pool is not None:
+            # Outside the lock, so other threads can borrow from the pool while it fills
+            self._fill(pool, "primary")
+        return self._pool
+
+    def replicaTargets(self):
+        """(name, connect overrides) per DB_REPLICAS entry.
+
+        Entries are comma-separated: ``host``, ``host:port`` or a libpq DSN / URI;
+        anything an entry leaves out (user, password, ...) is taken from the primary.
+        """
+        targets = []
+        for entry in os.environ.get("DB_REPLICAS", "").split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            if "=" in entry or "://" in entry:
+                overrides = parse_dsn(entry)
+            else:
+                host, sep, port = entry.rpartition(":")
+                overrides = {"host": host, "port": int(port)} if sep and port.isdigit() else {"host": entry}
+            name = overrides.get("host", "primary-host")
+            if "port" in overrides:
+                name += f":{overrides['port']}"
+            targets.append((name, overrides))
+        return targets
+
+    @property
+    def replicas(self):
+        """Router over the read replicas' pools, or None without DB_REPLICAS."""
+        replicas = ()
+        if self._router is None and os.environ.get("DB_REPLICAS"):
+            with self._pool_lock:
+                if self._router is None:
+                    replicas = [Replica(name, ConnectionPool(
+                        lambda overrides=overrides: self._newConnection(overrides),
+                        minconn=int(os.environ.get("DB_REPLICA_POOL_MIN", 0)),
+                        maxconn=int(os.environ.get("DB_REPLICA_POOL_MAX", os.environ.get("DB_POOL_MAX", 10))),
+                        # A busy replica hands the read to the primary rather than queueing for long
+                        timeout=float(os.environ.get("DB_REPLICA_POOL_TIMEOUT", 5)),
+                        max_idle=float(os.environ.get("DB_POOL_MAX_IDLE", 300)),
+                        # Ping sooner than the primary does, so a restarted replica costs a fallback, not an error
+                        ping_after=float(os.environ.get("DB_REPLICA_PING_AFTER", 2)),
+                    )) for name, overrides in self.replicaTargets()]
+                    self._router = ReplicaRouter(
+                        replicas,
+                        policy=os.environ.get("DB_REPLICA_POLICY", "round_robin").lower(),
+                        max_lag=float(os.environ.get("DB_REPLICA_MAX_LAG", 5)),
+                        sticky_seconds=float(os.environ.get("DB_STICKY_SECONDS", 5)),
+                        check_interval=float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 2)),
+                    )
+        for replica in replicas:
+            self._fill(replica.pool, f"replica {replica.name}")
+        return self._router
 
+    def warmPools(self):
+        """Build the pools at worker startup so DB_POOL_MIN connections are open before the first request."""
+        self.pool
+        self.replicas
+
+    @contextmanager
+    def connection(self, readonly=False, write=None):
+        """Borrow a pooled connection for the duration of a ``with`` block.
+
+        ``readonly=True`` lets a replica serve it; see replicas.py for the routing.
+        Any other connection borrowed during a request counts as that client's write
+        unless ``write=False``, for reads that must see the primary but should not
+        pin the client to it.
+        """
+        started = time.perf_counter()
+        router = self.replicas
+        replica = router.acquire() if readonly and router is not None else None
+        pool, conn = self.pool, None
+        if replica is not None:
+            try:
+                conn = replica.pool.getconn()
+                pool = replica.pool
+            except PoolError as e:
+                router.release(replica)
+                router.failed(replica, e)
+                replica = None
+        if conn is None:
+            conn = pool.getconn()
+        metrics.observeConnectionWait(time.perf_counter() - started)
+
+        broken = False
         try:
-            secret_value = self.client.get_secret(secretName).value
-            self._secrets_cache[secretName] = secret_value
-            return secret_value
+            yield conn
         except Exception as e:
-            print(f"Error fetching {secretName}: {e}")
+            broken = bool(conn.closed)
+            if broken and replica is not None:
+                router.failed(replica, e)
+            raise
+        finally:
+            pool.putconn(conn, discard=broken)
+            if replica is not None:
+                router.release(replica)
+        if (not readonly if write is None else write) and router is not None:
+            router.noteWrite()
+
+    def beginReads(self, client, sticky_cookie=None):
+        """Start routing a request's reads; returns a token for endReads (None without replicas)."""
+        router = self.replicas
+        if router is None:
             return None
+        try:
+            sticky_until = float(sticky_cookie) if sticky_cookie else None
+        except ValueError:
+            sticky_until = None
+        return router.beginRequest(client, sticky_until)
+
+    def readsFromPrimary(self):
+        """True if the current request must see its client's own writes (replicas are skipped)."""
+        router = self._router
+        return router is not None and router.readsFromPrimary()
+
+    def stickySeconds(self):
+        """How long the current request's client should keep reading from the primary (0 if it didn't write)."""
+        router = self._router
+        return router.sticky_seconds if router is not None and router.wrote() else 0
+
+    def endReads(self, token):
+        if token is not None:
+            self._router.endRequest(token)
 
     def connectDB(self):
-        """Connect to the PostgreSQL database and return a connection object."""
+        """Borrow a pooled connection; calling ``close()`` on it returns it to the pool."""
+        started = time.perf_counter()
         try:
-            conn = psycopg2.connect(
-                dbname=self.DB_NAME,
-                user=self.DB_USER,
-                password=self.DB_PASSWORD,
-                host=self.DB_HOST,
-                port=5432  # Default PostgreSQL port
-            )
-            return conn
-        except Exception as e:
-            print("Database connection failed:", e)
+            conn = self.pool.getconn()
+        except PoolError as e:
+            logger.error("Database connection failed: %s", e)
             return None
-    
+        metrics.observeConnectionWait(time.perf_counter() - started)
+        return PooledConnection(self.pool, conn)
+
     def closeDB(self):
-        """Close the database connection."""
-        if self.conn:
-            self.conn.close()
-            self.connection = None
-            print("Database connection closed successfully!")
-            
+        """Close every pooled database connection."""
+        if self._pool:
+            self._pool.closeall()
+            self._pool = None
+            logger.info("Database connection pool closed.")
+        if self._router:
+            self._router.closeall()
+            self._router = None
+
+    def poolStats(self):
+        """Pool saturation metrics (all zeros until the first connection is borrowed)."""
+        if self._pool is None:
+            stats = {"size": 0, "idle": 0, "in_use": 0, "waiting": 0, "saturation": 0.0}
+        else:
+            stats = self._pool.stats()
+        if self._router is not None:
+            stats["replicas"] = self._router.replicaStats()
+        return stats
+
+    def routingStats(self):
+        """Replica routing counters (empty without replicas)."""
+        return self._router.stats() if self._router is not None else {}
+
+    @property
+    def transport(self):
+        """Email transport shared by every send; EMAIL_TRANSPORT=fake keeps mail local."""
+        if self._transport is None:
+            with self._email_lock:
+                if self._transport is None:
+                    if os.environ.get("EMAIL_TRANSPORT", "sendgrid").lower() == "fake":
+                        transport = FakeTransport()
+                    else:
+                        email = self._secretGroup(EMAIL_SECRETS)
+                        transport = SendGridTransport(email["email_api_key"], email["email_address"])
+                    self._transport = metrics.InstrumentedTransport(transport)
+        return self._transport
+
+    @property
+    def outboxDrainer(self):
+        """In-process outbox drainer (OUTBOX_WORKERS=0 leaves delivery to `python outbox.py`)."""
+        if self._drainer is None:
+            with self._email_lock:
+                if self._drainer is None:
+                    self._drainer = OutboxDrainer(
+                        self.connection,
+                        self.transport,
+                        workers=int(os.environ.get("OUTBOX_WORKERS", 1)),
+                        batch_size=int(os.environ.get("OUTBOX_BATCH_SIZE", 500)),
+                        poll_interval=float(os.environ.get("OUTBOX_POLL_INTERVAL", 5)),
+                        links=self.unsubscribeLinks,
+                    )
+        return self._drainer
+
+    @property
+    def unsubscribeLinks(self):
+        """Signer for the unsubscribe links in notification emails (secret ``unsubscribe-key``)."""
+        if self._links is None:
+            with self._email_lock:
+                if self._links is None:
+                    key = self.getSecret("unsubscribe-key")
+                    if not key:
+                        # Still stable across processes and restarts, but rotates with the password
+                        logger.warning("No unsubscribe-key secret; deriving the link key from DB_PASSWORD")
+                        password = self._secretGroup(DB_SECRETS)["DB_PASSWORD"]
+                        key = hashlib.sha256(b"meetez-unsubscribe:" + password.encode()).digest()
+                    self._links = UnsubscribeLinks(key)
+        return self._links
+
+    @property
+    def changeFeed(self):
+        """This process's single LISTEN connection for event changes, started by its first subscriber."""
+        if self._feed is None:
+            with self._pool_lock:
+                if self._feed is None:
+                    # A dedicated connection outside the pools: LISTEN lives as long as the session,
+                    # and notifications only come from the primary
+                    self._feed = ChangeFeed(lambda: psycopg2.connect(**self.dbConnectArgs()))
+        return self._feed
+
+    def debounceSettings(self):
+        """(window, max_wait) in seconds for coalescing notifications about the same event."""
+        window = float(os.environ.get("NOTIFY_DEBOUNCE", 30))
+        return window, float(os.environ.get("NOTIFY_DEBOUNCE_MAX", window * 5))
+
+    def startOutbox(self):
+        """Start the in-process drainer at app startup, so rows left pending by an earlier run go out."""
+        if int(os.environ.get("OUTBOX_WORKERS", 1)) > 0:
+            try:
+                self.outboxDrainer.start()
+            except Exception as e:
+                # The API still serves; the next wakeOutbox() tries again
+                logger.exception("Outbox drainer not started: %s", e)
+
+    def wakeOutbox(self):
+        """Nudge the in-process drainer after committing new outbox rows."""
+        if int(os.environ.get("OUTBOX_WORKERS", 1)) > 0:
+            self.outboxDrainer.wake()
+
     # Example method for sending an email via your provider.
     def sendEmail(self, recipient, subject, body):
-        
-        message = Mail(
-            from_email= self.email_address,
-            to_emails = recipient,
-            subject = subject,
-            html_content = body)
-        
         try:
-            sg = SendGridAPIClient(self.email_api_key)
-            response = sg.send(message)
-            print(response.status_code)
-            print(response.body)
-            print(response.headers)
-        except Exception as e:
-            print(f'adapter error: {str(e)}')
-            
-        print(f"Sending email to {recipient} with subject '{subject}'")
+            status = self.transport.sendBatch(subject, body, [recipient])
+            logger.info("Email to %s accepted with status %s", recipient, status)
+        except TransportError as e:
+            logger.error("Email to %s failed: %s", recipient, e)
+
         return {"status": "Email sent"}
 
+    def notificationStatus(self, job_id):
+        """Status of an outbox job, or None if there is no such job."""
+        # Polled right after the job is queued, so read the primary, but a poll is not a write
+        with self.connection(write=False) as conn:
+            return jobStatus(conn, job_id)
+
+class PooledConnection:
+    """Thin proxy around a borrowed connection whose close() hands it back to the pool."""
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.putconn(self._conn)
+            self._conn = None
+
 adapter = Adapter()
 # Helper functions to expose a simple interface.
 def connectDB():
     #adapter = Adapter()  # Singleton instance
     return adapter.connectDB()
 
+def getConnection(readonly=False, write=None):
+    """Context manager borrowing a pooled connection: ``with getConnection() as conn:``
+
+    Pass ``readonly=True`` for reads that may be served by a replica, and
+    ``write=False`` for primary reads that should not count as a write.
+    """
+    return adapter.connection(readonly, write)
+
+def poolStats():
+    return adapter.poolStats()
+
+def routingStats():
+    return adapter.routingStats()
+
+def beginReads(client, sticky_cookie=None):
+    return adapter.beginReads(client, sticky_cookie)
+
+def stickySeconds():
+    return adapter.stickySeconds()
+
+def readsFromPrimary():
+    return adapter.readsFromPrimary()
+
+def endReads(token):
+    adapter.endReads(token)
+
 def closeDB():
     #adapter = Adapter()  # Singleton instance
     adapter.closeDB()
@@ -120,47 +446,39 @@ def sendEmail(recipient, subject, body):
     #adapter = Adapter()
     return adapter.sendEmail(recipient, subject, body)
 
+def notificationStatus(job_id):
+    return adapter.notificationStatus(job_id)
+
+def warmPools():
+    adapter.warmPools()
+
+def startOutbox():
+    adapter.startOutbox()
+
+def wakeOutbox():
+    adapter.wakeOutbox()
+
+def changeFeed():
+    return adapter.changeFeed
+
+def unsubscribeLinks():
+    return adapter.unsubscribeLinks
+
+def debounceSettings():
+    return adapter.debounceSettings()
+
 # Function to setup DB schema
 def createSchema():
-    conn = connectDB()
-    if not conn:
-        print("Failed to connect to the database.")
-        return False
+    """Bring the database up to the latest schema version (cheap when already current)."""
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            
-            CREATE TABLE IF NOT EXISTS events (
-                event_id SERIAL PRIMARY KEY,
-                user_id INT NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                event_date DATE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-            );
-            
-            CREATE TABLE IF NOT EXISTS notifications (
-                notification_id SERIAL PRIMARY KEY,
-                user_id INT NOT NULL,
-                event_id INT NOT NULL,
-                subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                FOREIGN KEY (event_id) REFERENCES events(event_id) ON DELETE CASCADE
-            );
-        """)
-        conn.commit()
-        cur.close()
-        conn.close()
-        print("Database schema created successfully.")
+        with getConnection() as conn:
+            applied = runMigrations(conn)
+        if applied:
+            logger.info("Database schema migrated (applied versions %s).", applied)
+        else:
+            logger.info("Database schema already up to date.")
         return True
     
     except Exception as e:
-        print(f"Error creating database schema: {e}")
-        return False
\ No newline at end of file
+        logger.error("Error creating database schema: %s", e)
+        return False
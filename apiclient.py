@@ -0,0 +1,182 @@
+"""
+Data access for the dashboard.
+
+By default the Dash callbacks call the service layer in-process (LocalClient).
+Setting MEETEZ_API_URL switches to RemoteClient, which talks to a MeetEZ API
+over HTTP through one pooled keep-alive ``requests.Session``. Both raise
+ServiceError on failure, so callbacks handle errors the same way in either mode.
+
+LocalClient writes bypass the API routes, so inside a request they are charged
+to the route's rate limit (and expensive-route slot) as if they had been called
+over HTTP by the same client.
+"""
+
+# apiclient.py
+import json
+import os
+import threading
+
+import requests
+from flask import has_request_context, request
+from requests.adapters import HTTPAdapter
+
+import services
+from ratelimit import limiter
+from services import ServiceError
+
+
+class LocalClient:
+    """Calls the service layer directly; no HTTP, no second worker slot."""
+    def _call(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except ServiceError:
+            raise
+        except Exception as e:
+            raise ServiceError(f"Database error: {str(e)}", 500) from e
+
+    def _write(self, route, fn, *args):
+        """_call for a write, limited as ``route`` for the client of the current request."""
+        clients = request.environ.get("meetez.clients") if has_request_context() else None
+        if not clients:
+            return self._call(fn, *args)
+        limiter.check(route, clients)
+        admitted = limiter.admit(route)
+        try:
+            return self._call(fn, *args)
+        finally:
+            if admitted:
+                limiter.leave()
+
+    def addEvent(self, user_id, title, description, event_date):
+        return self._write("/addEvent", services.addEvent, user_id, title, description, event_date)
+
+    def getEvents(self, **params):
+        return self._call(services.getEvents, **params)
+
+    def searchEvents(self, q, limit=None, cursor=None):
+        return self._call(services.searchEvents, q, limit or services.SEARCH_PAGE_SIZE, cursor)
+
+    def getEventsTable(self, page=0, page_size=25, sort_by=(), filters=()):
+        return self._call(services.getEventsTable, page, page_size, sort_by, filters)
+
+    def updateEvent(self, event_id, title, description, event_date):
+        return self._write("/updateEvent", services.updateEvent, event_id, title, description, event_date)
+
+    def deleteEvent(self, event_id):
+        return self._write("/deleteEvent", services.deleteEvent, event_id)
+
+    def subscribeEvent(self, user_id, event_id):
+        return self._write("/subscribeEvent", services.subscribeEvent, user_id, event_id)
+
+    def unsubscribeEvent(self, user_id, event_id):
+        return self._write("/unsubscribeEvent", services.unsubscribeEvent, user_id, event_id)
+
+    def subscribeMany(self, user_ids, event_ids):
+        return self._write("/subscribeMany", services.subscribeMany, user_ids, event_ids)
+
+    def unsubscribeMany(self, user_ids, event_ids):
+        return self._write("/unsubscribeMany", services.unsubscribeMany, user_ids, event_ids)
+
+    def getSubscribers(self, event_id):
+        return self._call(services.getSubscribers, event_id)["subscribers"]
+
+    def getUserEvents(self, user_id, **params):
+        return self._call(services.getUserEvents, user_id, **params)["events"]
+
+    def getEventStats(self, limit=10):
+        return self._call(services.getEventStats, limit)
+
+
+class RemoteClient:
+    """Same interface as LocalClient over HTTP, reusing pooled keep-alive connections."""
+    def __init__(self, base_url, timeout=10, pool_size=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}",
+                                            timeout=self.timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            raise ServiceError("API request timed out!", 504)
+        except requests.exceptions.RequestException as e:
+            raise ServiceError(f"API Request Failed: {str(e)}", 502)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if response.status_code != 200:
+            raise ServiceError(payload.get("error", f"API Error: {response.status_code}"), response.status_code)
+        return payload
+
+    def addEvent(self, user_id, title, description, event_date):
+        data = {"user_id": user_id, "title": title, "description": description, "event_date": event_date}
+        return self._request("POST", "/addEvent", json=data)["event_id"]
+
+    def getEvents(self, **params):
+        # Mirror the query-string names the route expects
+        query = {{"date_from": "from", "date_to": "to"}.get(k, k): v
+                 for k, v in params.items() if v is not None}
+        return self._request("GET", "/getEvents", params=query)
+
+    def searchEvents(self, q, limit=None, cursor=None):
+        params = {k: v for k, v in {"q": q, "limit": limit, "cursor": cursor}.items() if v is not None}
+        return self._request("GET", "/searchEvents", params=params)
+
+    def getEventsTable(self, page=0, page_size=25, sort_by=(), filters=()):
+        params = {"page": page, "page_size": page_size,
+                  "sort_by": json.dumps(list(sort_by)), "filters": json.dumps(list(filters))}
+        return self._request("GET", "/getEventsTable", params=params)
+
+    def updateEvent(self, event_id, title, description, event_date):
+        data = {"event_id": event_id, "title": title, "description": description, "event_date": event_date}
+        payload = self._request("POST", "/updateEvent", json=data)
+        return {"job_id": payload.get("job_id"), "recipients": payload.get("recipients")}
+
+    def deleteEvent(self, event_id):
+        self._request("POST", "/deleteEvent", json={"event_id": event_id})
+
+    def subscribeEvent(self, user_id, event_id):
+        payload = self._request("POST", "/subscribeEvent", json={"user_id": user_id, "event_id": event_id})
+        return bool(payload.get("subscribed"))
+
+    def unsubscribeEvent(self, user_id, event_id):
+        payload = self._request("POST", "/unsubscribeEvent", json={"user_id": user_id, "event_id": event_id})
+        return bool(payload.get("unsubscribed"))
+
+    def subscribeMany(self, user_ids, event_ids):
+        return self._request("POST", "/subscribeMany", json={"user_ids": user_ids, "event_ids": event_ids})
+
+    def unsubscribeMany(self, user_ids, event_ids):
+        return self._request("POST", "/unsubscribeMany", json={"user_ids": user_ids, "event_ids": event_ids})
+
+    def getSubscribers(self, event_id):
+        return self._request("GET", "/getSubscribers", params={"event_id": event_id})["subscribers"]
+
+    def getUserEvents(self, user_id, **params):
+        query = {{"date_from": "from", "date_to": "to"}.get(k, k): v
+                 for k, v in params.items() if v not in (None, False)}
+        query["user_id"] = user_id
+        return self._request("GET", "/getUserEvents", params=query)["events"]
+
+    def getEventStats(self, limit=10):
+        return self._request("GET", "/eventStats", params={"limit": limit})
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def getClient():
+    """Process-wide client: remote if MEETEZ_API_URL is set, otherwise in-process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                url = os.environ.get("MEETEZ_API_URL")
+                _client = RemoteClient(url) if url else LocalClient()
+    return _client
@@ -1,11 +1,140 @@
-from flask import Flask, jsonify, request
+import json
+import math
+import time
+from contextlib import ExitStack
+import psycopg2
+from flask import Flask, Response, jsonify, request
 from dash import Dash
-from adapter import connectDB, createSchema, sendEmail
+import changefeed
+import httpcache
+import metrics
+import rows
+from adapter import (beginReads, changeFeed, endReads, getConnection, createSchema, poolStats, routingStats,
+                     startOutbox, stickySeconds, warmPools)
+from cache import queryCache
+from pool import PoolError
+from ratelimit import RateLimited, clientKeys, limiter
+from replicas import STICKY_COOKIE
+import services
+from services import ServiceError
 
 # Create Flask app
 app = Flask(__name__)
+app.json = rows.FastJSONProvider(app)
 app.url_map.strict_slashes = False
 
+@app.before_request
+def startTimer():
+    request.environ["meetez.started"] = metrics.beginRequest()
+
+@app.after_request
+def recordTimings(response):
+    started = request.environ.pop("meetez.started", None)
+    if started is not None:
+        # Label by route rule, not raw path, so ids don't explode cardinality
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.endRequest(started, route, request.method, response.status_code)
+    return response
+
+@app.before_request
+def admitRequest():
+    if request.url_rule is None:
+        return
+    route = request.url_rule.rule
+    # user_id in a request is unauthenticated, so clients are told apart by address alone
+    clients = clientKeys(request.access_route, request.remote_addr)
+    limiter.check(route, clients)
+    # Dashboard callbacks charge the writes they make in-process to the same clients
+    request.environ["meetez.clients"] = clients
+    request.environ["meetez.admitted"] = limiter.admit(route)
+    # The client's address decides read-your-writes stickiness when replicas are configured
+    request.environ["meetez.reads"] = beginReads(clients[0], request.cookies.get(STICKY_COOKIE))
+
+@app.after_request
+def releaseSlot(response):
+    if request.environ.pop("meetez.admitted", False):
+        if response.is_streamed:
+            # Streamed exports keep their slot until the body has been sent
+            response.call_on_close(limiter.leave)
+        else:
+            limiter.leave()
+    return response
+
+@app.teardown_request
+def releaseSlotOnError(exc):
+    # after_request never ran (unhandled error); don't leak the slot
+    if request.environ.pop("meetez.admitted", False):
+        limiter.leave()
+
+@app.after_request
+def stickToPrimary(response):
+    # After a write, this client's reads stay on the primary (in every worker) until the cookie expires
+    seconds = stickySeconds()
+    if seconds:
+        response.set_cookie(STICKY_COOKIE, f"{time.time() + seconds:.3f}", max_age=math.ceil(seconds),
+                            httponly=True, samesite="Lax")
+    return response
+
+@app.teardown_request
+def endRequestReads(exc):
+    endReads(request.environ.pop("meetez.reads", None))
+
+@app.after_request
+def compressResponse(response):
+    # Registered after recordTimings, so it runs first and its time is counted
+    if httpcache.compressible(response):
+        response.vary.add("Accept-Encoding")
+        compressed = httpcache.compressBody(request, response.get_data())
+        if compressed:
+            response.set_data(compressed[0])
+            response.headers["Content-Encoding"] = compressed[1]
+    return response
+
+def conditionalJSON(scopes, build):
+    """jsonify(build(etag)) stamped with the scopes' ETag / Last-Modified.
+
+    The stamp is read before the payload, so the body is never older than its
+    ETag; a client already holding it gets a 304 and ``build`` never runs.
+    ``build`` gets the ETag to key its cache entry on (services.versionedKey).
+    """
+    etag, modified = services.dataVersion(scopes)
+    if httpcache.isFresh(request, etag, modified):
+        response = Response(status=304)
+    else:
+        response = jsonify(build(etag))
+    return httpcache.stampResponse(response, etag, modified)
+
+metrics.REGISTRY.register(metrics.Gauge(
+    "meetez_db_pool", "Connection pool state (size, idle, in_use, waiting, saturation)", poolStats, "stat"))
+metrics.REGISTRY.register(metrics.Gauge(
+    "meetez_cache", "Query cache counters (hits, misses, invalidations, entries, ...)", queryCache.stats, "stat"))
+metrics.REGISTRY.register(metrics.Gauge(
+    "meetez_rate_limiter", "Rate limiter state (limited, expensive_active, expensive_rejected, ...)",
+    limiter.stats, "stat"))
+metrics.REGISTRY.register(metrics.Gauge(
+    "meetez_db_routing", "Read routing (replica_reads, primary_reads, sticky_reads, fallbacks, healthy, ...)",
+    routingStats, "stat"))
+metrics.REGISTRY.register(metrics.Gauge(
+    "meetez_changefeed", "Change feed listener (subscribers, messages, deliveries, reconnects, connected)",
+    lambda: changeFeed().stats(), "stat"))
+
+@app.errorhandler(RateLimited)
+def rateLimited(e):
+    return jsonify({"error": str(e)}), e.status, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(ServiceError)
+def serviceError(e):
+    return jsonify({"error": str(e)}), e.status
+
+@app.errorhandler(PoolError)
+def poolUnavailable(e):
+    # Raised when no pooled connection could be borrowed (DB down or pool exhausted)
+    return jsonify({"error": f"Failed to connect to database: {str(e)}"}), 503
+
+@app.errorhandler(psycopg2.Error)
+def databaseError(e):
+    return jsonify({"error": f"Database error: {str(e)}"}), 500
+
 @app.route("/")
 def home():
     return jsonify({"message": "Flask App is Running!"})
@@ -28,267 +157,287 @@ def initSchema():
 @app.route("/addEvent", methods=["POST"])
 def addEvent():
     data = request.get_json()  # Read JSON from the request
-    user_id = data.get("user_id")
-    title = data.get("title")
-    description = data.get("description")
-    event_date = data.get("event_date")
-    
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
-    
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO events (user_id, title, description, event_date)
-            VALUES (%s, %s, %s, %s) RETURNING event_id;
-        """, (user_id, title, description, event_date))
-        event_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify({"message": "Event added successfully!", "event_id": event_id})
-    except Exception as e:
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    event_id = services.addEvent(data.get("user_id"), data.get("title"),
+                                 data.get("description"), data.get("event_date"))
+    return jsonify({"message": "Event added successfully!", "event_id": event_id})
 
 @app.route("/getEvents", methods=["GET"])
 def getEvents():
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
-
+    """One page of events; see services.getEvents for the query parameters."""
+    return conditionalJSON(services.eventsScopes(), lambda version: services.getEvents(
+        limit=request.args.get("limit", services.DEFAULT_PAGE_SIZE),
+        cursor=request.args.get("cursor"),
+        date_from=request.args.get("from"),
+        date_to=request.args.get("to"),
+        user_id=request.args.get("user_id"),
+        version=version,
+    ))
+
+@app.route("/searchEvents", methods=["GET"])
+def searchEvents():
+    """Full-text search: ``q`` (words, matched as prefixes), ``limit`` and ``cursor``."""
+    return conditionalJSON(services.eventsScopes(), lambda version: services.searchEvents(
+        request.args.get("q"),
+        limit=request.args.get("limit", services.SEARCH_PAGE_SIZE),
+        cursor=request.args.get("cursor"),
+        version=version,
+    ))
+
+@app.route("/getEventsTable", methods=["GET"])
+def getEventsTable():
+    """Offset-paged, sortable, filterable events for the dashboard table.
+
+    ``sort_by`` and ``filters`` are JSON lists: [["title", "asc"]] and
+    [["title", "contains", "party"], ["event_date", "ge", "2025-01-01"]].
+    """
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM events;")
-        rows = cur.fetchall()
-        conn.close()
-
-        events = [
-            {
-                "event_id": row[0],
-                "user_id": row[1],
-                "title": row[2],
-                "description": row[3],
-                "event_date": row[4],
-                "created_at": row[5]
-            } 
-            for row in rows
-        ]
-
-        return jsonify({"events": events})
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    
+        sort_by = json.loads(request.args.get("sort_by") or "[]")
+        filters = json.loads(request.args.get("filters") or "[]")
+    except ValueError:
+        raise ServiceError("sort_by and filters must be JSON lists")
+    return jsonify(services.getEventsTable(request.args.get("page", 0), request.args.get("page_size", 25),
+                                           sort_by, filters))
+
+EXPORT_ITERSIZE = 2000
+
+def _streamNdjson(name, query, params, row_type):
+    """Stream a query as newline-delimited JSON through a server-side cursor.
+
+    The named cursor pulls EXPORT_ITERSIZE rows per round trip and each batch is
+    written as one chunk, so memory stays flat however large the result is. The pooled connection is borrowed up front
+    (so a dead database still yields a proper error) and returned when the
+    response is closed, even if the client disconnects mid-stream.
+    """
+    stack = ExitStack()
+    conn = stack.enter_context(getConnection(readonly=True))
+
+    toRecords = rows.recordMapper(row_type)
+
+    def generate():
+        cur = conn.cursor(name=name)
+        try:
+            cur.execute(query, params)
+            while True:
+                batch = cur.fetchmany(EXPORT_ITERSIZE)
+                if not batch:
+                    break
+                yield b"".join(rows.dumps(record) + b"\n" for record in toRecords(batch))
+        except Exception as e:
+            # Headers are already sent; the last line tells the client the export is incomplete
+            yield rows.dumps({"error": f"Database error: {str(e)}"}) + b"\n"
+        finally:
+            cur.close()
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.call_on_close(stack.close)
+    return response
+
+@app.route("/export/events", methods=["GET"])
+def exportEvents():
+    return _streamNdjson(*services.exportEventsQuery())
+
+@app.route("/export/subscribers", methods=["GET"])
+def exportSubscribers():
+    # Optional event_id narrows the export to one event's subscribers
+    return _streamNdjson(*services.exportSubscribersQuery(request.args.get("event_id")))
 
 @app.route("/updateEvent", methods=["POST"])
 def updateEvent():
     data = request.get_json()
-    event_id = data.get("event_id")
-    title = data.get("title")
-    description = data.get("description")
-    event_date = data.get("event_date")
-
-    if not event_id:
-        return jsonify({"error": "Missing event_id"}), 400
+    result = services.updateEvent(data.get("event_id"), data.get("title"),
+                                  data.get("description"), data.get("event_date"))
+    return jsonify({"message": "Event updated and notifications queued.", **result})
 
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
-
-    try:
-        cur = conn.cursor()
-
-        # 1. Update the event
-        cur.execute("""
-            UPDATE events
-            SET title = %s, description = %s, event_date = %s
-            WHERE event_id = %s;
-        """, (title, description, event_date, event_id))
-
-        # 2. Get emails of subscribed users
-        cur.execute("""
-            SELECT u.email
-            FROM notifications n
-            JOIN users u ON n.user_id = u.user_id
-            WHERE n.event_id = %s;
-        """, (event_id,))
-        email_rows = cur.fetchall()
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        # 3. Send emails
-        for (email,) in email_rows:
-            subject = "Your Event Has Been Updated"
-            body = f"""
-                <p>Hello,</p>
-                <p>The event you are subscribed to has been updated:</p>
-                <ul>
-                    <li><strong>Title:</strong> {title}</li>
-                    <li><strong>Description:</strong> {description}</li>
-                    <li><strong>Date:</strong> {event_date}</li>
-                </ul>
-                <p>Visit your dashboard for more details.</p>
-            """
-            sendEmail(email, subject, body)
-
-        return jsonify({"message": "Event updated and notifications sent."})
-    except Exception as e:
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
+@app.route("/notificationStatus", methods=["GET"])
+def getNotificationStatus():
+    return jsonify(services.getNotificationStatus(request.args.get("job_id")))
 
 @app.route("/deleteEvent", methods=["POST"])
 def delete_event():
     data = request.get_json()
-    event_id = data.get("event_id")
-
-    if not event_id:
-        return jsonify({"error": "Missing event_id"}), 400
-
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
-
-    try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM events WHERE event_id = %s;", (event_id,))
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify({"message": "Event deleted successfully."})
-    except Exception as e:
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    services.deleteEvent(data.get("event_id"))
+    return jsonify({"message": "Event deleted successfully."})
 
 
 @app.route("/subscribeEvent", methods=["POST"])
 def subscribeEvent():
     data = request.get_json()
-    user_id = data.get("user_id")
-    event_id = data.get("event_id")
-    
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
-    
+    added = services.subscribeEvent(data.get("user_id"), data.get("event_id"))
+    return jsonify({"message": "Subscribed to event successfully!", "subscribed": int(added)})
+
+@app.route("/unsubscribeEvent", methods=["POST"])
+def unsubscribeEvent():
+    data = request.get_json()
+    removed = services.unsubscribeEvent(data.get("user_id"), data.get("event_id"))
+    return jsonify({"message": "Unsubscribed from event.", "unsubscribed": int(removed)})
+
+UNSUBSCRIBE_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>MeetEZ</title></head>
+<body style="font-family:sans-serif;max-width:32em;margin:3em auto">
+<h2>{heading}</h2>{body}
+</body></html>"""
+
+def unsubscribePage(heading, body, status=200):
+    return Response(UNSUBSCRIBE_PAGE.format(heading=heading, body=body), status=status, mimetype="text/html")
+
+@app.route("/unsubscribe", methods=["GET", "POST"])
+def unsubscribeLink():
+    """Target of the signed link in notification emails.
+
+    GET only asks for confirmation, since mail scanners follow links; POST (the form
+    below, or a mail client's one-click List-Unsubscribe) removes the subscription.
+    """
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO notifications (user_id, event_id)
-            VALUES (%s, %s);
-        """, (user_id, event_id))
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify({"message": "Subscribed to event successfully!"})
-    except Exception as e:
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
-    
+        user_id, event_id = services.checkUnsubscribeLink(
+            request.args.get("user_id"), request.args.get("event_id"), request.args.get("sig"))
+    except ServiceError as e:
+        return unsubscribePage("This link is not valid",
+                               "<p>Manage your subscriptions from the dashboard instead.</p>", e.status)
+    if request.method == "GET":
+        return unsubscribePage("Unsubscribe from this event?",
+                               '<p>You will stop getting emails when this event changes.</p>'
+                               '<form method="post"><button type="submit">Unsubscribe</button></form>')
+    services.unsubscribeEvent(user_id, event_id)
+    return unsubscribePage("You are unsubscribed",
+                           "<p>You will no longer get emails about this event.</p>")
+
+@app.route("/subscribeMany", methods=["POST"])
+def subscribeMany():
+    """Subscribe every user to every event: {"user_ids": [...] or "user_id", "event_ids": [...] or "event_id"}"""
+    data = request.get_json(silent=True) or {}
+    return jsonify(services.subscribeMany(data.get("user_ids", data.get("user_id")),
+                                          data.get("event_ids", data.get("event_id"))))
+
+@app.route("/unsubscribeMany", methods=["POST"])
+def unsubscribeMany():
+    """Same body as /subscribeMany; removes each (user, event) subscription that exists."""
+    data = request.get_json(silent=True) or {}
+    return jsonify(services.unsubscribeMany(data.get("user_ids", data.get("user_id")),
+                                            data.get("event_ids", data.get("event_id"))))
+
 @app.route("/getSubscribers", methods=["GET"])
 def getSubscribers():
     event_id = request.args.get("event_id")
-    if not event_id:
-        return jsonify({"error": "Missing event_id parameter"}), 400
+    return conditionalJSON(services.subscribersScopes(event_id),
+                           lambda version: services.getSubscribers(event_id, version=version))
 
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
+@app.route("/eventStats", methods=["GET"])
+def getEventStats():
+    """Top events by subscribers and upcoming events (or one event's count with ?event_id=)."""
+    return jsonify(services.getEventStats(request.args.get("limit", 10), request.args.get("event_id")))
 
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT u.user_id, u.name, u.email
-            FROM notifications n
-            JOIN users u ON n.user_id = u.user_id
-            WHERE n.event_id = %s;
-        """, (event_id,))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        subscribers = [{"user_id": r[0], "name": r[1], "email": r[2]} for r in rows]
-        return jsonify({"subscribers": subscribers})
-    except Exception as e:
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
+@app.route("/cacheStats", methods=["GET"])
+def getCacheStats():
+    # Query cache hit/miss/eviction counters
+    return jsonify(queryCache.stats())
 
 @app.route("/dbTestLocal", methods=["GET"])
 def dbTestLocal():
-    conn = connectDB()
-    if conn:
-        conn.close()
+    try:
+        with getConnection(write=False):
+            pass
         return jsonify({"message": "✅ Flask is able to connect to the database locally!"})
-    else:
+    except PoolError:
         return jsonify({"error": "❌ Flask cannot connect to the database!"}), 500
 
+@app.route("/poolStats", methods=["GET"])
+def getPoolStats():
+    # Connection pool saturation metrics (size, in_use, waiting, timeouts, ...)
+    return jsonify(poolStats())
+
+@app.route("/metrics", methods=["GET"])
+def getMetrics():
+    # Prometheus text format: request/stage/query timings, email latency, pool and cache state
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route("/addUser", methods=["POST"])
 def addUser():
     data = request.get_json()
-    name = data.get("name")
-    email = data.get("email")
+    user_id = services.addUser(data.get("name"), data.get("email"))
+    return jsonify({"message": "User added successfully", "user_id": user_id})
 
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
+@app.route("/addEvents", methods=["POST"])
+def addEvents():
+    """Batch addEvent: {"events": [{user_id, title, description, event_date}, ...]}"""
+    return jsonify(services.addEvents((request.get_json(silent=True) or {}).get("events")))
+
+@app.route("/addUsers", methods=["POST"])
+def addUsers():
+    """Batch addUser: {"users": [{name, email}, ...]}"""
+    return jsonify(services.addUsers((request.get_json(silent=True) or {}).get("users")))
+
+@app.route("/subscribeEvents", methods=["POST"])
+def subscribeEvents():
+    """Batch subscribeEvent: {"subscriptions": [{user_id, event_id}, ...]}"""
+    return jsonify(services.subscribeEvents((request.get_json(silent=True) or {}).get("subscriptions")))
 
-    try:
-        cur = conn.cursor()
-        cur.execute("INSERT INTO users (name, email) VALUES (%s, %s) RETURNING user_id;", (name, email))
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify({"message": "User added successfully", "user_id": user_id})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    
 @app.route("/getUserEvents", methods=["GET"])
 def getUserEvents():
+    """A user's events by date; see services.getUserEvents for from/to/upcoming/order/limit."""
     user_id = request.args.get("user_id")
-    if not user_id:
-        return jsonify({"error": "Missing user_id parameter"}), 400
-
-    conn = connectDB()
-    if not conn:
-        return jsonify({"error": "Failed to connect to database"}), 500
-
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT e.event_id, e.title, e.description, e.event_date, e.created_at
-            FROM notifications n
-            JOIN events e ON n.event_id = e.event_id
-            WHERE n.user_id = %s;
-        """, (user_id,))
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        events = [{
-            "event_id": r[0],
-            "title": r[1],
-            "description": r[2],
-            "event_date": str(r[3]),
-            "created_at": str(r[4])
-        } for r in rows]
-
-        return jsonify({"events": events})
-    except Exception as e:
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    return conditionalJSON(services.userEventsScopes(user_id), lambda version: services.getUserEvents(
+        user_id,
+        date_from=request.args.get("from"),
+        date_to=request.args.get("to"),
+        upcoming=request.args.get("upcoming", ""),
+        order=request.args.get("order", "asc"),
+        limit=request.args.get("limit"),
+        version=version,
+    ))
+
+@app.route("/calendar/<int:user_id>.ics", methods=["GET"])
+def getUserCalendar(user_id):
+    """iCalendar feed of a user's events for calendar clients to subscribe to."""
+    feed = services.getUserCalendar(user_id)
+    if httpcache.isFresh(request, feed["etag"], None):
+        response = Response(status=304)
+    else:
+        response = Response(feed["body"], mimetype="text/calendar")
+    return httpcache.stampResponse(response, feed["etag"], None)
+
+@app.route("/eventChanges", methods=["GET"])
+def eventChanges():
+    """Server-Sent Events stream of event changes; see changefeed.py.
+
+    Each open stream holds a worker for as long as it is open, so under sync
+    gunicorn workers keep streams to a few API clients. Dashboards only use it
+    when DASHBOARD_CHANGEFEED_URL points here (see dashboardUI.liveUpdateMeta).
+    """
+    subscription = changeFeed().subscribe()
+
+    def generate():
+        try:
+            yield changefeed.STREAM_START
+            while True:
+                message = subscription.get(changefeed.HEARTBEAT)
+                # The keepalive also surfaces a disconnected client, which ends the generator
+                yield changefeed.formatEvent(message) if message is not None else changefeed.KEEPALIVE
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers=changefeed.streamHeaders(request.headers.get("Origin")))
 
     
 # Import updated layout & callback function
-from dashboardUI import layout, register_callbacks
+from dashboardUI import layout, liveUpdateMeta, register_callbacks
 
 dash_app = Dash(
     __name__,
     server=app,
     url_base_pathname="/dashboard/",
-    suppress_callback_exceptions=True
+    suppress_callback_exceptions=True,
+    meta_tags=liveUpdateMeta(),
 )
 
 # Set layout & register callbacks
 dash_app.layout = layout
 register_callbacks(dash_app)
 
+# Each worker opens its pooled connections and drains the outbox from startup, not from its first request
+warmPools()
+startOutbox()
+
 if __name__ == "__main__":
     app.run(debug=False,host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,403 @@
+"""
+Asynchronous (ASGI) serving mode for the MeetEZ API.
+
+The Flask app in app.py ties up a gunicorn worker for every in-flight request
+while it waits on Postgres. This module serves the same core routes from a
+single asyncio event loop on top of psycopg 3's async connection pool, so one
+process can hold thousands of concurrent slow clients:
+
+    hypercorn asgi:app --bind 0.0.0.0:8000
+
+SQL, validation and payload building are shared with services.py, and so are
+the query cache and the notification outbox, so both modes return identical
+responses and can run side by side against the same database. The dashboard,
+bulk endpoints and NDJSON exports remain on the sync app.
+"""
+
+# asgi.py
+import asyncio
+import os
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from quart import Quart, Response, jsonify, request
+
+import changefeed
+import httpcache
+import metrics
+import rows
+import services
+from adapter import adapter, debounceSettings, startOutbox, wakeOutbox
+from cache import MISS, queryCache
+from outbox import JOB_COUNTS_SQL, JOB_SQL, enqueueNotificationAsync, summarizeJob
+from ratelimit import RateLimited, clientKeys, limiter
+from services import ServiceError
+
+app = Quart(__name__)
+app.json = rows.FastJSONProvider(app)
+app.url_map.strict_slashes = False
+
+pool = None
+
+
+@app.before_serving
+async def openPool():
+    global pool
+    # Secret lookups are blocking, so resolve them off the event loop
+    kwargs = await asyncio.to_thread(adapter.dbConnectArgs)
+    pool = AsyncConnectionPool(
+        kwargs=kwargs,
+        min_size=int(os.environ.get("DB_POOL_MIN", 1)),
+        max_size=int(os.environ.get("ASYNC_DB_POOL_MAX", 20)),
+        timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        max_idle=float(os.environ.get("DB_POOL_MAX_IDLE", 300)),
+        open=False,
+    )
+    await pool.open()
+    # Building the drainer (transport, secrets) blocks, so it starts off the event loop
+    await asyncio.to_thread(startOutbox)
+
+
+@app.after_serving
+async def closePool():
+    if pool is not None:
+        await pool.close()
+
+
+@app.before_request
+async def startTimer():
+    request.scope["meetez.started"] = metrics.beginRequest()
+
+
+@app.after_request
+async def recordTimings(response):
+    started = request.scope.pop("meetez.started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.endRequest(started, route, request.method, response.status_code)
+    return response
+
+
+@app.before_request
+async def admitRequest():
+    if request.url_rule is None:
+        return
+    route = request.url_rule.rule
+    # user_id in a request is unauthenticated, so clients are told apart by address alone
+    limiter.check(route, clientKeys(request.access_route, request.remote_addr))
+    request.scope["meetez.admitted"] = limiter.admit(route)
+
+
+@app.after_request
+async def releaseSlot(response):
+    if request.scope.pop("meetez.admitted", False):
+        limiter.leave()
+    return response
+
+
+@app.teardown_request
+async def releaseSlotOnError(exc):
+    if request.scope.pop("meetez.admitted", False):
+        limiter.leave()
+
+
+@app.after_request
+async def compressResponse(response):
+    if httpcache.compressible(response):
+        response.vary.add("Accept-Encoding")
+        compressed = httpcache.compressBody(request, await response.get_data())
+        if compressed:
+            response.set_data(compressed[0])
+            response.headers["Content-Encoding"] = compressed[1]
+    return response
+
+
+@app.errorhandler(ServiceError)
+async def serviceError(e):
+    return jsonify({"error": str(e)}), e.status
+
+
+@app.errorhandler(RateLimited)
+async def rateLimited(e):
+    return jsonify({"error": str(e)}), e.status, {"Retry-After": str(e.retry_after)}
+
+
+@app.errorhandler(PoolTimeout)
+async def poolUnavailable(e):
+    return jsonify({"error": f"Failed to connect to database: {str(e)}"}), 503
+
+
+@app.errorhandler(psycopg.Error)
+async def databaseError(e):
+    return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+
+async def fetchAll(sql, params):
+    async with pool.connection() as conn:
+        with metrics.timeStage("sql"):
+            cur = await conn.execute(sql, params)
+            return await cur.fetchall()
+
+
+async def cached(key, load, tags):
+    """Async counterpart of QueryCache.getOrLoad."""
+    value = queryCache.lookup(key)
+    if value is MISS:
+        since = queryCache.epoch()
+        value = await load()
+        queryCache.store(key, value, tags, since=since)
+    return value
+
+
+async def conditionalJSON(scopes, build):
+    """Async counterpart of app.conditionalJSON; ``build`` is a coroutine function taking the ETag."""
+    etag, modified = services.versionStamp(scopes, await fetchAll(services.DATA_VERSION_SQL, (list(scopes),)))
+    if httpcache.isFresh(request, etag, modified):
+        response = Response(status=304)
+    else:
+        response = jsonify(await build(etag))
+    return httpcache.stampResponse(response, etag, modified)
+
+
+@app.route("/")
+async def home():
+    return jsonify({"message": "Async MeetEZ API is Running!"})
+
+
+@app.route("/poolStats", methods=["GET"])
+async def getPoolStats():
+    return jsonify(pool.get_stats())
+
+
+@app.route("/metrics", methods=["GET"])
+async def getMetrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/addEvent", methods=["POST"])
+async def addEvent():
+    data = await request.get_json()
+    async with pool.connection() as conn:
+        cur = await conn.execute(services.INSERT_EVENT_SQL, (data.get("user_id"), data.get("title"),
+                                                             data.get("description"), data.get("event_date")))
+        event_id = (await cur.fetchone())[0]
+    queryCache.invalidate("events")
+    return jsonify({"message": "Event added successfully!", "event_id": event_id})
+
+
+@app.route("/getEvents", methods=["GET"])
+async def getEvents():
+    key, sql, params, limit = services.eventsQuery(
+        limit=request.args.get("limit", services.DEFAULT_PAGE_SIZE),
+        cursor=request.args.get("cursor"),
+        date_from=request.args.get("from"),
+        date_to=request.args.get("to"),
+        user_id=request.args.get("user_id"),
+    )
+
+    async def load():
+        return services.eventsPage(await fetchAll(sql, params), limit)
+
+    return await conditionalJSON(services.eventsScopes(),
+                                 lambda version: cached(services.versionedKey(key, version), load, ("events",)))
+
+
+@app.route("/searchEvents", methods=["GET"])
+async def searchEvents():
+    key, sql, params, limit = services.searchQuery(
+        request.args.get("q"),
+        limit=request.args.get("limit", services.SEARCH_PAGE_SIZE),
+        cursor=request.args.get("cursor"),
+    )
+
+    async def load():
+        return services.searchPage(await fetchAll(sql, params), limit)
+
+    return await conditionalJSON(services.eventsScopes(),
+                                 lambda version: cached(services.versionedKey(key, version), load, ("events",)))
+
+
+@app.route("/updateEvent", methods=["POST"])
+async def updateEvent():
+    data = await request.get_json()
+    event_id, title = data.get("event_id"), data.get("title")
+    description, event_date = data.get("description"), data.get("event_date")
+    if not event_id:
+        raise ServiceError("Missing event_id")
+
+    message = services.updateNotification(title, description, event_date)
+    debounce, max_wait = debounceSettings()
+    # pool.connection() commits on a clean exit, so the UPDATE and outbox rows land together
+    async with pool.connection() as conn:
+        cur = await conn.execute(services.UPDATE_EVENT_SQL, (title, description, event_date, event_id))
+        if cur.rowcount == 0:
+            raise ServiceError("Event not found", 404)  # rolls back as the block exits
+        job_id, recipients = await enqueueNotificationAsync(conn, event_id, message, debounce, max_wait)
+    queryCache.invalidate("events", f"event:{event_id}")
+    await asyncio.to_thread(wakeOutbox)
+    return jsonify({"message": "Event updated and notifications queued.",
+                    "job_id": job_id, "recipients": recipients})
+
+
+@app.route("/notificationStatus", methods=["GET"])
+async def getNotificationStatus():
+    job_id = request.args.get("job_id")
+    if not job_id:
+        raise ServiceError("Missing job_id parameter")
+    async with pool.connection() as conn:
+        job = await (await conn.execute(JOB_SQL, (job_id,))).fetchone()
+        if job is None:
+            raise ServiceError("Unknown notification job", 404)
+        counts = dict(await (await conn.execute(JOB_COUNTS_SQL, (job_id,))).fetchall())
+    return jsonify(summarizeJob(job_id, job, counts))
+
+
+@app.route("/deleteEvent", methods=["POST"])
+async def deleteEvent():
+    event_id = (await request.get_json()).get("event_id")
+    if not event_id:
+        raise ServiceError("Missing event_id")
+    async with pool.connection() as conn:
+        await conn.execute(services.DELETE_EVENT_SQL, (event_id,))
+    queryCache.invalidate("events", f"event:{event_id}", f"event:{event_id}:subscribers")
+    return jsonify({"message": "Event deleted successfully."})
+
+
+@app.route("/subscribeEvent", methods=["POST"])
+async def subscribeEvent():
+    data = await request.get_json()
+    user_id, event_id = data.get("user_id"), data.get("event_id")
+    async with pool.connection() as conn:
+        added = (await conn.execute(services.SUBSCRIBE_SQL, (user_id, event_id))).rowcount > 0
+    queryCache.invalidate(f"event:{event_id}:subscribers", f"user:{user_id}:events", "stats")
+    return jsonify({"message": "Subscribed to event successfully!", "subscribed": int(added)})
+
+
+@app.route("/unsubscribeEvent", methods=["POST"])
+async def unsubscribeEvent():
+    data = await request.get_json()
+    user_id, event_id = data.get("user_id"), data.get("event_id")
+    if not user_id or not event_id:
+        raise ServiceError("Missing user_id or event_id")
+    async with pool.connection() as conn:
+        removed = (await conn.execute(services.UNSUBSCRIBE_SQL, (user_id, event_id))).rowcount > 0
+    queryCache.invalidate(f"event:{event_id}:subscribers", f"user:{user_id}:events", "stats")
+    return jsonify({"message": "Unsubscribed from event.", "unsubscribed": int(removed)})
+
+
+async def subscriptionSetRequest():
+    data = await request.get_json(silent=True) or {}
+    return services.subscriptionSet(data.get("user_ids", data.get("user_id")),
+                                    data.get("event_ids", data.get("event_id")))
+
+
+@app.route("/subscribeMany", methods=["POST"])
+async def subscribeMany():
+    params = await subscriptionSetRequest()
+    async with pool.connection() as conn:
+        changed, missing_users, missing_events = await (
+            await conn.execute(services.SUBSCRIBE_SET_SQL, params)).fetchone()
+    services.invalidateSubscriptions(params)
+    return jsonify(services.subscriptionSetResult(params, changed, missing_users, missing_events))
+
+
+@app.route("/unsubscribeMany", methods=["POST"])
+async def unsubscribeMany():
+    params = await subscriptionSetRequest()
+    async with pool.connection() as conn:
+        changed = (await (await conn.execute(services.UNSUBSCRIBE_SET_SQL, params)).fetchone())[0]
+    services.invalidateSubscriptions(params)
+    return jsonify(services.subscriptionSetResult(params, changed, subscribe=False))
+
+
+@app.route("/getSubscribers", methods=["GET"])
+async def getSubscribers():
+    event_id = request.args.get("event_id")
+    scopes = services.subscribersScopes(event_id)
+
+    async def load():
+        return services.subscribersPayload(await fetchAll(services.SUBSCRIBERS_SQL, (event_id,)))
+
+    return await conditionalJSON(scopes, lambda version: cached(
+        services.versionedKey(f"subscribers:{event_id}", version), load, (f"event:{event_id}:subscribers",)))
+
+
+@app.route("/eventStats", methods=["GET"])
+async def getEventStats():
+    event_id = request.args.get("event_id")
+    if event_id:
+        async def loadOne():
+            found = await fetchAll(services.EVENT_STATS_SQL, (event_id,))
+            if not found:
+                raise ServiceError("Unknown event", 404)
+            return services.statsRecord(found[0])
+
+        return jsonify(await cached(f"eventStats:{event_id}", loadOne, (f"event:{event_id}:subscribers", "events")))
+
+    limit = services.statsLimit(request.args.get("limit", 10))
+
+    async def load():
+        return services.eventStatsPayload(await fetchAll(services.TOP_EVENTS_SQL, (limit,)),
+                                          await fetchAll(services.UPCOMING_EVENTS_SQL, (limit,)))
+
+    return jsonify(await cached(f"eventStats:top:{limit}", load, ("events", "stats")))
+
+
+@app.route("/addUser", methods=["POST"])
+async def addUser():
+    data = await request.get_json()
+    async with pool.connection() as conn:
+        cur = await conn.execute(services.INSERT_USER_SQL, (data.get("name"), data.get("email")))
+        user_id = (await cur.fetchone())[0]
+    return jsonify({"message": "User added successfully", "user_id": user_id})
+
+
+@app.route("/getUserEvents", methods=["GET"])
+async def getUserEvents():
+    user_id = request.args.get("user_id")
+    scopes = services.userEventsScopes(user_id)
+    key, sql, params, tags = services.userEventsQuery(
+        user_id,
+        date_from=request.args.get("from"),
+        date_to=request.args.get("to"),
+        upcoming=request.args.get("upcoming", ""),
+        order=request.args.get("order", "asc"),
+        limit=request.args.get("limit"),
+    )
+
+    async def load():
+        return services.userEventsPayload(await fetchAll(sql, params))
+
+    return await conditionalJSON(scopes, lambda version: cached(services.versionedKey(key, version), load, tags))
+
+
+@app.route("/calendar/<int:user_id>.ics", methods=["GET"])
+async def getUserCalendar(user_id):
+    async def load():
+        return services.calendarPayload(await fetchAll(services.CALENDAR_SQL, (user_id,)))
+
+    feed = await cached(f"calendar:{user_id}", load, services.calendarTags(user_id))
+    if httpcache.isFresh(request, feed["etag"], None):
+        response = Response(status=304)
+    else:
+        response = Response(feed["body"], mimetype="text/calendar")
+    return httpcache.stampResponse(response, feed["etag"], None)
+
+
+@app.route("/eventChanges", methods=["GET"])
+async def eventChanges():
+    subscription = adapter.changeFeed.subscribeAsync(asyncio.get_running_loop())
+
+    async def generate():
+        try:
+            yield changefeed.STREAM_START
+            while True:
+                message = await subscription.get(changefeed.HEARTBEAT)
+                yield changefeed.formatEvent(message) if message is not None else changefeed.KEEPALIVE
+        finally:
+            subscription.close()
+
+    response = Response(generate(), mimetype="text/event-stream",
+                        headers=changefeed.streamHeaders(request.headers.get("Origin")))
+    response.timeout = None  # streams stay open past Quart's RESPONSE_TIMEOUT
+    return response
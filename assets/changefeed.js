@@ -0,0 +1,68 @@
+// Live refresh for the dashboard. With DASHBOARD_CHANGEFEED_URL set it listens to that
+// Server-Sent Events stream; otherwise it polls /getEvents every DASHBOARD_POLL_SECONDS and
+// presses the current page's refresh control when the events' ETag changes (the poll is a
+// cheap 304 revalidation while nothing changes). The settings arrive as <meta> tags.
+(function () {
+    function setting(name) {
+        var meta = document.querySelector('meta[name="' + name + '"]');
+        return meta ? meta.getAttribute("content") : "";
+    }
+
+    // Controls that reload each page's data; only those on the current page exist
+    var TARGETS = ["events-changed", "refresh-stats-btn"];
+    var DEBOUNCE_MS = 500;
+    var POLL_URL = "/getEvents?limit=1";
+    var timer = null;
+
+    function refresh() {
+        // Coalesce bursts (several edits, a bulk import) into one reload
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            TARGETS.forEach(function (id) {
+                var target = document.getElementById(id);
+                if (target) {
+                    target.click();
+                }
+            });
+        }, DEBOUNCE_MS);
+    }
+
+    function listen(url) {
+        var opened = false;
+        var source = new EventSource(url);
+        source.addEventListener("change", refresh);
+        source.addEventListener("resync", refresh);
+        source.addEventListener("open", function () {
+            // Changes made while the stream was down were missed, so reload after a reconnect
+            if (opened) {
+                refresh();
+            }
+            opened = true;
+        });
+    }
+
+    function poll(seconds) {
+        var etag = null;
+        setInterval(function () {
+            if (document.hidden) {
+                return;
+            }
+            // no-cache makes the browser revalidate its copy with If-None-Match
+            fetch(POLL_URL, {cache: "no-cache", credentials: "same-origin"}).then(function (response) {
+                var current = response.headers.get("ETag");
+                if (etag !== null && current && current !== etag) {
+                    refresh();
+                }
+                etag = current || etag;
+            }).catch(function () {});
+        }, seconds * 1000);
+    }
+
+    var url = setting("meetez-changefeed-url");
+    var seconds = parseFloat(setting("meetez-poll-seconds"));
+    if (url && window.EventSource) {
+        listen(url);
+    } else if (seconds > 0 && window.fetch) {
+        poll(seconds);
+    }
+})();
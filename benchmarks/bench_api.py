@@ -0,0 +1,253 @@
+"""
+Throughput and latency benchmark for every MeetEZ API route.
+
+Loads a synthetic data set (see datagen.py), then runs one scripted workload
+per route and reports requests/s and p50/p95/p99 latency. By default requests
+go through Flask's test client in-process; ``--url`` targets a running server
+(gunicorn, or hypercorn for the routes asgi.py serves) instead.
+
+Emails always go to the fake transport. The database is whatever the usual
+SECRETS_* / DB_* settings point at; ``--embedded DIR`` starts a throwaway
+local Postgres with the optional ``pgserver`` package instead. (SQLite is not
+offered as a stand-in: the routes rely on Postgres-only SQL such as
+``RETURNING``, ``ON CONFLICT``, ``SKIP LOCKED`` and advisory locks.)
+
+``--rounds`` grows the tables by the base data set before each round, which
+shows how latency degrades with size. ``--json`` saves the results and
+``--baseline`` compares p95 against an earlier run, exiting non-zero on a
+regression:
+
+    python benchmarks/bench_api.py --embedded /tmp/meetez-bench --rounds 3 --json base.json
+    python benchmarks/bench_api.py --embedded /tmp/meetez-bench --baseline base.json
+"""
+
+# benchmarks/bench_api.py
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+
+from loadgen import HttpDriver, InProcessDriver, printTable, runWorkload
+
+
+class Workload:
+    """A named request generator; ``observe`` sees each JSON response (e.g. to collect ids)."""
+    def __init__(self, name, pick, requests=None, observe=None):
+        self.name = name
+        self.pick = pick
+        self.requests = requests
+        self.observe = observe
+
+
+class Context:
+    """Ids the workloads draw from, shared between threads and rounds."""
+    def __init__(self, skew, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.skew = skew
+        self.user_ids = []
+        self.event_ids = []
+        self.weights = []
+        self.created_events = []
+        self.job_ids = []
+
+    def extend(self, data):
+        from datagen import zipfWeights
+        with self.lock:
+            self.user_ids += data["user_ids"]
+            self.event_ids += data["event_ids"]
+            self.weights = zipfWeights(len(self.event_ids), self.skew)
+
+    def user(self):
+        with self.lock:
+            return self.rng.choice(self.user_ids)
+
+    def event(self):
+        with self.lock:
+            return self.rng.choice(self.event_ids)
+
+    def hotEvent(self):
+        """An event drawn by popularity, so hot events dominate like real traffic."""
+        with self.lock:
+            return self.rng.choices(self.event_ids, cum_weights=self.weights)[0]
+
+    def date(self):
+        with self.lock:
+            return datetime.date.today() + datetime.timedelta(days=self.rng.randrange(-365, 365))
+
+    def pop(self, items):
+        with self.lock:
+            return items.pop() if items else None
+
+    def push(self, items, value):
+        if value is not None:
+            with self.lock:
+                items.append(value)
+
+
+def workloads(ctx, n):
+    """One workload per route, in an order where writes feed later reads."""
+    def eventBody(i=None):
+        return {"user_id": ctx.user(), "title": f"Bench {i or ''}".strip(),
+                "description": "benchmark", "event_date": str(ctx.date())}
+
+    def updateBody():
+        body = eventBody()
+        body["event_id"] = ctx.hotEvent()
+        return body
+
+    def dateRange():
+        start = ctx.date()
+        return f"/getEvents?limit=100&from={start}&to={start + datetime.timedelta(days=30)}"
+
+    return [
+        Workload("home", lambda: ("GET", "/", None)),
+        Workload("getEvents", lambda: ("GET", "/getEvents?limit=100", None)),
+        Workload("getEvents:range", lambda: ("GET", dateRange(), None)),
+        Workload("getEvents:user", lambda: ("GET", f"/getEvents?limit=100&user_id={ctx.user()}", None)),
+        # Titles are "Bench Event <i>", so a number prefix is selective and "bench" matches every event
+        Workload("searchEvents", lambda: ("GET", f"/searchEvents?q=event {ctx.event() % 1000}", None)),
+        Workload("searchEvents:broad", lambda: ("GET", "/searchEvents?q=bench", None)),
+        Workload("getSubscribers", lambda: ("GET", f"/getSubscribers?event_id={ctx.hotEvent()}", None)),
+        Workload("getUserEvents", lambda: ("GET", f"/getUserEvents?user_id={ctx.user()}", None)),
+        Workload("addUser", lambda: ("POST", "/addUser", {"name": "Bench", "email": f"bench-{os.urandom(6).hex()}@example.com"})),
+        Workload("addEvent", lambda: ("POST", "/addEvent", eventBody()),
+                 observe=lambda p: ctx.push(ctx.created_events, p.get("event_id"))),
+        Workload("subscribeEvent", lambda: ("POST", "/subscribeEvent", {"user_id": ctx.user(), "event_id": ctx.hotEvent()})),
+        Workload("updateEvent", lambda: ("POST", "/updateEvent", updateBody()),
+                 observe=lambda p: ctx.push(ctx.job_ids, p.get("job_id"))),
+        Workload("notificationStatus", lambda: ("GET", f"/notificationStatus?job_id={ctx.pop(ctx.job_ids) or 'none'}", None),
+                 requests=max(1, n // 10)),
+        Workload("deleteEvent", lambda: ("POST", "/deleteEvent", {"event_id": ctx.pop(ctx.created_events) or 0})),
+        Workload("addUsers", lambda: ("POST", "/addUsers", {"users": [
+            {"name": "Bench", "email": f"bench-{os.urandom(6).hex()}@example.com"} for _ in range(100)]}),
+                 requests=max(1, n // 10)),
+        Workload("addEvents", lambda: ("POST", "/addEvents", {"events": [eventBody(i) for i in range(100)]}),
+                 requests=max(1, n // 10)),
+        Workload("subscribeEvents", lambda: ("POST", "/subscribeEvents", {"subscriptions": [
+            {"user_id": ctx.user(), "event_id": ctx.hotEvent()} for _ in range(100)]}),
+                 requests=max(1, n // 10)),
+        Workload("subscribeMany", lambda: ("POST", "/subscribeMany", {
+            "user_ids": [ctx.user() for _ in range(10)], "event_ids": [ctx.hotEvent() for _ in range(10)]}),
+                 requests=max(1, n // 10)),
+        Workload("unsubscribeEvent", lambda: ("POST", "/unsubscribeEvent", {"user_id": ctx.user(), "event_id": ctx.hotEvent()})),
+        Workload("export:events", lambda: ("GET", "/export/events", None), requests=3),
+        Workload("export:subscribers", lambda: ("GET", f"/export/subscribers?event_id={ctx.hotEvent()}", None),
+                 requests=max(1, n // 10)),
+        Workload("poolStats", lambda: ("GET", "/poolStats", None)),
+        Workload("cacheStats", lambda: ("GET", "/cacheStats", None)),
+    ]
+
+
+def startEmbedded(directory):
+    """Start a local Postgres in ``directory`` and point the adapter at it."""
+    import pgserver
+    server = pgserver.get_server(directory)
+    os.environ.update(SECRETS_PROVIDER="env", SECRETS_PREFETCH="0", DB_HOST=directory,
+                      DB_NAME="postgres", DB_USER="postgres", DB_PASSWORD="unused")
+    return server
+
+
+def compare(results, baseline, tolerance):
+    """Workloads whose p95 grew by more than ``tolerance`` (a fraction) over the baseline."""
+    regressions = []
+    for name, r in results.items():
+        before = baseline.get(name)
+        if before and before["p95_ms"] > 0 and r["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append((name, before["p95_ms"], r["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MeetEZ API routes")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--embedded", metavar="DIR", help="run against a throwaway Postgres (needs pgserver)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--subscriptions", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for event popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rounds", type=int, default=1, help="grow the data set and re-run this many times")
+    parser.add_argument("--requests", type=int, default=500, help="requests per workload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", help="comma-separated workload names to run")
+    parser.add_argument("--no-cache", action="store_true", help="disable the read cache (in-process only)")
+    parser.add_argument("--reset", action="store_true", help="truncate all MeetEZ tables before loading")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    server = startEmbedded(args.embedded) if args.embedded else None
+    os.environ.setdefault("EMAIL_TRANSPORT", "fake")
+    # One client hammering every route would otherwise just measure the rate limiter
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+    os.environ.setdefault("MAX_EXPENSIVE_REQUESTS", "0")
+    if args.no_cache:
+        os.environ["CACHE_BACKEND"] = "none"
+
+    # Imported only now so the settings above are in place when the app builds its singletons
+    from adapter import createSchema, getConnection
+    from datagen import generate, resetData, tableSizes
+
+    if args.url:
+        send = HttpDriver(args.url)
+    else:
+        from app import app
+        send = InProcessDriver(app)
+
+    createSchema()
+    ctx = Context(args.skew, args.seed)
+    only = set(args.only.split(",")) if args.only else None
+    report = {"config": vars(args), "rounds": []}
+
+    for round_no in range(args.rounds):
+        with getConnection() as conn:
+            if args.reset and round_no == 0:
+                resetData(conn)
+            ctx.extend(generate(conn, args.users, args.events, args.subscriptions, args.skew, args.seed + round_no))
+            sizes = tableSizes(conn)
+        print(f"\nRound {round_no + 1}: " + ", ".join(f"{table}={count}" for table, count in sizes.items()))
+
+        results = {}
+        for w in workloads(ctx, args.requests):
+            if only and w.name not in only:
+                continue
+
+            def observed(method, path, body, w=w):
+                status, payload = send(method, path, body, parse=w.observe is not None)
+                if w.observe and isinstance(payload, dict):
+                    w.observe(payload)
+                return status
+
+            results[w.name] = runWorkload(observed, w.pick, args.concurrency, requests=w.requests or args.requests)
+        printTable(results)
+        report["rounds"].append({"sizes": sizes, "results": results})
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["rounds"][-1]["results"]
+        regressions = compare(report["rounds"][-1]["results"], baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: p95 {before} ms -> {after} ms")
+        if regressions:
+            status = 1
+        else:
+            print(f"\nNo p95 regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+    if server is not None:
+        server.cleanup()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Concurrency check for the bulk subscription writes.
+
+Loads a small data set where every batch touches the same few events, then
+sends overlapping ``POST /subscribeEvents`` batches (and some
+``POST /unsubscribeMany`` calls) from ``--concurrency`` threads, rows in random
+order as clients send them. Overlapping batches must neither deadlock nor come
+back with per-row errors, and ``events.subscriber_count`` must still match the
+subscriptions afterwards; the script exits non-zero if any of that fails:
+
+    python benchmarks/bench_bulk.py --embedded /tmp/meetez-bench --concurrency 4 --batches 20
+"""
+
+# benchmarks/bench_bulk.py
+import argparse
+import os
+import random
+import sys
+import threading
+
+from bench_api import startEmbedded
+from loadgen import InProcessDriver, printTable, runWorkload
+
+DEADLOCKS_SQL = "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database();"
+COUNT_DRIFT_SQL = """
+    SELECT COUNT(*) FROM events e
+    WHERE e.event_id = ANY(%s)
+      AND e.subscriber_count <> (SELECT COUNT(*) FROM notifications n WHERE n.event_id = e.event_id);
+"""
+
+
+def deadlocks(conn):
+    cur = conn.cursor()
+    # Stats of other backends are read from a snapshot; take a fresh one
+    cur.execute("SELECT pg_stat_clear_snapshot();")
+    cur.execute(DEADLOCKS_SQL)
+    count = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check overlapping bulk subscribes for deadlocks")
+    parser.add_argument("--embedded", metavar="DIR", help="run against a throwaway Postgres (needs pgserver)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--events", type=int, default=50, help="few events, so batches overlap")
+    parser.add_argument("--rows", type=int, default=100, help="subscriptions per batch")
+    parser.add_argument("--batches", type=int, default=20, help="batches in total")
+    parser.add_argument("--unsubscribe", type=float, default=0.2, help="fraction of calls that unsubscribe")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = startEmbedded(args.embedded) if args.embedded else None
+    os.environ.setdefault("EMAIL_TRANSPORT", "fake")
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "none")
+
+    # Imported only now so the settings above are in place when the app builds its singletons
+    from adapter import createSchema, getConnection
+    from app import app
+    from datagen import generate
+
+    createSchema()
+    with getConnection() as conn:
+        data = generate(conn, args.users, args.events, 0, seed=args.seed)
+        before = deadlocks(conn)
+    user_ids, event_ids = data["user_ids"], data["event_ids"]
+
+    rng = random.Random(args.seed)
+    rng_lock = threading.Lock()
+    row_errors = []
+
+    def pick():
+        with rng_lock:
+            if rng.random() < args.unsubscribe:
+                return "POST", "/unsubscribeMany", {"user_ids": rng.sample(user_ids, 5),
+                                                    "event_ids": rng.sample(event_ids, 5)}
+            return "POST", "/subscribeEvents", {"subscriptions": [
+                {"user_id": rng.choice(user_ids), "event_id": rng.choice(event_ids)} for _ in range(args.rows)]}
+
+    send = InProcessDriver(app)
+
+    def observed(method, path, body):
+        status, payload = send(method, path, body, parse=True)
+        if isinstance(payload, dict) and payload.get("errors"):
+            row_errors.extend(payload["errors"])
+        return status
+
+    results = {"subscribeEvents": runWorkload(observed, pick, args.concurrency, requests=args.batches)}
+    printTable(results, label="batches")
+
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(COUNT_DRIFT_SQL, (event_ids,))
+        drift = cur.fetchone()[0]
+        cur.close()
+        found = deadlocks(conn) - before
+
+    print(f"\ndeadlocks: {found}, row errors: {len(row_errors)}, events with a wrong subscriber_count: {drift}")
+    for error in row_errors[:5]:
+        print(f"  row {error['index']}: {error['error']}")
+
+    if server is not None:
+        server.cleanup()
+    sys.exit(1 if found or row_errors or drift or results["subscribeEvents"]["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
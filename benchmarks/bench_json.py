@@ -0,0 +1,86 @@
+"""
+Microbenchmark of the read endpoints' row mapping and JSON encoding.
+
+Compares the previous path (a dict built by positional index per row, then
+Flask's default jsonify) with rows.py's compiled record mappers and its
+encoders, on synthetic rows shaped like each endpoint's query. No database or
+server is needed:
+
+    python benchmarks/bench_json.py --rows 5000
+"""
+
+# benchmarks/bench_json.py
+import argparse
+import datetime
+import timeit
+
+import loadgen  # noqa: F401  (puts the app modules on sys.path)
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import rows
+
+
+def sampleRows(n):
+    today = datetime.date.today()
+    created = datetime.datetime.now().replace(microsecond=0)
+    events = [(i, i % 97, f"Event {i}", "Monthly meetup for the local chapter " * 2,
+               today + datetime.timedelta(days=i % 365), created) for i in range(n)]
+    return {
+        "getEvents": (rows.EventRow, events),
+        "getUserEvents": (rows.UserEventRow, [(e[0], e[2], e[3], e[4], e[5]) for e in events]),
+        "getSubscribers": (rows.SubscriberRow, [(i, f"User {i}", f"user{i}@example.com") for i in range(n)]),
+    }
+
+
+# The mappings services.py used before rows.py, kept here as the baseline
+def legacyMapping(name, data):
+    if name == "getEvents":
+        return {"events": [{"event_id": r[0], "user_id": r[1], "title": r[2], "description": r[3],
+                            "event_date": r[4], "created_at": r[5]} for r in data]}
+    if name == "getUserEvents":
+        return {"events": [{"event_id": r[0], "title": r[1], "description": r[2],
+                            "event_date": str(r[3]), "created_at": str(r[4])} for r in data]}
+    return {"subscribers": [{"user_id": r[0], "name": r[1], "email": r[2]} for r in data]}
+
+
+def timed(fn, repeat):
+    """Best-of-``repeat`` milliseconds for one call."""
+    return min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row mapping and JSON encoding")
+    parser.add_argument("--rows", type=int, default=5000, help="rows per payload")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    flaskJson = DefaultJSONProvider(Flask("bench"))
+    encoders = {"stdlib": rows._stdlibDumps}
+    if rows.orjson is not None:
+        encoders["orjson"] = rows._orjsonDumps
+    else:
+        print("orjson is not installed; only the stdlib encoder is measured")
+
+    print(f"{'endpoint':<15} {'path':<18} {'map ms':>8} {'encode ms':>10} {'total ms':>9} {'speedup':>8}")
+    for name, (row_type, data) in sampleRows(args.rows).items():
+        key = "subscribers" if row_type is rows.SubscriberRow else "events"
+        mapper = rows.recordMapper(row_type)
+
+        legacy = legacyMapping(name, data)
+        mapMs = timed(lambda: legacyMapping(name, data), args.repeat)
+        encodeMs = timed(lambda: flaskJson.dumps(legacy, separators=(",", ":")), args.repeat)
+        baseline = mapMs + encodeMs
+        print(f"{name:<15} {'legacy + flask':<18} {mapMs:>8.2f} {encodeMs:>10.2f} {baseline:>9.2f} {1:>7.1f}x")
+
+        payload = {key: mapper(data)}
+        mapMs = timed(lambda: {key: mapper(data)}, args.repeat)
+        for label, encode in encoders.items():
+            encodeMs = timed(lambda: encode(payload), args.repeat)
+            total = mapMs + encodeMs
+            print(f"{'':<15} {'rows + ' + label:<18} {mapMs:>8.2f} {encodeMs:>10.2f} {total:>9.2f} "
+                  f"{baseline / total:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
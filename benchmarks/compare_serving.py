@@ -0,0 +1,149 @@
+"""
+Compare the sync (gunicorn + Flask) and async (hypercorn + Quart) serving modes.
+
+Start both servers against the same database with rate limiting off, e.g.
+
+    export RATE_LIMIT_BACKEND=none MAX_EXPENSIVE_REQUESTS=0
+    gunicorn -w 4 -b 127.0.0.1:8000 app:app
+    hypercorn -b 127.0.0.1:8001 asgi:app
+
+then run
+
+    python benchmarks/compare_serving.py --sync http://127.0.0.1:8000 \\
+        --async http://127.0.0.1:8001 --concurrency 200 --duration 20
+
+Each run drives the same read-heavy route mix with ``--concurrency``
+keep-alive clients and prints throughput, error count and p50/p95/p99
+latency. The load generator is plain asyncio sockets, so it needs no extra packages.
+"""
+
+# benchmarks/compare_serving.py
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from loadgen import printTable, summarize
+
+
+class Client:
+    """A single HTTP/1.1 keep-alive connection."""
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n")
+        self.writer.write(head.encode() + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            name, value = name.lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding" and "chunked" in value:
+                chunked = True
+            elif name == "connection" and value == "close":
+                close = True
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def routeMix(event_ids, user_ids):
+    """Weighted (method, path, body) picker mirroring dashboard traffic."""
+    def pick():
+        roll = random.random()
+        if roll < 0.45:
+            return "GET", "/getEvents?limit=50", None
+        if roll < 0.70:
+            return "GET", f"/getSubscribers?event_id={random.choice(event_ids)}", None
+        if roll < 0.90:
+            return "GET", f"/getUserEvents?user_id={random.choice(user_ids)}", None
+        if roll < 0.97:
+            return "POST", "/subscribeEvent", {"user_id": random.choice(user_ids),
+                                               "event_id": random.choice(event_ids)}
+        return "GET", "/", None
+    return pick
+
+
+async def run(base_url, concurrency, duration, pick):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        client = Client(host, port)
+        while time.perf_counter() < deadline:
+            method, path, body = pick()
+            started = time.perf_counter()
+            try:
+                status = await client.request(method, path, body)
+            except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+                client.close()
+                errors += 1
+                continue
+            if status >= 400:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+        client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async MeetEZ serving modes")
+    parser.add_argument("--sync", dest="sync_url", help="base URL of the gunicorn/Flask server")
+    parser.add_argument("--async", dest="async_url", help="base URL of the hypercorn/Quart server")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--events", type=int, default=100, help="event ids 1..N to sample from")
+    parser.add_argument("--users", type=int, default=100, help="user ids 1..N to sample from")
+    args = parser.parse_args()
+
+    targets = [(name, url) for name, url in (("sync", args.sync_url), ("async", args.async_url)) if url]
+    if not targets:
+        parser.error("pass --sync and/or --async")
+
+    pick = routeMix(list(range(1, args.events + 1)), list(range(1, args.users + 1)))
+    results = {}
+    for name, url in targets:
+        results[name] = asyncio.run(run(url, args.concurrency, args.duration, pick))
+    printTable(results, label="mode")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Synthetic MeetEZ data for benchmarks.
+
+Creates N users, M events spread over a two-year window and S subscriptions
+whose event popularity follows a Zipf distribution (``--skew``), so a few hot
+events carry most of the subscribers the way real sign-ups do. Rows are
+loaded with multi-row INSERTs, and the same ``--seed`` always yields the same
+data.
+
+    python benchmarks/datagen.py --users 10000 --events 50000 --subscriptions 500000 --reset
+"""
+
+# benchmarks/datagen.py
+import argparse
+import datetime
+import itertools
+import os
+import random
+
+import loadgen  # noqa: F401  (puts the repo root on sys.path)
+from psycopg2.extras import execute_values
+
+PAGE_SIZE = 5000
+
+RESET_SQL = """
+    TRUNCATE notification_outbox, notification_jobs, notifications, events, users
+    RESTART IDENTITY CASCADE;
+"""
+
+
+def zipfWeights(n, skew):
+    """Cumulative Zipf weights for ranks 1..n (rank 1 is the most popular)."""
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def resetData(conn):
+    cur = conn.cursor()
+    cur.execute(RESET_SQL)
+    conn.commit()
+    cur.close()
+
+
+def generate(conn, users=1000, events=5000, subscriptions=20000, skew=1.1, seed=42):
+    """Insert the synthetic data set; returns the generated user and event ids.
+
+    ``event_ids`` is ordered by popularity, so ``event_ids[0]`` is the event with
+    the most subscribers.
+    """
+    rng = random.Random(seed)
+    cur = conn.cursor()
+    # Emails are unique, so every load gets its own namespace even with a fixed seed
+    tag = os.urandom(4).hex()
+
+    user_rows = [(f"Bench User {i}", f"bench-{tag}-{i}@example.com") for i in range(users)]
+    user_ids = [row[0] for row in execute_values(
+        cur, "INSERT INTO users (name, email) VALUES %s RETURNING user_id", user_rows,
+        page_size=PAGE_SIZE, fetch=True)]
+
+    start = datetime.date.today() - datetime.timedelta(days=365)
+    event_rows = [(rng.choice(user_ids), f"Bench Event {i}", f"Synthetic event {i} for load testing",
+                   start + datetime.timedelta(days=rng.randrange(730))) for i in range(events)]
+    event_ids = [row[0] for row in execute_values(
+        cur, "INSERT INTO events (user_id, title, description, event_date) VALUES %s RETURNING event_id",
+        event_rows, page_size=PAGE_SIZE, fetch=True)]
+    rng.shuffle(event_ids)
+
+    # Pairs collide often on hot events, so draw until enough distinct ones exist
+    weights = zipfWeights(len(event_ids), skew)
+    target = min(subscriptions, len(user_ids) * len(event_ids))
+    pairs = set()
+    while len(pairs) < target:
+        hot = rng.choices(event_ids, cum_weights=weights, k=target - len(pairs))
+        pairs.update(zip((rng.choice(user_ids) for _ in hot), hot))
+    execute_values(cur, "INSERT INTO notifications (user_id, event_id) VALUES %s ON CONFLICT DO NOTHING",
+                   list(pairs), page_size=PAGE_SIZE)
+
+    conn.commit()
+    cur.close()
+    return {"user_ids": user_ids, "event_ids": event_ids, "subscriptions": len(pairs)}
+
+
+def tableSizes(conn):
+    cur = conn.cursor()
+    sizes = {}
+    for table in ("users", "events", "notifications", "notification_outbox"):
+        cur.execute(f"SELECT COUNT(*) FROM {table};")
+        sizes[table] = cur.fetchone()[0]
+    cur.close()
+    return sizes
+
+
+def main():
+    from adapter import createSchema, getConnection
+
+    parser = argparse.ArgumentParser(description="Load synthetic MeetEZ data")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--subscriptions", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for event popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="truncate all MeetEZ tables first")
+    args = parser.parse_args()
+
+    createSchema()
+    with getConnection() as conn:
+        if args.reset:
+            resetData(conn)
+        data = generate(conn, args.users, args.events, args.subscriptions, args.skew, args.seed)
+        print(f"Loaded {len(data['user_ids'])} users, {len(data['event_ids'])} events, "
+              f"{data['subscriptions']} subscriptions; table sizes: {tableSizes(conn)}")
+
+
+if __name__ == "__main__":
+    main()
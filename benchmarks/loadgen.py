@@ -0,0 +1,136 @@
+"""
+Shared pieces of the benchmark scripts: latency summaries and request drivers.
+
+A driver is a callable ``send(method, path, body, parse=False) -> (status, payload)``,
+where ``payload`` is the decoded JSON body when ``parse`` is set. ``InProcessDriver``
+goes through Flask's test client so no server is needed, ``HttpDriver`` talks to a
+running server over pooled keep-alive connections.
+"""
+
+# benchmarks/loadgen.py
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Scripts run as ``python benchmarks/<name>.py``; make the app modules importable
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) for one workload."""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def printTable(results, label="workload"):
+    width = max([len(label)] + [len(name) for name in results])
+    print(f"{label:<{width}} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<{width}} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}")
+
+
+class InProcessDriver:
+    """Sends requests through the Flask test client, one client per thread."""
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def __call__(self, method, path, body=None, parse=False):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        payload = response.get_json(silent=True) if parse else response.get_data()
+        response.close()
+        return response.status_code, payload
+
+
+class HttpDriver:
+    """Sends requests to a running server, one keep-alive session per thread."""
+    def __init__(self, base_url, timeout=30):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self, method, path, body=None, parse=False):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.requests.Session()
+        try:
+            response = session.request(method, self.base_url + path, json=body, timeout=self.timeout)
+        except self.requests.exceptions.RequestException:
+            return 599, None
+        payload = response.content  # read the body so the connection goes back to the pool
+        if parse:
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = None
+        return response.status_code, payload
+
+
+def runWorkload(send, pick, concurrency=8, requests=None, duration=None):
+    """Drive ``send(method, path, body) -> status`` with requests from ``pick()`` on ``concurrency`` threads.
+
+    Stops after ``requests`` total requests or ``duration`` seconds, whichever is
+    given (``requests`` wins if both are). Any status >= 400 counts as an error.
+    """
+    if requests is None and duration is None:
+        requests = 1000
+    lock = threading.Lock()
+    latencies, errors = [], 0
+    remaining = [requests]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def claim():
+        if requests is None:
+            return time.perf_counter() < deadline
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        nonlocal errors
+        mine, failed = [], 0
+        while claim():
+            method, path, body = pick()
+            started = time.perf_counter()
+            try:
+                status = send(method, path, body)
+            except Exception:
+                status = 599
+            mine.append(time.perf_counter() - started)
+            if status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(latencies, errors, time.perf_counter() - started)
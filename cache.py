@@ -0,0 +1,299 @@
+"""
+Read-through cache for hot read queries.
+
+Entries are stored with a TTL and a set of tags; write routes invalidate the
+tags they touch (``events``, ``event:<id>``, ``event:<id>:subscribers``,
+``user:<id>:events``) so exactly the affected entries are dropped.
+
+A load that races an invalidation of one of its tags is returned to its
+caller but not stored: the facade numbers invalidations and remembers the
+latest one per tag, and ``store`` drops a value whose tags were invalidated
+after its load began. This covers invalidations made by this process;
+readers that must agree with other processes' writes key their entries on a
+data version as well (see services.versionedKey).
+
+The default backend is an in-process LRU. Several gunicorn workers each keep
+their own copy, so deployments with more than one worker should point
+CACHE_BACKEND at a shared store (``redis``) so invalidations reach everyone;
+``fake`` is an in-memory stand-in with the same serialize-on-write behaviour
+for offline use.
+"""
+
+# cache.py
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+MISS = object()
+
+
+class LocalCache:
+    """Thread-safe LRU cache with per-entry TTL and tag-based invalidation."""
+    def __init__(self, max_entries=1024, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return MISS
+            if item[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return MISS
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, tags=(), ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (expires_at, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        """Drop every entry carrying any of ``tags``; returns how many were removed."""
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.pop(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "local", "entries": len(self._data), "max_entries": self.max_entries,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        for tag in item[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class FakeSharedBackend:
+    """In-memory stand-in for a shared cache server.
+
+    Values are pickled on write and unpickled on read exactly as the Redis
+    backend does, so code exercised against it behaves the same in production.
+    """
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._store = {}  # key -> (expires_at, payload bytes)
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._store.get(key)
+            if item is None:
+                return MISS
+            if item[0] <= time.monotonic():
+                del self._store[key]
+                self.expirations += 1
+                return MISS
+            payload = item[1]
+        return pickle.loads(payload)
+
+    def set(self, key, value, tags=(), ttl=None):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store[key] = (expires_at, payload)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.pop(tag, set())
+            removed = sum(1 for key in keys if self._store.pop(key, None) is not None)
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "fake", "entries": len(self._store), "expirations": self.expirations}
+
+
+class RedisBackend:
+    """Shared cache in Redis (needs the optional ``redis`` package)."""
+    def __init__(self, url, ttl=30.0, prefix="meetez:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        payload = self.client.get(self.prefix + key)
+        return MISS if payload is None else pickle.loads(payload)
+
+    def set(self, key, value, tags=(), ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), px=int(ttl * 1000))
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            pipe.sadd(tag_key, key)
+            # Tag sets outlive their entries slightly so invalidation never misses a key
+            pipe.pexpire(tag_key, int(ttl * 2000))
+        pipe.execute()
+
+    def invalidate(self, tags):
+        removed = 0
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            keys = self.client.smembers(tag_key)
+            self.client.delete(tag_key)
+            if keys:
+                removed += self.client.delete(*[self.prefix + k.decode() for k in keys])
+        return removed
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+class QueryCache:
+    """Read-through facade over a backend that keeps hit/miss/invalidation counters."""
+    def __init__(self, backend, max_tag_epochs=10000):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_stores = 0
+
+        # Invalidation counter, and the value it had at each tag's latest invalidation
+        self._epoch = 0
+        self._tag_epochs = OrderedDict()
+        self._max_tag_epochs = max_tag_epochs
+        self._epoch_floor = 0  # newest epoch forgotten when _tag_epochs overflowed
+
+    def getOrLoad(self, key, loader, tags=(), ttl=None, refresh=False):
+        """Return the cached value for ``key`` or call ``loader()`` and cache what it returns.
+
+        ``tags`` may be a callable taking the loaded value, for entries whose tags
+        depend on the result (e.g. a user's event list is tagged with each event).
+        ``refresh`` skips the lookup: the value is always loaded, then stored.
+        """
+        value = MISS if refresh else self.lookup(key)
+        if value is not MISS:
+            return value
+        since = self.epoch()
+        value = loader()
+        self.store(key, value, tags, ttl, since)
+        return value
+
+    def epoch(self):
+        """Token to take before loading and pass to store(), which skips the store if
+        one of the entry's tags is invalidated in between."""
+        with self._lock:
+            return self._epoch
+
+    def lookup(self, key):
+        """Cached value for ``key`` or MISS; split from store() for async callers."""
+        if self.backend is None:
+            return MISS
+        value = self.backend.get(key)
+        with self._lock:
+            if value is MISS:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def store(self, key, value, tags=(), ttl=None, since=None):
+        if self.backend is None:
+            return
+        tags = tags(value) if callable(tags) else tags
+        if since is not None and self._invalidatedSince(tags, since):
+            with self._lock:
+                self.stale_stores += 1
+            return
+        self.backend.set(key, value, tags, ttl)
+
+    def _invalidatedSince(self, tags, since):
+        with self._lock:
+            if self._epoch == since:
+                return False
+            # A forgotten tag may have been invalidated as late as the floor
+            return any(self._tag_epochs.get(tag, self._epoch_floor) > since for tag in tags)
+
+    def invalidate(self, *tags):
+        if self.backend is None or not tags:
+            return 0
+        # Bump the epochs first, so a load finishing while the backend is being cleared is not stored
+        with self._lock:
+            self._epoch += 1
+            for tag in tags:
+                self._tag_epochs.pop(tag, None)
+                self._tag_epochs[tag] = self._epoch
+            while len(self._tag_epochs) > self._max_tag_epochs:
+                self._epoch_floor = self._tag_epochs.popitem(last=False)[1]
+        removed = self.backend.invalidate(tags)
+        with self._lock:
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                     "stale_stores": self.stale_stores, "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0}
+        stats.update(self.backend.stats() if self.backend is not None else {"backend": "none"})
+        return stats
+
+
+def buildCache():
+    """Create the cache selected by CACHE_BACKEND (local, fake, redis or none)."""
+    kind = os.environ.get("CACHE_BACKEND", "local").lower()
+    ttl = float(os.environ.get("CACHE_TTL", 30))
+    if kind == "none":
+        return QueryCache(None)
+    if kind == "fake":
+        return QueryCache(FakeSharedBackend(ttl=ttl))
+    if kind == "redis":
+        return QueryCache(RedisBackend(os.environ.get("CACHE_URL", "redis://localhost:6379/0"), ttl=ttl))
+    return QueryCache(LocalCache(max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 1024)), ttl=ttl))
+
+
+queryCache = buildCache()
@@ -0,0 +1,247 @@
+"""
+Realtime change feed: one LISTEN connection per process, fanned out to clients.
+
+Triggers on ``events`` (migration 9) NOTIFY CHANNEL whenever events are added,
+edited or deleted, whichever app or route made the change, and Postgres only
+delivers the notification if that transaction commits. Each process keeps a
+single listening connection to the primary on a background thread, however
+many dashboards are connected, and hands every message to each subscriber's
+bounded queue. ``/eventChanges`` streams them as Server-Sent Events.
+
+A subscriber that falls QUEUE_SIZE messages behind, or any subscriber after
+the listener reconnects (notifications sent meanwhile are lost), gets one
+``resync`` message telling it to reload instead of a backlog of changes.
+
+A dashboard on another origin (e.g. the sync app, with the stream served by
+asgi.py on its own port) can only open the stream if its origin is listed in
+CHANGEFEED_ALLOWED_ORIGINS; the stream then answers with a matching
+``Access-Control-Allow-Origin``.
+"""
+
+# changefeed.py
+import asyncio
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from cache import LocalCache, queryCache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "meetez_event_changes"
+HEARTBEAT = float(os.environ.get("CHANGEFEED_HEARTBEAT", 15))  # seconds between keepalives
+QUEUE_SIZE = int(os.environ.get("CHANGEFEED_QUEUE_SIZE", 100))
+RESYNC = {"op": "resync"}
+
+# The browser waits this long before reconnecting a dropped stream
+STREAM_START = b"retry: 3000\n\n"
+KEEPALIVE = b": keepalive\n\n"
+
+# Comma-separated origins such as https://meetez.example.com, or * for any
+ALLOWED_ORIGINS = frozenset(origin.strip().rstrip("/")
+                            for origin in os.environ.get("CHANGEFEED_ALLOWED_ORIGINS", "").split(",")
+                            if origin.strip())
+
+
+def streamHeaders(origin=None):
+    """Headers for an ``/eventChanges`` response to a request sent from ``origin``."""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Vary": "Origin"}
+    if "*" in ALLOWED_ORIGINS:
+        headers["Access-Control-Allow-Origin"] = "*"
+    elif origin and origin in ALLOWED_ORIGINS:
+        headers["Access-Control-Allow-Origin"] = origin
+    return headers
+
+
+def formatEvent(message):
+    """One SSE frame: ``event: change`` (or ``resync``) carrying the message as JSON."""
+    kind = "resync" if message.get("op") == "resync" else "change"
+    return f"event: {kind}\ndata: {json.dumps(message, separators=(',', ':'))}\n\n".encode()
+
+
+class Subscription:
+    """A client's bounded queue, fed by the listener thread."""
+    def __init__(self, feed, maxsize):
+        self._feed = feed
+        self._queue = queue.Queue(maxsize)
+
+    def deliver(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # Too far behind to be worth catching up: drop the backlog and ask for a reload
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._queue.put_nowait(RESYNC)
+
+    def get(self, timeout):
+        """The next message, or None after ``timeout`` seconds without one."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._feed.unsubscribe(self)
+
+
+class AsyncSubscription:
+    """Subscription for an asyncio consumer (asgi.py); the listener hands over via the loop."""
+    def __init__(self, feed, maxsize, loop):
+        self._feed = feed
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:  # loop closed under us
+            self.close()
+
+    def _put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(RESYNC)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    def __init__(self, connect, queue_size=QUEUE_SIZE, poll_interval=5.0, max_backoff=30.0):
+        self._connect = connect
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._conn = None
+        self._stats = {"messages": 0, "deliveries": 0, "reconnects": 0, "connected": 0}
+
+    # --- subscribers --------------------------------------------------------
+
+    def subscribe(self):
+        """A Subscription for a thread (Flask); starts the listener on first use."""
+        return self._add(Subscription(self, self.queue_size))
+
+    def subscribeAsync(self, loop):
+        """An AsyncSubscription delivering on ``loop``."""
+        return self._add(AsyncSubscription(self, self.queue_size, loop))
+
+    def _add(self, subscription):
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listenLoop, name="changefeed-listener",
+                                                daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, message):
+        """Hand ``message`` to every subscriber (the listener calls this for each notification)."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats["messages"] += 1
+            self._stats["deliveries"] += len(subscribers)
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    # --- listener -----------------------------------------------------------
+
+    def _listenLoop(self):
+        backoff = 1.0
+        first = True
+        while not self._closed:
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {CHANNEL};")
+                cur.close()
+                self._conn = conn
+                self._stats["connected"] = 1
+                backoff = 1.0
+                if not first:
+                    # Anything committed while we were away was never delivered
+                    self._stats["reconnects"] += 1
+                    self.publish(RESYNC)
+                first = False
+                self._drain(conn)
+            except Exception as e:
+                if not self._closed:
+                    logger.warning("Change feed listener lost its connection: %s (retrying in %.0fs)", e, backoff)
+            finally:
+                self._stats["connected"] = 0
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+            if not self._closed:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _drain(self, conn):
+        while not self._closed:
+            # Wakes on a notification, or periodically so a dead socket is noticed by poll()
+            if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                cur = conn.cursor()
+                cur.execute("SELECT 1;")
+                cur.close()
+            conn.poll()
+            while conn.notifies:
+                self._handle(conn.notifies.pop(0).payload)
+
+    def _handle(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed change notification: %r", payload[:200])
+            return
+        # A per-process cache only hears about its own process's writes, so drop what changed
+        # elsewhere before any subscriber reloads; shared backends were invalidated by the writer
+        if isinstance(queryCache.backend, LocalCache):
+            ids = message.get("event_ids") or ()
+            queryCache.invalidate("events", *(f"event:{event_id}" for event_id in ids))
+        self.publish(message)
+
+    def close(self):
+        self._closed = True
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # --- metrics ------------------------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["subscribers"] = len(self._subscribers)
+        return stats
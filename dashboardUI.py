@@ -1,15 +1,69 @@
 import logging
-import requests
-from dash import html, dcc, Input, Output, State, dash
+import os
+from dash import html, dcc, dash_table, Input, Output, State, dash
 import dash_bootstrap_components as dbc
+from apiclient import getClient, ServiceError
 
 
 # Setup logging, API not available still
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# API_URL is defined here so that it can be edited easier
-API_URL = "https://meetez-czgpatgmh8c4cfcz.canadacentral-01.azurewebsites.net"
+# Callbacks go through the service layer in-process; set MEETEZ_API_URL to use a remote API instead
+
+def liveUpdateMeta():
+    """<meta> tags configuring assets/changefeed.js.
+
+    Pushing over Server-Sent Events holds a connection per open tab, so it is
+    opt-in: set DASHBOARD_CHANGEFEED_URL to a stream served by something built
+    for that (asgi.py, or a threaded/gevent worker). Otherwise pages poll every
+    DASHBOARD_POLL_SECONDS (0 turns live refresh off).
+    """
+    url = os.environ.get("DASHBOARD_CHANGEFEED_URL", "")
+    if url:
+        return [{"name": "meetez-changefeed-url", "content": url}]
+    return [{"name": "meetez-poll-seconds", "content": os.environ.get("DASHBOARD_POLL_SECONDS", "15")}]
+
+EVENT_TABLE_COLUMNS = [
+    {"name": "ID", "id": "event_id", "type": "numeric"},
+    {"name": "Organizer", "id": "user_id", "type": "numeric"},
+    {"name": "Title", "id": "title", "type": "text"},
+    {"name": "Description", "id": "description", "type": "text"},
+    {"name": "Date", "id": "event_date", "type": "datetime"},
+    {"name": "Created", "id": "created_at", "type": "datetime"},
+]
+EVENT_PAGE_SIZES = [25, 50, 100]
+
+# DataTable filter operators, longest symbols first so ">=" is not read as ">"
+FILTER_OPERATORS = [("ge", ">="), ("le", "<="), ("ne", "!="), ("lt", "<"), ("gt", ">"), ("eq", "="),
+                    ("contains", "contains"), ("datestartswith", "datestartswith")]
+
+def parseFilterQuery(filter_query):
+    """Turn a DataTable filter_query into [(column, operator, value), ...]."""
+    filters = []
+    for part in (filter_query or "").split(" && "):
+        for operator, symbol in FILTER_OPERATORS:
+            for token in (f" {symbol} ", f" {operator} "):
+                if token in part:
+                    name_part, value = part.split(token, 1)
+                    name = name_part[name_part.find("{") + 1:name_part.rfind("}")]
+                    value = value.strip()
+                    if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"`":
+                        value = value[1:-1].replace("\\" + value[0], value[0])
+                    filters.append((name, operator, value))
+                    break
+            else:
+                continue
+            break
+    return filters
+
+def _cell(value):
+    """Show dates as plain ISO text instead of the JSON encoder's default format."""
+    if hasattr(value, "hour"):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
 
 # Define the main layout
 layout = html.Div([
@@ -26,6 +80,7 @@ homeLayout = html.Div([
     dcc.Link("👥 View Subscribers", href="/dashboard/view-subscribers", className="btn btn-primary", style={"marginLeft": "10px"}),
     dcc.Link("📋 View User Subscriptions", href="/dashboard/view-user-events", className="btn btn-primary", style={"marginLeft": "10px"}),
     dcc.Link("✏️ Update Event", href="/dashboard/update-event", className="btn btn-warning", style={"marginLeft": "10px"}),
+    dcc.Link("📊 Event Stats", href="/dashboard/event-stats", className="btn btn-info", style={"marginLeft": "10px"}),
 
 ])
 
@@ -71,9 +126,48 @@ viewEventsLayout = html.Div([
     dbc.Input(id="subscribe-user-id", type="number", placeholder="Enter UserID to subscribe"),
     dbc.Input(id="subscribe-event-id", type="number", placeholder="Enter EventID to subscribe"),
     dbc.Button("Subscribe", id="subscribe-btn", color="success", className="mt-2"),
+    dbc.Button("Unsubscribe", id="unsubscribe-btn", color="secondary", className="mt-2", style={"marginLeft": "10px"}),
     html.Div(id="subscribe-output"),
+    html.H3("🔎 Search Events"),
+    dbc.Input(id="events-search", type="search", debounce=True,
+              placeholder="Search titles and descriptions (e.g. \"board meet\")"),
+    # Search results are cursor-paged; "More results" appends the next page
+    dash_table.DataTable(
+        id="search-results",
+        columns=EVENT_TABLE_COLUMNS[:5] + [{"name": "Relevance", "id": "rank", "type": "numeric"}],
+        data=[],
+        style_table={"overflowX": "auto"},
+        style_cell={"textAlign": "left", "maxWidth": "320px", "overflow": "hidden", "textOverflow": "ellipsis"},
+    ),
+    dcc.Store(id="search-cursor"),
+    html.Div(id="search-output"),
+    dbc.Button("More results", id="search-more-btn", color="link", style={"display": "none"}),
     html.H3("📅 Available Events"),
+    html.Div([
+        html.Span("Rows per page: "),
+        dcc.Dropdown(id="events-page-size", options=[{"label": str(n), "value": n} for n in EVENT_PAGE_SIZES],
+                     value=EVENT_PAGE_SIZES[0], clearable=False, style={"width": "100px", "display": "inline-block"}),
+    ]),
+    # Paging, sorting and filtering all run on the server; the browser only ever holds one page
+    dash_table.DataTable(
+        id="events-table",
+        columns=EVENT_TABLE_COLUMNS,
+        data=[],
+        page_current=0,
+        page_size=EVENT_PAGE_SIZES[0],
+        page_count=1,
+        page_action="custom",
+        sort_action="custom",
+        sort_mode="multi",
+        sort_by=[],
+        filter_action="custom",
+        filter_query="",
+        style_table={"overflowX": "auto"},
+        style_cell={"textAlign": "left", "maxWidth": "320px", "overflow": "hidden", "textOverflow": "ellipsis"},
+    ),
     html.Div(id="events-list"),
+    # Clicked by assets/changefeed.js when events change, to reload the current page of the table
+    html.Button(id="events-changed", n_clicks=0, style={"display": "none"}),
     html.Hr(),
     dcc.Link("🏠 Home", href="/dashboard/", className="btn btn-secondary"),
     dcc.Link("➕ Add Event", href="/dashboard/add-event", className="btn btn-primary", style={"marginLeft": "10px"})
@@ -91,12 +185,33 @@ viewSubscribersLayout = html.Div([
 viewUserEventsLayout = html.Div([
     html.H2("📋 View Events Subscribed by User"),
     dbc.Input(id="user-events-user-id", type="number", placeholder="Enter User ID"),
+    dcc.Checklist(id="user-events-upcoming", options=[{"label": " Upcoming only", "value": "upcoming"}],
+                  value=["upcoming"], className="mt-2"),
     dbc.Button("Fetch Events", id="fetch-user-events-btn", color="primary", className="mt-2"),
     html.Div(id="user-events-output"),
     html.Hr(),
     dcc.Link("🏠 Home", href="/dashboard/", className="btn btn-secondary"),
 ])
 
+STATS_COLUMNS = [
+    {"name": "ID", "id": "event_id"},
+    {"name": "Title", "id": "title"},
+    {"name": "Date", "id": "event_date"},
+    {"name": "Subscribers", "id": "subscriber_count"},
+]
+
+eventStatsLayout = html.Div([
+    html.H2("📊 Event Stats"),
+    dbc.Button("Refresh", id="refresh-stats-btn", color="primary", className="mb-2"),
+    html.Div(id="stats-output"),
+    html.H3("🔥 Top Events by Subscribers"),
+    dash_table.DataTable(id="top-events-table", columns=STATS_COLUMNS, data=[]),
+    html.H3("📅 Upcoming Events"),
+    dash_table.DataTable(id="upcoming-events-table", columns=STATS_COLUMNS, data=[]),
+    html.Hr(),
+    dcc.Link("🏠 Home", href="/dashboard/", className="btn btn-secondary"),
+])
+
 
 # Callback to update page-content based on the URL
 def register_callbacks(dash_app):
@@ -117,6 +232,8 @@ def register_callbacks(dash_app):
             return viewUserEventsLayout
         elif pathname == "/dashboard/update-event":
             return updateEventLayout
+        elif pathname == "/dashboard/event-stats":
+            return eventStatsLayout
         return homeLayout
 
 
@@ -128,76 +245,103 @@ def register_callbacks(dash_app):
     )
     def add_event(n_clicks, user_id, title, description, event_date):
         if n_clicks and user_id and title and event_date:
-            data = {"user_id": user_id, "title": title, "description": description, "event_date": event_date}
             try:
-                response = requests.post(f"{API_URL}/addEvent", json=data)
-                if response.status_code == 200:
-                    return f"Event added successfully! ID: {response.json().get('event_id')}"
-                else:
-                    return f"Error: {response.json().get('error', 'Unknown error')}"
-            except requests.exceptions.RequestException as e:
-                return f"API Request Failed: {str(e)}"
+                event_id = getClient().addEvent(user_id, title, description, event_date)
+                return f"Event added successfully! ID: {event_id}"
+            except ServiceError as e:
+                return f"Error: {str(e)}"
         return ""
 
-    # Fetch Events on Page Load
+    # Fetch only the visible page of events whenever the table's page, sort or filter changes
     @dash_app.callback(
-        Output("events-list", "children"),
-        [Input("url", "pathname")]
+        [Output("events-table", "data"), Output("events-table", "page_count"), Output("events-list", "children")],
+        [Input("events-table", "page_current"), Input("events-table", "page_size"),
+         Input("events-table", "sort_by"), Input("events-table", "filter_query"),
+         Input("events-changed", "n_clicks")]
     )
-    def view_events(pathname):
-        if pathname == "/dashboard/view-events":
-            try:
-                # Log request for debugging
-                logger.info("Fetching events from API...")
-
-                # Call API with a timeout to prevent hanging
-                #Logging API path
-                logger.info(f"{API_URL}/getEvents")
-                response = requests.get(f"{API_URL}/getEvents", timeout=5)
-                
-                if response.status_code == 200:
-                    events = response.json().get("events", [])
-                    logger.info(f"Received {len(events)} events from the API")
-                    
-                    # Log event data
-                    print(f"Received events: {events}")
-
-                    if events:
-                        return [html.Div(f"{event}") for event in events]
-                    else:
-                        return "No events available."
-                else:
-                    logger.error(f"Error fetching events: {response.status_code}")
-                    return f"API Error: {response.status_code}"
-            except requests.exceptions.Timeout:
-                return "API request timed out!"
-            except Exception as e:
-                logger.error(f"API Error: {str(e)}")
-                return f"API Error: {str(e)}"
-                
-        return "Loading..."
+    def view_events(page_current, page_size, sort_by, filter_query, changed):
+        try:
+            result = getClient().getEventsTable(
+                page=page_current or 0,
+                page_size=page_size,
+                sort_by=[(s["column_id"], s["direction"]) for s in sort_by or []],
+                filters=parseFilterQuery(filter_query),
+            )
+        except ServiceError as e:
+            logger.error(f"API Error: {str(e)}")
+            return [], 1, f"API Error: {str(e)}"
+
+        total = result["total"]
+        rows = [{k: _cell(v) for k, v in event.items()} for event in result["events"]]
+        page_count = max(1, -(-total // page_size))
+        return rows, page_count, "No events available." if not total else f"{total} events"
+
+    @dash_app.callback(
+        [Output("events-table", "page_size"), Output("events-table", "page_current")],
+        [Input("events-page-size", "value"), Input("events-table", "filter_query"),
+         Input("events-table", "sort_by")],
+        [State("events-table", "page_size")]
+    )
+    def reset_events_page(page_size, filter_query, sort_by, current_size):
+        # A new page size, filter or sort invalidates the page number, so go back to the first page
+        return page_size or current_size, 0
+
+    @dash_app.callback(
+        [Output("search-results", "data"), Output("search-cursor", "data"), Output("search-output", "children"),
+         Output("search-more-btn", "style")],
+        [Input("events-search", "value"), Input("search-more-btn", "n_clicks")],
+        [State("search-results", "data"), State("search-cursor", "data")]
+    )
+    def search_events(query, n_clicks, shown, cursor):
+        hidden = {"display": "none"}
+        if not (query or "").strip():
+            return [], None, "", hidden
+        more = dash.callback_context.triggered_id == "search-more-btn"
+        try:
+            result = getClient().searchEvents(query, cursor=cursor if more else None)
+        except ServiceError as e:
+            return [], None, f"Error: {str(e)}", hidden
+
+        rows = [{k: round(v, 3) if k == "rank" else _cell(v) for k, v in event.items()}
+                for event in result["events"]]
+        rows = (shown or []) + rows if more else rows
+        message = f"{len(rows)} matching events" if rows else "No matching events."
+        return rows, result["next_cursor"], message, {} if result["next_cursor"] else hidden
+
+    # Counts come from the maintained subscriber_count column, so this stays cheap
+    @dash_app.callback(
+        [Output("top-events-table", "data"), Output("upcoming-events-table", "data"), Output("stats-output", "children")],
+        [Input("refresh-stats-btn", "n_clicks")]
+    )
+    def view_stats(n_clicks):
+        try:
+            stats = getClient().getEventStats(limit=10)
+        except ServiceError as e:
+            return [], [], f"Error: {str(e)}"
+        top = [{k: _cell(v) for k, v in e.items()} for e in stats["top_events"]]
+        upcoming = [{k: _cell(v) for k, v in e.items()} for e in stats["upcoming"]]
+        return top, upcoming, ""
 
     @dash_app.callback(
         Output("user-events-output", "children"),
         [Input("fetch-user-events-btn", "n_clicks")],
-        [State("user-events-user-id", "value")]
+        [State("user-events-user-id", "value"), State("user-events-upcoming", "value")]
     )
-    def get_user_events(n_clicks, user_id):
+    def get_user_events(n_clicks, user_id, upcoming):
         if n_clicks and user_id:
             try:
-                response = requests.get(f"{API_URL}/getUserEvents", params={"user_id": user_id})
-                if response.status_code == 200:
-                    events = response.json().get("events", [])
-                    if not events:
-                        return "This user is not subscribed to any events."
-                    return html.Ul([
+                events = getClient().getUserEvents(user_id, upcoming=bool(upcoming))
+                if not events:
+                    return "This user is not subscribed to any events."
+                return html.Div([
+                    html.Ul([
                         html.Li(f"ID: {e['event_id']} | Title: {e['title']} | Date: {e['event_date']}")
                         for e in events
-                    ])
-                else:
-                    return f"Error: {response.json().get('error', 'Unknown error')}"
-            except requests.exceptions.RequestException as e:
-                return f"API Request Failed: {str(e)}"
+                    ]),
+                    html.A("📅 Calendar feed (.ics)", href=f"/calendar/{int(user_id)}.ics"),
+                ])
+            except ServiceError as e:
+                return f"Error: {str(e)}"
         return ""
 
     @dash_app.callback(
@@ -210,20 +354,11 @@ def register_callbacks(dash_app):
     )
     def update_event(n_clicks, eventId, title, description, eventDate):
         if n_clicks and eventId:
-            data = {
-                "event_id": eventId,
-                "title": title,
-                "description": description,
-                "event_date": eventDate
-            }
             try:
-                response = requests.post(f"{API_URL}/updateEvent", json=data)
-                if response.status_code == 200:
-                    return "Event updated and notifications sent!"
-                else:
-                    return f"Error: {response.json().get('error', 'Unknown error')}"
-            except requests.exceptions.RequestException as e:
-                return f"API Request Failed: {str(e)}"
+                getClient().updateEvent(eventId, title, description, eventDate)
+                return "Event updated and notifications queued!"
+            except ServiceError as e:
+                return f"Error: {str(e)}"
         return ""
 
     @dash_app.callback(
@@ -234,32 +369,30 @@ def register_callbacks(dash_app):
     def deleteEvent(n_clicks, event_id):
         if n_clicks and event_id:
             try:
-                response = requests.post(f"{API_URL}/deleteEvent", json={"event_id": event_id})
-                if response.status_code == 200:
-                    return "Event deleted successfully!"
-                else:
-                    return f"Error: {response.json().get('error', 'Unknown error')}"
-            except requests.exceptions.RequestException as e:
-                return f"API Request Failed: {str(e)}"
+                getClient().deleteEvent(event_id)
+                return "Event deleted successfully!"
+            except ServiceError as e:
+                return f"Error: {str(e)}"
         return ""
 
-    # Subscribe to Event Button 
+    # Subscribe / Unsubscribe Buttons
     @dash_app.callback(
         Output("subscribe-output", "children"),
-        [Input("subscribe-btn", "n_clicks")],
+        [Input("subscribe-btn", "n_clicks"), Input("unsubscribe-btn", "n_clicks")],
         [State("subscribe-user-id", "value"), State("subscribe-event-id", "value")]
     )
-    def subscribe_event(n_clicks, user_id, event_id):
-        if n_clicks and user_id and event_id:
-            data = {"user_id": user_id, "event_id": event_id}
+    def subscribe_event(n_subscribe, n_unsubscribe, user_id, event_id):
+        if (n_subscribe or n_unsubscribe) and user_id and event_id:
             try:
-                response = requests.post(f"{API_URL}/subscribeEvent", json=data)
-                if response.status_code == 200:
+                if dash.callback_context.triggered_id == "unsubscribe-btn":
+                    if getClient().unsubscribeEvent(user_id, event_id):
+                        return "Successfully unsubscribed from the event."
+                    return "That user was not subscribed to this event."
+                if getClient().subscribeEvent(user_id, event_id):
                     return "Successfully subscribed to the event!"
-                else:
-                    return f"Error: {response.json().get('error', 'Unknown error')}"
-            except requests.exceptions.RequestException as e:
-                return f"API Request Failed: {str(e)}"
+                return "That user is already subscribed to this event."
+            except ServiceError as e:
+                return f"Error: {str(e)}"
         return ""
     
     @dash_app.callback(
@@ -270,17 +403,13 @@ def register_callbacks(dash_app):
     def get_subscribers(n_clicks, event_id):
         if n_clicks and event_id:
             try:
-                response = requests.get(f"{API_URL}/getSubscribers", params={"event_id": event_id})
-                if response.status_code == 200:
-                    subscribers = response.json().get("subscribers", [])
-                    if not subscribers:
-                        return "No subscribers found for this event."
-                    return html.Ul([
-                        html.Li(f"ID: {s['user_id']} | Name: {s['name']} | Email: {s['email']}")
-                        for s in subscribers
-                    ])
-                else:
-                    return f"Error: {response.json().get('error', 'Unknown error')}"
-            except requests.exceptions.RequestException as e:
-                return f"API Request Failed: {str(e)}"
+                subscribers = getClient().getSubscribers(event_id)
+                if not subscribers:
+                    return "No subscribers found for this event."
+                return html.Ul([
+                    html.Li(f"ID: {s['user_id']} | Name: {s['name']} | Email: {s['email']}")
+                    for s in subscribers
+                ])
+            except ServiceError as e:
+                return f"Error: {str(e)}"
         return ""
@@ -0,0 +1,151 @@
+"""
+Notification email templates, compiled once and rendered in two stages.
+
+Each template has a subject, an HTML body and a plain-text alternative with
+``{field}`` placeholders. A template is parsed once into literal chunks and
+fields. ``render`` fills the event fields once per job, escaped in the HTML
+part. It leaves RECIPIENT_FIELDS as substitution tokens, which the transport
+swaps per message (SendGrid does it server-side from each personalization).
+A fan-out therefore renders its body once, and each recipient costs only a
+small dict of values (``recipientValues``).
+
+Substitution applies to every part of the message, so event text is made
+token-free whichever part it lands in: ``<`` is already escaped in HTML and
+``[`` is escaped too, while plain text gets a zero-width space after either
+opening character. An event title therefore cannot pull in recipient fields.
+"""
+
+# emailtemplates.py
+import hashlib
+import hmac
+import html
+import os
+import string
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlencode
+
+PUBLIC_URL = os.environ.get("PUBLIC_URL", "http://localhost:8000").rstrip("/")
+RECIPIENT_FIELDS = ("name", "unsubscribe_url")
+DEFAULT_NAME = "there"
+
+Message = namedtuple("Message", "subject html text")
+
+TEMPLATES = {
+    "event_updated": {
+        "subject": "Event updated: {title}",
+        "html": """
+<p>Hello {name},</p>
+<p>The event you are subscribed to has been updated:</p>
+<ul>
+    <li><strong>Title:</strong> {title}</li>
+    <li><strong>Description:</strong> {description}</li>
+    <li><strong>Date:</strong> {event_date}</li>
+</ul>
+<p>Visit your dashboard for more details.</p>
+<p style="font-size:12px;color:#666666">Don't want these emails?
+<a href="{unsubscribe_url}">Unsubscribe from this event</a>.</p>
+""",
+        "text": """Hello {name},
+
+The event you are subscribed to has been updated:
+
+  Title: {title}
+  Description: {description}
+  Date: {event_date}
+
+Visit your dashboard for more details.
+
+Don't want these emails? Unsubscribe from this event: {unsubscribe_url}
+""",
+    },
+}
+
+
+def htmlToken(field):
+    return f"<%{field}%>"
+
+
+def textToken(field):
+    return f"[%{field}%]"
+
+
+@lru_cache(maxsize=None)
+def compiled(name, part):
+    """(literal, field or None) pairs for one part of a template, parsed once."""
+    return tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(TEMPLATES[name][part]))
+
+
+def _plainText(value):
+    return str(value).replace("<%", "<\u200b%").replace("[%", "[\u200b%")
+
+
+def _escapeHtml(value):
+    return html.escape(str(value), quote=True).replace("[", "&#91;").replace("\n", "<br>\n")
+
+
+def _subjectText(value):
+    # Headers are one line; newlines in a title must not start a new header
+    return _plainText(" ".join(str(value).split()))
+
+
+def _fill(name, part, fields, escape, token):
+    out = []
+    for literal, field in compiled(name, part):
+        out.append(literal)
+        if field is None:
+            continue
+        if field in RECIPIENT_FIELDS:
+            out.append(token(field))
+        elif field in fields:
+            value = fields[field]
+            out.append(escape("" if value is None else value))
+        else:
+            raise KeyError(f"Template {name} needs field {field!r}")
+    return "".join(out)
+
+
+def render(name, **fields):
+    """The job-level Message for template ``name``; recipient fields stay as tokens."""
+    return Message(
+        _fill(name, "subject", fields, _subjectText, textToken),
+        _fill(name, "html", fields, _escapeHtml, htmlToken),
+        _fill(name, "text", fields, _plainText, textToken),
+    )
+
+
+def recipientValues(name=None, unsubscribe_url=None):
+    """Substitutions for one recipient: {token: value} for both the HTML and text parts."""
+    values = {"name": name or DEFAULT_NAME, "unsubscribe_url": unsubscribe_url or f"{PUBLIC_URL}/dashboard/"}
+    substitutions = {}
+    for field, value in values.items():
+        substitutions[htmlToken(field)] = html.escape(value, quote=True)
+        substitutions[textToken(field)] = value
+    return substitutions
+
+
+def personalize(text, substitutions):
+    """Apply a recipient's substitutions locally (FakeTransport, previews)."""
+    if text is None:
+        return None
+    for token, value in substitutions.items():
+        text = text.replace(token, value)
+    return text
+
+
+class UnsubscribeLinks:
+    """Signed one-event unsubscribe links, so an emailed link cannot be edited to target someone else."""
+    def __init__(self, key, base_url=PUBLIC_URL):
+        self.key = key.encode() if isinstance(key, str) else key
+        self.base_url = base_url.rstrip("/")
+
+    def signature(self, user_id, event_id):
+        mac = hmac.new(self.key, f"unsubscribe:{int(user_id)}:{int(event_id)}".encode(), hashlib.sha256)
+        return mac.hexdigest()[:32]
+
+    def url(self, user_id, event_id):
+        query = urlencode({"user_id": user_id, "event_id": event_id, "sig": self.signature(user_id, event_id)})
+        return f"{self.base_url}/unsubscribe?{query}"
+
+    def verify(self, user_id, event_id, signature):
+        return hmac.compare_digest(self.signature(user_id, event_id), str(signature or ""))
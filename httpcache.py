@@ -0,0 +1,72 @@
+"""
+HTTP-level caching for the read endpoints: conditional GETs and compression.
+
+``/getEvents``, ``/getSubscribers`` and ``/getUserEvents`` carry a weak ETag
+and Last-Modified built from the ``data_versions`` stamps their payload
+depends on (kept current by triggers, see migration 6). A client that sends
+the ETag back in If-None-Match (or the date in If-Modified-Since) gets
+``304 Not Modified`` after one primary-key lookup, without the row query.
+
+JSON bodies of at least COMPRESS_MIN_BYTES are compressed with brotli when the
+client accepts it and the optional ``brotli`` package is installed, otherwise
+with gzip. The helpers take werkzeug-style request/response objects, so the
+Flask app and the Quart app in asgi.py share them.
+"""
+
+# httpcache.py
+import gzip
+import os
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+COMPRESSIBLE_TYPES = ("application/json", "text/calendar")
+# Server preference when the client weights several encodings equally
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def isFresh(request, etag, modified):
+    """True if the client's cached copy matches ``etag`` / ``modified``.
+
+    If-None-Match takes precedence over If-Modified-Since, as RFC 9110 requires.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return modified is not None and since is not None and modified.replace(microsecond=0) <= since
+
+
+def stampResponse(response, etag, modified):
+    response.set_etag(etag, weak=True)
+    if modified is not None:
+        response.last_modified = modified.replace(microsecond=0)
+    # Let caches store the body but always revalidate, which is a cheap 304 when unchanged
+    response.cache_control.no_cache = True
+    return response
+
+
+def compressible(response):
+    return (response.status_code == 200 and response.mimetype in COMPRESSIBLE_TYPES
+            and "Content-Encoding" not in response.headers
+            and not getattr(response, "is_streamed", False)
+            and not getattr(response, "direct_passthrough", False))
+
+
+def compressBody(request, data):
+    """(compressed bytes, encoding) for ``data``, or None to send it as is."""
+    if len(data) < COMPRESS_MIN_BYTES:
+        return None
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return None
+    with metrics.timeStage("compress"):
+        if encoding == "br":
+            return brotli.compress(data, quality=BROTLI_QUALITY), "br"
+        return gzip.compress(data, compresslevel=GZIP_LEVEL), "gzip"
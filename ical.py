@@ -0,0 +1,75 @@
+"""
+iCalendar (RFC 5545) rendering for the per-user event feeds.
+
+Each VEVENT is rendered from its row and memoized on the row's contents, so
+rebuilding a feed after one event changes only renders that event again; the
+rest are reused from the cache. Events are all-day entries on ``event_date``.
+"""
+
+# ical.py
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+PRODID = "-//MeetEZ//Event Notifications//EN"
+UID_DOMAIN = "meetez"
+
+
+def escapeText(value):
+    """Escape a TEXT value (backslash, semicolon, comma and newlines)."""
+    return (str(value or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n").replace("\r", "\\n"))
+
+
+def foldLine(line):
+    """Fold a content line at 75 octets, continuing with CRLF + space."""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start, limit = end, 74  # continuation lines spend one octet on the leading space
+    return "\r\n ".join(parts)
+
+
+def _utcStamp(value):
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+@lru_cache(maxsize=4096)
+def renderEvent(event_id, title, description, event_date, created_at):
+    """One VEVENT block (CRLF-terminated lines) for an all-day event."""
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{event_id}@{UID_DOMAIN}",
+        f"DTSTAMP:{_utcStamp(created_at)}",
+        f"DTSTART;VALUE=DATE:{event_date:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{event_date + timedelta(days=1):%Y%m%d}",
+        f"SUMMARY:{escapeText(title)}",
+    ]
+    if description:
+        lines.append(f"DESCRIPTION:{escapeText(description)}")
+    lines.append("END:VEVENT")
+    return "".join(foldLine(line) + "\r\n" for line in lines)
+
+
+def renderCalendar(name, events):
+    """A VCALENDAR around ``events``, rows shaped like rows.UserEventRow."""
+    head = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escapeText(name)}",
+    ]
+    return ("".join(foldLine(line) + "\r\n" for line in head)
+            + "".join(renderEvent(*event) for event in events)
+            + "END:VCALENDAR\r\n")
@@ -0,0 +1,295 @@
+"""
+Request, query and email instrumentation exposed in Prometheus text format.
+
+Every Flask request is timed per route, and the time it spends in each stage
+is broken down as well: waiting for a pooled connection (``db_wait``),
+running SQL (``sql``), turning rows into payloads (``convert``) and
+serializing the response (``serialize``). Queries go through
+InstrumentedCursor, which records per-query latency and row counts and logs
+statements slower than SLOW_QUERY_MS to the ``meetez.sql`` logger.
+
+Metrics are kept per process; with several gunicorn workers each scrape
+sees the worker that served it, so scrape each worker or aggregate upstream.
+"""
+
+# metrics.py
+import bisect
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import psycopg2.extensions
+
+slowLog = logging.getLogger("meetez.sql")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+def _labelText(names, values, extra=""):
+    pairs = [f'{n}="{str(v)}"'.replace("\n", " ") for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labelText(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(row)) for key, row in self._values.items())
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labelText(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labelText(self.labels, key, le)} {row[-1]}")
+            lines.append(f"{self.name}_sum{_labelText(self.labels, key)} {round(row[-2], 6)}")
+            lines.append(f"{self.name}_count{_labelText(self.labels, key)} {row[-1]}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from ``collect()``, which returns a number or {label value: number}."""
+    def __init__(self, name, help, collect, label=None):
+        self.name, self.help, self.collect, self.label = name, help, collect, label
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            slowLog.warning("Gauge %s failed: %s", self.name, e)
+            return lines
+        if isinstance(values, dict):
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"{self.name}{_labelText((self.label,), (key,))} {value}")
+        else:
+            lines.append(f"{self.name} {values}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "meetez_request_duration_seconds", "HTTP request latency by route", ("route", "method", "status")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "meetez_request_stage_seconds", "Time each request spent per stage (db_wait, sql, convert, serialize, compress)",
+    ("route", "stage")))
+QUERY_SECONDS = REGISTRY.register(Histogram(
+    "meetez_db_query_duration_seconds", "SQL statement latency by query", ("query",)))
+QUERY_ROWS = REGISTRY.register(Histogram(
+    "meetez_db_query_rows", "Rows returned or affected per statement", ("query",), ROW_BUCKETS))
+SLOW_QUERIES = REGISTRY.register(Counter(
+    "meetez_db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("query",)))
+CONNECTION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "meetez_db_connection_wait_seconds", "Time spent borrowing a pooled connection"))
+CONNECT_SECONDS = REGISTRY.register(Histogram(
+    "meetez_db_connect_seconds", "Time to open a new PostgreSQL connection"))
+RATE_LIMITED = REGISTRY.register(Counter(
+    "meetez_rate_limited_total", "Requests rejected by the rate limiter (429) or the expensive-route cap (503)",
+    ("route", "status")))
+EMAIL_SECONDS = REGISTRY.register(Histogram(
+    "meetez_email_send_duration_seconds", "Latency of one email API call", ("outcome",)))
+EMAIL_RECIPIENTS = REGISTRY.register(Counter(
+    "meetez_email_recipients_total", "Recipients handed to the email transport", ("outcome",)))
+
+
+def render():
+    return REGISTRY.render()
+
+
+# Per-request stage totals; None outside a request (e.g. in drainer threads)
+_stages = contextvars.ContextVar("meetez_stages", default=None)
+
+
+def beginRequest():
+    _stages.set({})
+    return time.perf_counter()
+
+
+def endRequest(started, route, method, status):
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=method, status=status)
+    stages = _stages.get()
+    if stages:
+        for name, seconds in stages.items():
+            STAGE_SECONDS.observe(seconds, route=route, stage=name)
+    _stages.set(None)
+
+
+def addStage(stage, seconds):
+    stages = _stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timeStage(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        addStage(stage, time.perf_counter() - started)
+
+
+def stage(name):
+    """Decorator form of timeStage()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timeStage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def observeConnectionWait(seconds):
+    CONNECTION_WAIT_SECONDS.observe(seconds)
+    addStage("db_wait", seconds)
+
+
+_FROM_RE = re.compile(r"\bFROM\s+([\w.]+)", re.IGNORECASE)
+_labels = {}
+
+
+def queryLabel(sql):
+    """Low-cardinality label such as ``select events`` or ``insert users``."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    label = _labels.get(sql)
+    if label is None:
+        words = sql.lower().replace("(", " ").split()
+        verb = words[0] if words else "other"
+        if verb == "select":
+            match = _FROM_RE.search(sql)
+            table = match.group(1).lower() if match else ""
+        elif verb in ("insert", "delete") and len(words) > 2:
+            table = words[2]  # INSERT INTO <table> / DELETE FROM <table>
+        elif verb == "update" and len(words) > 1:
+            table = words[1]
+        else:
+            table = ""
+        label = f"{verb} {table}".strip().rstrip(";")
+        if len(_labels) < 1000:  # statements are constants, but never grow without bound
+            _labels[sql] = label
+    return label
+
+
+def slowQueryThreshold():
+    value = os.environ.get("SLOW_QUERY_MS")
+    return float(value) / 1000.0 if value else None
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor recording per-statement latency and row counts."""
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, time.perf_counter() - started)
+
+    def _record(self, query, seconds):
+        label = queryLabel(query)
+        QUERY_SECONDS.observe(seconds, query=label)
+        if self.rowcount >= 0:
+            QUERY_ROWS.observe(self.rowcount, query=label)
+        addStage("sql", seconds)
+        threshold = slowQueryThreshold()
+        if threshold is not None and seconds >= threshold:
+            SLOW_QUERIES.inc(query=label)
+            text = query.decode("utf-8", "replace") if isinstance(query, bytes) else query
+            slowLog.warning("Slow query (%.1f ms, %s rows) [%s]: %s", seconds * 1000, self.rowcount,
+                            label, " ".join(text.split())[:500])
+
+
+class InstrumentedTransport:
+    """Wraps an email transport to time each sendBatch call."""
+    def __init__(self, transport):
+        self.transport = transport
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def sendBatch(self, subject, body, recipients, text=None):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = self.transport.sendBatch(subject, body, recipients, text)
+            outcome = "ok"
+            return result
+        finally:
+            EMAIL_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+            EMAIL_RECIPIENTS.inc(len(recipients), outcome=outcome)
@@ -0,0 +1,441 @@
+"""
+Versioned schema migrations run by ``createSchema``.
+
+Each entry in MIGRATIONS is applied once, in order, inside a single transaction
+and recorded in ``schema_migrations``; re-running ``createSchema`` against an
+up-to-date database costs one query. New schema changes are appended as a new
+version — never edit one that has already shipped.
+"""
+
+# migrations.py
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent workers migrate one at a time
+MIGRATION_LOCK_ID = 4341_0001
+
+MIGRATIONS = [
+    (1, "Base users, events and notifications tables", """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS events (
+            event_id SERIAL PRIMARY KEY,
+            user_id INT NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            event_date DATE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS notifications (
+            notification_id SERIAL PRIMARY KEY,
+            user_id INT NOT NULL,
+            event_id INT NOT NULL,
+            subscribed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (event_id) REFERENCES events(event_id) ON DELETE CASCADE
+        );
+    """),
+
+    (2, "Notification outbox", """
+        CREATE TABLE IF NOT EXISTS notification_jobs (
+            job_id VARCHAR(32) PRIMARY KEY,
+            event_id INT,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (event_id) REFERENCES events(event_id) ON DELETE CASCADE
+        );
+
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            outbox_id BIGSERIAL PRIMARY KEY,
+            job_id VARCHAR(32) NOT NULL,
+            email VARCHAR(100) NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            last_error TEXT,
+            available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            UNIQUE (job_id, email),
+            FOREIGN KEY (job_id) REFERENCES notification_jobs(job_id) ON DELETE CASCADE
+        );
+
+        -- Drainers only ever scan rows that are still due
+        CREATE INDEX IF NOT EXISTS notification_outbox_pending_idx
+            ON notification_outbox (available_at, outbox_id)
+            WHERE status = 'pending';
+    """),
+
+    (3, "Unique subscriptions and lookup indexes", """
+        -- Drop duplicate subscriptions (keeping the oldest) so the constraint can be added
+        DELETE FROM notifications n
+        USING notifications d
+        WHERE n.user_id = d.user_id
+          AND n.event_id = d.event_id
+          AND n.notification_id > d.notification_id;
+
+        -- Also serves as the notifications(user_id, event_id) index for getUserEvents
+        ALTER TABLE notifications
+            ADD CONSTRAINT notifications_user_event_key UNIQUE (user_id, event_id);
+
+        -- getSubscribers / updateEvent: index-only lookup of an event's subscribers
+        CREATE INDEX IF NOT EXISTS notifications_event_user_idx
+            ON notifications (event_id, user_id);
+
+        -- getEvents keyset pagination and date-range filters
+        CREATE INDEX IF NOT EXISTS events_event_date_idx
+            ON events (event_date, event_id);
+
+        CREATE INDEX IF NOT EXISTS events_user_idx
+            ON events (user_id);
+    """),
+
+    (4, "Maintained per-event subscriber counts", """
+        ALTER TABLE events ADD COLUMN IF NOT EXISTS subscriber_count INT NOT NULL DEFAULT 0;
+
+        UPDATE events e
+        SET subscriber_count = c.n
+        FROM (SELECT event_id, COUNT(*) AS n FROM notifications GROUP BY event_id) c
+        WHERE e.event_id = c.event_id;
+
+        -- Statement-level, so a bulk subscribe touches each event row once, not once per row
+        CREATE OR REPLACE FUNCTION notifications_maintain_counts() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE events e
+                SET subscriber_count = e.subscriber_count - d.n
+                FROM (SELECT event_id, COUNT(*) AS n FROM old_rows GROUP BY event_id) d
+                WHERE e.event_id = d.event_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE events e
+                SET subscriber_count = e.subscriber_count + d.n
+                FROM (SELECT event_id, COUNT(*) AS n FROM new_rows GROUP BY event_id) d
+                WHERE e.event_id = d.event_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS notifications_count_insert ON notifications;
+        CREATE TRIGGER notifications_count_insert
+            AFTER INSERT ON notifications
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notifications_maintain_counts();
+
+        DROP TRIGGER IF EXISTS notifications_count_delete ON notifications;
+        CREATE TRIGGER notifications_count_delete
+            AFTER DELETE ON notifications
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notifications_maintain_counts();
+
+        DROP TRIGGER IF EXISTS notifications_count_update ON notifications;
+        CREATE TRIGGER notifications_count_update
+            AFTER UPDATE ON notifications
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notifications_maintain_counts();
+
+        -- "Top events by subscribers" walks this index instead of grouping notifications
+        CREATE INDEX IF NOT EXISTS events_subscriber_count_idx
+            ON events (subscriber_count DESC, event_id);
+    """),
+
+    (5, "Coalesce notification jobs per event", """
+        -- superseded_by: the newer job that took over this job's unsent recipients
+        -- pending_since: when the oldest edit folded into this job was made (caps the debounce)
+        ALTER TABLE notification_jobs ADD COLUMN IF NOT EXISTS superseded_by VARCHAR(32);
+        ALTER TABLE notification_jobs ADD COLUMN IF NOT EXISTS pending_since TIMESTAMP;
+        UPDATE notification_jobs SET pending_since = created_at WHERE pending_since IS NULL;
+        ALTER TABLE notification_jobs ALTER COLUMN pending_since SET DEFAULT CURRENT_TIMESTAMP;
+
+        CREATE INDEX IF NOT EXISTS notification_jobs_event_idx
+            ON notification_jobs (event_id);
+    """),
+
+    (6, "Data version stamps for conditional GETs", """
+        -- One row per scope ('events', 'users', 'event:<id>:subscribers', 'user:<id>:events', 'all');
+        -- version only ever grows, so a read's ETag is the versions of the scopes it depends on
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 1,
+            modified_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+
+        -- Scopes are locked in sorted order so concurrent bumps cannot deadlock
+        CREATE OR REPLACE FUNCTION data_versions_bump(scopes TEXT[]) RETURNS void
+        LANGUAGE sql AS $$
+            INSERT INTO data_versions (scope)
+            SELECT DISTINCT s FROM unnest(scopes) s ORDER BY s
+            ON CONFLICT (scope) DO UPDATE
+            SET version = data_versions.version + 1, modified_at = now();
+        $$;
+
+        CREATE OR REPLACE FUNCTION data_versions_table_changed() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM data_versions_bump(CASE WHEN TG_OP = 'TRUNCATE' THEN ARRAY['all'] ELSE TG_ARGV END);
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE OR REPLACE FUNCTION data_versions_subscriptions_changed() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM data_versions_bump(ARRAY(
+                    SELECT 'event:' || event_id || ':subscribers' FROM old_rows
+                    UNION SELECT 'user:' || user_id || ':events' FROM old_rows));
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM data_versions_bump(ARRAY(
+                    SELECT 'event:' || event_id || ':subscribers' FROM new_rows
+                    UNION SELECT 'user:' || user_id || ':events' FROM new_rows));
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        -- Only columns the read endpoints return; subscriber_count churn does not bump 'events'
+        DROP TRIGGER IF EXISTS events_data_version ON events;
+        CREATE TRIGGER events_data_version
+            AFTER INSERT OR DELETE OR UPDATE OF user_id, title, description, event_date, created_at ON events
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_table_changed('events');
+
+        DROP TRIGGER IF EXISTS users_data_version ON users;
+        CREATE TRIGGER users_data_version
+            AFTER DELETE OR UPDATE OF name, email ON users
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_table_changed('users');
+
+        DROP TRIGGER IF EXISTS notifications_data_version_insert ON notifications;
+        CREATE TRIGGER notifications_data_version_insert
+            AFTER INSERT ON notifications
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_subscriptions_changed();
+
+        DROP TRIGGER IF EXISTS notifications_data_version_delete ON notifications;
+        CREATE TRIGGER notifications_data_version_delete
+            AFTER DELETE ON notifications
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_subscriptions_changed();
+
+        DROP TRIGGER IF EXISTS notifications_data_version_update ON notifications;
+        CREATE TRIGGER notifications_data_version_update
+            AFTER UPDATE ON notifications
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_subscriptions_changed();
+
+        -- Per-row scopes are unknown after a TRUNCATE, so it invalidates every stamp via 'all'
+        DROP TRIGGER IF EXISTS data_version_truncate ON events;
+        CREATE TRIGGER data_version_truncate AFTER TRUNCATE ON events
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_table_changed();
+        DROP TRIGGER IF EXISTS data_version_truncate ON users;
+        CREATE TRIGGER data_version_truncate AFTER TRUNCATE ON users
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_table_changed();
+        DROP TRIGGER IF EXISTS data_version_truncate ON notifications;
+        CREATE TRIGGER data_version_truncate AFTER TRUNCATE ON notifications
+            FOR EACH STATEMENT EXECUTE FUNCTION data_versions_table_changed();
+    """),
+
+    (7, "Per-user event date index for calendar range queries", """
+        -- Copy of events.event_date so a user's events in a date range are one index range scan
+        -- on (user_id, event_date) instead of joining every subscription and filtering
+        ALTER TABLE notifications ADD COLUMN IF NOT EXISTS event_date DATE;
+
+        UPDATE notifications n
+        SET event_date = e.event_date
+        FROM events e
+        WHERE e.event_id = n.event_id
+          AND n.event_date IS DISTINCT FROM e.event_date;
+
+        CREATE OR REPLACE FUNCTION notifications_copy_event_date() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF NEW.event_date IS NULL THEN
+                SELECT event_date INTO NEW.event_date FROM events WHERE event_id = NEW.event_id;
+            END IF;
+            RETURN NEW;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS notifications_event_date ON notifications;
+        CREATE TRIGGER notifications_event_date
+            BEFORE INSERT ON notifications
+            FOR EACH ROW EXECUTE FUNCTION notifications_copy_event_date();
+
+        CREATE OR REPLACE FUNCTION events_sync_notification_dates() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE notifications SET event_date = NEW.event_date WHERE event_id = NEW.event_id;
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS events_notification_dates ON events;
+        CREATE TRIGGER events_notification_dates
+            AFTER UPDATE OF event_date ON events
+            FOR EACH ROW
+            WHEN (OLD.event_date IS DISTINCT FROM NEW.event_date)
+            EXECUTE FUNCTION events_sync_notification_dates();
+
+        -- getUserEvents from/to/upcoming and the calendar feed, already in date order
+        CREATE INDEX IF NOT EXISTS notifications_user_date_idx
+            ON notifications (user_id, event_date, event_id);
+    """),
+
+    (8, "Full-text search over event titles and descriptions", """
+        -- Kept current by Postgres itself; titles weigh more than descriptions in the ranking.
+        -- The two-argument to_tsvector is immutable, as a generated column requires.
+        ALTER TABLE events ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(description, '')), 'B')
+            ) STORED;
+
+        CREATE INDEX IF NOT EXISTS events_search_idx ON events USING GIN (search_vector);
+    """),
+
+    (9, "Publish event changes for the realtime change feed", """
+        -- One NOTIFY per statement, sent only if the transaction commits. Ids are listed
+        -- for small changes; bulk ones carry just the count and listeners reload.
+        CREATE OR REPLACE FUNCTION events_publish_changes() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            ids INT[];
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                SELECT array_agg(event_id ORDER BY event_id) INTO ids FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT array_agg(event_id ORDER BY event_id) INTO ids FROM old_rows;
+            ELSIF TG_OP = 'UPDATE' THEN
+                -- subscriber_count upkeep updates events on every (un)subscribe; only real edits count
+                SELECT array_agg(n.event_id ORDER BY n.event_id) INTO ids
+                FROM new_rows n JOIN old_rows o USING (event_id)
+                WHERE (n.user_id, n.title, n.description, n.event_date)
+                      IS DISTINCT FROM (o.user_id, o.title, o.description, o.event_date);
+            END IF;
+            IF TG_OP <> 'TRUNCATE' AND ids IS NULL THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('meetez_event_changes', json_build_object(
+                'op', lower(TG_OP),
+                'count', coalesce(cardinality(ids), 0),
+                'event_ids', CASE WHEN cardinality(ids) <= 100 THEN ids END
+            )::text);
+            RETURN NULL;
+        END;
+        $$;
+
+        DROP TRIGGER IF EXISTS events_changes_insert ON events;
+        CREATE TRIGGER events_changes_insert AFTER INSERT ON events
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION events_publish_changes();
+        DROP TRIGGER IF EXISTS events_changes_update ON events;
+        CREATE TRIGGER events_changes_update AFTER UPDATE ON events
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION events_publish_changes();
+        DROP TRIGGER IF EXISTS events_changes_delete ON events;
+        CREATE TRIGGER events_changes_delete AFTER DELETE ON events
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION events_publish_changes();
+        DROP TRIGGER IF EXISTS events_changes_truncate ON events;
+        CREATE TRIGGER events_changes_truncate AFTER TRUNCATE ON events
+            FOR EACH STATEMENT EXECUTE FUNCTION events_publish_changes();
+    """),
+    (10, "Plain-text notification bodies and per-recipient personalization", """
+        ALTER TABLE notification_jobs ADD COLUMN IF NOT EXISTS text_body TEXT;
+        ALTER TABLE notification_outbox ADD COLUMN IF NOT EXISTS user_id INT;
+        -- Rows queued before this migration only knew the address
+        UPDATE notification_outbox o
+        SET user_id = u.user_id
+        FROM users u
+        WHERE o.user_id IS NULL AND o.status = 'pending' AND u.email = o.email;
+    """),
+
+    (11, "Lock events in order when maintaining subscriber counts", """
+        -- Overlapping bulk (un)subscribes used to lock their events rows in whatever order the
+        -- UPDATE joined them, and deadlocked. Lock them sorted first, as data_versions_bump does;
+        -- NO KEY UPDATE is the lock the UPDATE takes, so foreign key checks are not blocked.
+        CREATE OR REPLACE FUNCTION notifications_maintain_counts() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM 1 FROM events
+                WHERE event_id IN (SELECT event_id FROM old_rows)
+                ORDER BY event_id
+                FOR NO KEY UPDATE;
+                UPDATE events e
+                SET subscriber_count = e.subscriber_count - d.n
+                FROM (SELECT event_id, COUNT(*) AS n FROM old_rows GROUP BY event_id) d
+                WHERE e.event_id = d.event_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM 1 FROM events
+                WHERE event_id IN (SELECT event_id FROM new_rows)
+                ORDER BY event_id
+                FOR NO KEY UPDATE;
+                UPDATE events e
+                SET subscriber_count = e.subscriber_count + d.n
+                FROM (SELECT event_id, COUNT(*) AS n FROM new_rows GROUP BY event_id) d
+                WHERE e.event_id = d.event_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+    """),
+]
+
+
+def _appliedVersions(cur):
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        return set()
+    cur.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def pendingMigrations(conn):
+    """Migrations not yet recorded in ``schema_migrations``."""
+    cur = conn.cursor()
+    applied = _appliedVersions(cur)
+    cur.close()
+    conn.rollback()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def runMigrations(conn):
+    """Apply every pending migration in one transaction; returns the versions applied."""
+    if not pendingMigrations(conn):
+        return []
+
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        # Re-check under the lock in case another worker migrated first
+        applied = _appliedVersions(cur)
+        done = []
+        for version, description, sql in MIGRATIONS:
+            if version in applied:
+                continue
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s);",
+                        (version, description))
+            done.append(version)
+        conn.commit()
+        return done
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
@@ -0,0 +1,114 @@
+"""
+Email transports for the notification outbox.
+
+The outbox drainers (outbox.py) hand each batch of recipients to a transport,
+which sends it as a single SendGrid API call (one personalization per
+recipient, so nobody sees anyone else's address) over one shared client. A
+failed batch raises TransportError; the drainer retries it with backoff.
+
+A recipient is an address or a Recipient carrying its own substitutions and
+headers. The body is sent once per batch, and SendGrid fills each recipient's
+tokens server-side.
+"""
+
+# notifier.py
+import threading
+import time
+from collections import namedtuple
+
+from emailtemplates import personalize
+
+# SendGrid accepts at most 1000 personalizations per request
+MAX_BATCH_SIZE = 1000
+
+
+# substitutions: {token: value} (emailtemplates.recipientValues); headers: extra mail headers
+Recipient = namedtuple("Recipient", "email substitutions headers", defaults=((), ()))
+
+
+def recipientEmail(recipient):
+    return recipient.email if isinstance(recipient, Recipient) else recipient
+
+
+class TransportError(Exception):
+    """A batch could not be delivered; ``retryable`` says whether trying again may help."""
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class SendGridTransport:
+    """Sends one message to many recipients per API call over a single reused client."""
+    def __init__(self, api_key, sender):
+        from sendgrid import SendGridAPIClient
+        self.client = SendGridAPIClient(api_key)
+        self.sender = sender
+
+    def buildMessage(self, subject, body, recipients, text=None):
+        from sendgrid.helpers.mail import Header, Mail, Personalization, Substitution, To
+        message = Mail(from_email=self.sender, subject=subject, html_content=body,
+                       plain_text_content=text)
+        for recipient in recipients:
+            personalization = Personalization()
+            personalization.add_to(To(recipientEmail(recipient)))
+            if isinstance(recipient, Recipient):
+                for token, value in dict(recipient.substitutions).items():
+                    personalization.add_substitution(Substitution(token, value))
+                for name, value in dict(recipient.headers).items():
+                    personalization.add_header(Header(name, value))
+            message.add_personalization(personalization)
+        return message
+
+    def sendBatch(self, subject, body, recipients, text=None):
+        try:
+            response = self.client.send(self.buildMessage(subject, body, recipients, text))
+        except Exception as e:
+            # python_http_client raises HTTPError subclasses carrying the status code
+            status = getattr(e, "status_code", None)
+            retryable = status is None or status == 429 or status >= 500
+            raise TransportError(f"SendGrid error {status}: {e}", retryable=retryable) from e
+        if response.status_code >= 300:
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise TransportError(f"SendGrid returned {response.status_code}", retryable=retryable)
+        return response.status_code
+
+
+class FakeTransport:
+    """In-memory transport for offline use and tests; records every batch it is given."""
+    def __init__(self, fail_times=0, latency=0.0):
+        self.sent = []
+        self.calls = 0
+        self.fail_times = fail_times  # fail this many calls before succeeding
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def sendBatch(self, subject, body, recipients, text=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise TransportError("Simulated transport failure")
+            recipients = list(recipients)
+            self.sent.append({
+                "subject": subject, "body": body, "text": text,
+                "recipients": [recipientEmail(r) for r in recipients],
+                "substitutions": {r.email: dict(r.substitutions) for r in recipients
+                                  if isinstance(r, Recipient)},
+            })
+        return 202
+
+    def recipients(self):
+        with self._lock:
+            return [r for batch in self.sent for r in batch["recipients"]]
+
+    def messageFor(self, email):
+        """The last message sent to ``email`` as (subject, html, text) after substitution, or None."""
+        with self._lock:
+            for batch in reversed(self.sent):
+                if email in batch["recipients"]:
+                    subs = batch["substitutions"].get(email, {})
+                    return (personalize(batch["subject"], subs), personalize(batch["body"], subs),
+                            personalize(batch["text"], subs))
+        return None
@@ -0,0 +1,337 @@
+"""
+Transactional outbox for notification emails.
+
+``enqueueNotification`` is called on the same cursor (and so in the same
+transaction) as the event UPDATE: one ``notification_jobs`` row holds the
+message and one ``notification_outbox`` row per subscriber records who still
+has to receive it. Drainers claim pending rows with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so any number of them, in this process
+or in separate ``python outbox.py`` processes, share the work without two of
+them sending the same row.
+
+Delivery is at-least-once: a drainer sends while holding the row locks and
+marks the rows sent when it commits afterwards, so a crash or lost connection
+between the two leaves the rows pending and that batch is sent again.
+
+The job stores the message rendered once (emailtemplates.render) with the
+recipient fields left as tokens. Each claimed row only adds that recipient's
+name and signed unsubscribe link as substitutions.
+"""
+
+# outbox.py
+import argparse
+import logging
+import threading
+import time
+import uuid
+
+from emailtemplates import recipientValues
+from notifier import MAX_BATCH_SIZE, Recipient, TransportError
+
+logger = logging.getLogger(__name__)
+
+CLAIM_SQL = """
+    SELECT o.outbox_id, o.job_id, o.email, o.attempts, o.user_id, u.name
+    FROM notification_outbox o
+    LEFT JOIN users u ON u.user_id = o.user_id
+    WHERE o.status = 'pending' AND o.available_at <= CURRENT_TIMESTAMP
+    ORDER BY o.outbox_id
+    LIMIT %s
+    FOR UPDATE OF o SKIP LOCKED;
+"""
+
+
+# Take over the unsent rows of earlier jobs for the same event. Rows a drainer holds
+# right now are skipped and still go out; their recipients also get the new job.
+# Returns when the oldest superseded edit was made (NULL if nothing was pending).
+SUPERSEDE_SQL = """
+    WITH dropped AS (
+        DELETE FROM notification_outbox
+        WHERE outbox_id IN (
+            SELECT o.outbox_id
+            FROM notification_outbox o
+            JOIN notification_jobs j ON j.job_id = o.job_id
+            WHERE j.event_id = %s AND o.status = 'pending'
+            FOR UPDATE OF o SKIP LOCKED
+        )
+        RETURNING job_id
+    ), superseded AS (
+        UPDATE notification_jobs
+        SET superseded_by = %s
+        WHERE job_id IN (SELECT job_id FROM dropped)
+        RETURNING pending_since
+    )
+    SELECT MIN(pending_since) FROM superseded;
+"""
+# Returns when the job becomes due: ``debounce`` seconds from now, but never more
+# than ``max_wait`` seconds after the first edit still waiting to go out
+ENQUEUE_JOB_SQL = """
+    INSERT INTO notification_jobs (job_id, event_id, subject, body, text_body, pending_since)
+    VALUES (%s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    RETURNING LEAST(CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+                    pending_since + %s * INTERVAL '1 second');
+"""
+ENQUEUE_RECIPIENTS_SQL = """
+    INSERT INTO notification_outbox (job_id, email, user_id, available_at)
+    SELECT %s, u.email, u.user_id, %s
+    FROM notifications n
+    JOIN users u ON n.user_id = u.user_id
+    WHERE n.event_id = %s
+    ON CONFLICT (job_id, email) DO NOTHING;
+"""
+JOB_SQL = """
+    SELECT j.event_id, j.created_at, j.superseded_by,
+           (SELECT MIN(available_at) FROM notification_outbox o
+            WHERE o.job_id = j.job_id AND o.status = 'pending') AS send_after
+    FROM notification_jobs j
+    WHERE j.job_id = %s;
+"""
+JOB_COUNTS_SQL = """
+    SELECT status, COUNT(*)
+    FROM notification_outbox
+    WHERE job_id = %s
+    GROUP BY status;
+"""
+
+
+def enqueueSteps(event_id, message, debounce=0.0, max_wait=0.0):
+    """The statements behind enqueueNotification, for either database driver.
+
+    Yields ``(sql, params)`` for the caller to execute, and expects back
+    ``(first row or None, rowcount)``; returns ``(job_id, recipient_count)``.
+    """
+    job_id = uuid.uuid4().hex
+    row, _ = yield SUPERSEDE_SQL, (event_id, job_id)
+    pending_since = row[0]
+    row, _ = yield ENQUEUE_JOB_SQL, (job_id, event_id, message.subject, message.html, message.text,
+                                     pending_since, debounce, max(max_wait, debounce))
+    available_at = row[0]
+    _, recipients = yield ENQUEUE_RECIPIENTS_SQL, (job_id, available_at, event_id)
+    return job_id, recipients
+
+
+def enqueueNotification(cur, event_id, message, debounce=0.0, max_wait=0.0):
+    """Record a notification for every subscriber of ``event_id`` inside the caller's transaction.
+
+    Any earlier job for the event that has not gone out yet is superseded, so a
+    burst of edits collapses into one email with the final content, sent
+    ``debounce`` seconds after the last edit (or ``max_wait`` after the first).
+    ``message`` is an emailtemplates.Message. Returns ``(job_id, recipient_count)``;
+    nothing is sent until the transaction commits and a drainer picks the rows up.
+    """
+    steps, result = enqueueSteps(event_id, message, debounce, max_wait), None
+    try:
+        while True:
+            sql, params = steps.send(result)
+            cur.execute(sql, params)
+            result = (cur.fetchone() if cur.description else None, cur.rowcount)
+    except StopIteration as done:
+        return done.value
+
+
+async def enqueueNotificationAsync(conn, event_id, message, debounce=0.0, max_wait=0.0):
+    """enqueueNotification on a psycopg 3 async connection (asgi.py)."""
+    steps, result = enqueueSteps(event_id, message, debounce, max_wait), None
+    try:
+        while True:
+            sql, params = steps.send(result)
+            cur = await conn.execute(sql, params)
+            result = (await cur.fetchone() if cur.description else None, cur.rowcount)
+    except StopIteration as done:
+        return done.value
+
+
+def summarizeJob(job_id, job, counts):
+    """Build the job status payload from its notification_jobs row and per-status counts."""
+    pending, sent, failed = counts.get("pending", 0), counts.get("sent", 0), counts.get("failed", 0)
+    if job[2]:
+        status = "superseded"
+    elif pending:
+        status = "queued"
+    elif failed and sent:
+        status = "partial"
+    elif failed:
+        status = "failed"
+    else:
+        status = "sent"
+    return {
+        "job_id": job_id,
+        "event_id": job[0],
+        "created_at": str(job[1]),
+        "status": status,
+        "total": pending + sent + failed,
+        "pending": pending,
+        "sent": sent,
+        "failed": failed,
+        "superseded_by": job[2],
+        "send_after": str(job[3]) if job[3] else None,
+    }
+
+
+def jobStatus(conn, job_id):
+    """Per-status recipient counts for a job, or None if the job does not exist."""
+    cur = conn.cursor()
+    cur.execute(JOB_SQL, (job_id,))
+    job = cur.fetchone()
+    if job is None:
+        cur.close()
+        return None
+    cur.execute(JOB_COUNTS_SQL, (job_id,))
+    counts = dict(cur.fetchall())
+    cur.close()
+    return summarizeJob(job_id, job, counts)
+
+
+def recipientFor(email, name, user_id, event_id, links=None):
+    """The Recipient for one outbox row: its substitutions plus one-click unsubscribe headers."""
+    if links is None or user_id is None:
+        return Recipient(email, recipientValues(name))
+    url = links.url(user_id, event_id)
+    return Recipient(email, recipientValues(name, url),
+                     {"List-Unsubscribe": f"<{url}>", "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"})
+
+
+def drainOnce(conn, transport, batch_size=500, max_attempts=5, backoff=2.0, links=None):
+    """Claim up to ``batch_size`` due rows, deliver them and record the outcome.
+
+    ``links`` (emailtemplates.UnsubscribeLinks) signs each recipient's unsubscribe
+    link; without it the link points at the dashboard. Row locks are held until the final commit, so concurrent drainers skip these
+    rows instead of sending them twice. Returns the number of rows claimed.
+    """
+    cur = conn.cursor()
+    cur.execute(CLAIM_SQL, (batch_size,))
+    claimed = cur.fetchall()
+    if not claimed:
+        conn.rollback()
+        cur.close()
+        return 0
+
+    by_job = {}
+    for outbox_id, job_id, email, attempts, user_id, name in claimed:
+        by_job.setdefault(job_id, []).append((outbox_id, email, user_id, name))
+
+    cur.execute("""
+        SELECT job_id, event_id, subject, body, text_body
+        FROM notification_jobs
+        WHERE job_id = ANY(%s);
+    """, (list(by_job),))
+    messages = {row[0]: row[1:] for row in cur.fetchall()}
+
+    for job_id, rows in by_job.items():
+        event_id, subject, body, text = messages[job_id]
+        for i in range(0, len(rows), MAX_BATCH_SIZE):
+            chunk = rows[i:i + MAX_BATCH_SIZE]
+            ids = [row[0] for row in chunk]
+            recipients = [recipientFor(email, name, user_id, event_id, links)
+                          for _, email, user_id, name in chunk]
+            try:
+                transport.sendBatch(subject, body, recipients, text)
+            except TransportError as e:
+                # Failed rows go back to pending with exponential backoff until max_attempts
+                cur.execute("""
+                    UPDATE notification_outbox
+                    SET attempts = attempts + 1,
+                        last_error = %s,
+                        status = CASE WHEN %s OR attempts + 1 >= %s THEN 'failed' ELSE 'pending' END,
+                        available_at = CURRENT_TIMESTAMP + make_interval(secs => %s * power(2, attempts))
+                    WHERE outbox_id = ANY(%s);
+                """, (str(e)[:1000], not e.retryable, max_attempts, backoff, ids))
+                continue
+            cur.execute("""
+                UPDATE notification_outbox
+                SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP
+                WHERE outbox_id = ANY(%s);
+            """, (ids,))
+
+    conn.commit()
+    cur.close()
+    return len(claimed)
+
+
+class OutboxDrainer:
+    """Worker threads that drain the outbox, woken early whenever new rows are committed."""
+    def __init__(self, getConnection, transport, workers=1, batch_size=500,
+                 poll_interval=5.0, max_attempts=5, backoff=2.0, links=None):
+        self.getConnection = getConnection
+        self.transport = transport
+        self.links = links
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"outbox-drainer-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def wake(self):
+        """Signal that new rows were committed so an idle worker drains them now."""
+        self.start()
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def drain(self):
+        """Drain until no due rows remain; returns the number of rows processed."""
+        total = 0
+        while not self._stop.is_set():
+            with self.getConnection() as conn:
+                claimed = drainOnce(conn, self.transport, self.batch_size,
+                                    self.max_attempts, self.backoff, self.links)
+            total += claimed
+            if claimed < self.batch_size:
+                return total
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception as e:
+                logger.exception("Outbox drainer error: %s", e)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver pending notification emails from the outbox.")
+    parser.add_argument("--workers", type=int, default=4, help="parallel drainer threads")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows claimed per transaction")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between polls when idle")
+    parser.add_argument("--once", action="store_true", help="drain what is due and exit")
+    args = parser.parse_args()
+
+    from adapter import adapter, getConnection
+    drainer = OutboxDrainer(getConnection, adapter.transport, workers=args.workers,
+                            batch_size=args.batch_size, poll_interval=args.poll_interval,
+                            links=adapter.unsubscribeLinks)
+    if args.once:
+        print(f"Delivered {drainer.drain()} outbox rows.")
+        return
+
+    drainer.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        drainer.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Bounded, thread-safe connection pool used by the Adapter singleton.
+
+Routes borrow a connection with ``with pool.connection() as conn:`` and it is
+handed back (rolled back to a clean state) when the block exits, instead of
+paying a fresh TCP/TLS/auth handshake against Postgres on every request.
+"""
+
+# pool.py
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolError(Exception):
+    """Raised when a connection cannot be checked out of the pool."""
+
+
+class PoolTimeout(PoolError):
+    """Raised when every connection is in use for longer than the checkout timeout."""
+
+
+class ConnectionPool:
+    def __init__(self, connect, minconn=1, maxconn=10, timeout=30.0,
+                 max_idle=300.0, ping_after=30.0, reap_interval=60.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("ERROR: Invalid pool size (need 0 <= minconn <= maxconn, maxconn >= 1)")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        # Connections idle for longer than this are pinged before being handed out
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, last_used) pairs, most recently used on the right
+        self._in_use = set()
+        self._size = 0  # open connections plus slots reserved by in-flight connects
+        self._waiting = 0
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "connect_errors": 0,
+            "discarded": 0,
+            "reaped": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+        self._reaper = None
+        if reap_interval:
+            self._reaper = threading.Thread(target=self._reapLoop, args=(reap_interval,),
+                                            name="db-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    # --- checkout / checkin -------------------------------------------------
+
+    def getconn(self, timeout=None):
+        """Borrow a connection, waiting up to ``timeout`` seconds for one to free up."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"Timed out after {timeout}s waiting for a database connection")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    # Reserve the slot now so concurrent callers respect maxconn
+                    self._size += 1
+                    create = True
+
+            if create:
+                conn = self._open()
+            elif not self._healthy(conn, last_used):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - start
+            with self._cond:
+                self._in_use.add(id(conn))
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a borrowed connection; broken or discarded connections are closed."""
+        with self._cond:
+            self._in_use.discard(id(conn))
+        if discard or self._closed or _isClosed(conn):
+            self._discard(conn)
+            return
+        try:
+            # No-op without an open transaction, otherwise leaves the connection clean
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that borrows a connection and always gives it back."""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = _isClosed(conn)
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    # --- housekeeping -------------------------------------------------------
+
+    def _open(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            with self._cond:
+                self._size -= 1
+                self._stats["connect_errors"] += 1
+                self._cond.notify()
+            raise PoolError(f"Database connection failed: {e}") from e
+        with self._cond:
+            self._stats["connects"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def _healthy(self, conn, last_used):
+        if _isClosed(conn):
+            return False
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def reap(self):
+        """Close idle connections beyond ``minconn`` that have sat unused past ``max_idle``."""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            keep = deque()
+            while self._idle:
+                conn, last_used = self._idle.popleft()
+                if now - last_used > self.max_idle and self._size - len(expired) > self.minconn:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            self._idle = keep
+            self._stats["reaped"] += len(expired)
+        for conn in expired:
+            self._discard(conn)
+        return len(expired)
+
+    def fill(self):
+        """Open connections until ``minconn`` are available (used to pre-warm a worker)."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minconn:
+                    return
+                self._size += 1
+            conn = self._open()
+            with self._cond:
+                self._idle.appendleft((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _reapLoop(self, interval):
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception:
+                pass
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    # --- metrics ------------------------------------------------------------
+
+    def stats(self):
+        """Snapshot of pool size and saturation counters."""
+        with self._cond:
+            in_use = len(self._in_use)
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "saturation": round(in_use / self.maxconn, 3),
+            })
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_time_avg"] = snapshot["wait_time_total"] / checkouts if checkouts else 0.0
+        return snapshot
+
+
+def _isClosed(conn):
+    # psycopg2 sets ``closed`` to non-zero once the server connection is gone
+    return bool(getattr(conn, "closed", False))
@@ -0,0 +1,295 @@
+"""
+Per-client rate limiting and admission control for the API routes.
+
+Every request is charged to a token bucket keyed by route and client IP
+address. The ``user_id`` a request names is not used: the API does not
+authenticate it, so anyone could empty another user's bucket by sending
+that user's id. An empty bucket is answered with ``429`` and a ``Retry-After``
+of the seconds until the next token. Limits are ``count/seconds[:burst]`` per
+route, with a ``default`` for routes not listed; RATE_LIMITS overrides them,
+e.g. ``/updateEvent=10/60:3,default=off``.
+
+Buckets live in the RATE_LIMIT_BACKEND: ``local`` (per worker), ``redis``
+(shared by every worker; needs the optional ``redis`` package), ``fake`` (an
+in-memory stand-in for redis) or ``none``. With several gunicorn workers and
+the local backend each worker enforces the limit separately.
+
+Expensive routes (bulk writes, exports, notification fan-out) are also
+capped at MAX_EXPENSIVE_REQUESTS in flight per worker (``0`` = no cap).
+Requests beyond the cap get ``503`` straight away rather than queueing for a
+pool connection, so overload sheds load instead of piling up.
+"""
+
+# ratelimit.py
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from services import ServiceError
+
+DEFAULT_LIMITS = {
+    "/updateEvent": "20/60:5",  # every update can email all of an event's subscribers
+    "/addEvent": "60/60:20",
+    "/addUser": "60/60:20",
+    "/addEvents": "10/60:5",
+    "/addUsers": "10/60:5",
+    "/subscribeEvents": "10/60:5",
+    "/subscribeMany": "10/60:5",
+    "/unsubscribeMany": "10/60:5",
+    "/export/events": "10/60:3",
+    "/export/subscribers": "10/60:3",
+    "default": "1200/60:200",
+}
+EXPENSIVE_ROUTES = ("/updateEvent", "/addEvents", "/addUsers", "/subscribeEvents", "/subscribeMany",
+                    "/unsubscribeMany", "/export/events", "/export/subscribers", "/getEventsTable")
+# Never limited: scrapes and the dashboard's static files. Its callbacks are limited like any
+# route, and the writes they make in-process are charged to the API route (apiclient.LocalClient)
+EXEMPT_PREFIXES = ("/metrics", "/dashboard/assets/", "/dashboard/_dash-component-suites/",
+                   "/dashboard/_favicon.ico")
+
+
+class RateLimited(ServiceError):
+    """Too many requests; ``retry_after`` is the seconds until the client may retry."""
+    def __init__(self, message, retry_after, status=429):
+        super().__init__(message, status)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Limit:
+    """``count`` requests per ``seconds``, allowing bursts of up to ``burst``."""
+    def __init__(self, count, seconds, burst=None):
+        self.count, self.seconds = count, seconds
+        self.rate = count / seconds  # tokens added per second
+        self.burst = burst or count
+
+    @classmethod
+    def parse(cls, spec):
+        """``count/seconds[:burst]``; ``off`` means no limit (returns None)."""
+        if spec.strip().lower() in ("off", "none", ""):
+            return None
+        try:
+            rate, _, burst = spec.partition(":")
+            count, seconds = rate.split("/")
+            limit = cls(int(count), float(seconds), int(burst) if burst else None)
+            if limit.count < 1 or limit.seconds <= 0 or limit.burst < 1:
+                raise ValueError
+            return limit
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {spec!r}; expected count/seconds[:burst]")
+
+
+def _refill(tokens, updated_at, now, limit):
+    """Bucket arithmetic shared by the in-process backends: (new tokens, seconds to wait)."""
+    if tokens is None:
+        tokens = limit.burst
+    else:
+        tokens = min(limit.burst, tokens + max(0.0, now - updated_at) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.rate
+
+
+class LocalBackend:
+    """Buckets in this process, LRU-bounded so one-off clients don't accumulate forever."""
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        """Spend one token; returns 0 if allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (None, now))
+            tokens, wait = _refill(tokens, updated_at, now, limit)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "local", "keys": len(self._buckets)}
+
+
+class FakeSharedBackend:
+    """In-memory stand-in for the Redis backend.
+
+    State is stored as text against wall-clock time and updated under one lock,
+    as the Redis script does atomically, so behaviour matches a shared store.
+    """
+    def __init__(self):
+        self._store = {}  # key -> "tokens updated_at"
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        now = time.time()
+        with self._lock:
+            state = self._store.get(key)
+            tokens, updated_at = (float(v) for v in state.split()) if state else (None, now)
+            tokens, wait = _refill(tokens, updated_at, now, limit)
+            self._store[key] = f"{tokens!r} {now!r}"
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "fake", "keys": len(self._store)}
+
+
+class RedisBackend:
+    """Buckets shared by every worker in Redis (needs the optional ``redis`` package)."""
+    # Runs atomically on the server and uses the server's clock, so workers never race
+    TAKE_SCRIPT = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+        return tostring(wait)
+    """
+
+    def __init__(self, url, prefix="meetez:rl:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, limit):
+        return float(self._take(keys=[self.prefix + key], args=[limit.rate, limit.burst]))
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+class Gate:
+    """Non-blocking cap on concurrent requests; ``enter()`` is False when full."""
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            if self.active >= self.limit:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"active": self.active, "limit": self.limit, "rejected": self.rejected}
+
+
+class RateLimiter:
+    """Per-route limits over a bucket backend, plus the expensive-route gate."""
+    def __init__(self, backend, limits, expensive=EXPENSIVE_ROUTES, max_expensive=8):
+        self.backend = backend
+        self.limits = {route: Limit.parse(spec) for route, spec in limits.items()}
+        self.expensive = frozenset(expensive)
+        self.gate = Gate(max_expensive)
+        self.limited = 0
+
+    def limitFor(self, route):
+        if route.startswith(EXEMPT_PREFIXES):
+            return None
+        return self.limits.get(route, self.limits.get("default"))
+
+    def check(self, route, clients):
+        """Charge one request on ``route`` to each of ``clients`` (see clientKeys).
+
+        Raises RateLimited as soon as one of the buckets is empty.
+        """
+        limit = self.limitFor(route)
+        if limit is None or self.backend is None:
+            return
+        for client in clients:
+            wait = self.backend.take(f"{route}|{client}", limit)
+            if wait > 0:
+                self.limited += 1
+                metrics.RATE_LIMITED.inc(route=route, status=429)
+                raise RateLimited(f"Rate limit exceeded for {route}: {limit.count} requests per "
+                                  f"{limit.seconds:g}s. Retry later.", wait)
+
+    def admit(self, route):
+        """Take a slot if ``route`` is expensive; returns True if the caller must leave() it."""
+        if route not in self.expensive or self.gate.limit <= 0:
+            return False
+        if not self.gate.enter():
+            metrics.RATE_LIMITED.inc(route=route, status=503)
+            raise RateLimited("Server is busy; retry shortly.", 1, status=503)
+        return True
+
+    def leave(self):
+        self.gate.leave()
+
+    def stats(self):
+        stats = {"limited": self.limited}
+        stats.update({f"expensive_{k}": v for k, v in self.gate.stats().items()})
+        stats.update(self.backend.stats() if self.backend is not None else {"backend": "none"})
+        return stats
+
+
+def clientAddress(access_route, remote_addr):
+    """``ip:<address>`` of the client.
+
+    Behind TRUSTED_PROXIES reverse proxies (e.g. 1 on Azure App Service) the
+    address is taken from X-Forwarded-For, counting from the right so a client
+    cannot spoof it.
+    """
+    hops = int(os.environ.get("TRUSTED_PROXIES", 0))
+    if hops and len(access_route) >= hops:
+        return f"ip:{access_route[-hops]}"
+    return f"ip:{remote_addr}"
+
+
+def clientKeys(access_route, remote_addr, authenticated_user=None):
+    """Buckets a request is charged to: its address, plus ``user:<id>`` for an authenticated user.
+
+    Only pass ``authenticated_user`` once the identity is verified; a user_id
+    taken from the request would let any client charge someone else's bucket.
+    """
+    address = clientAddress(access_route, remote_addr)
+    if authenticated_user in (None, ""):
+        return (address,)
+    return (address, f"user:{authenticated_user}")
+
+
+def buildLimiter():
+    """Create the limiter from RATE_LIMIT_BACKEND, RATE_LIMITS and MAX_EXPENSIVE_REQUESTS."""
+    kind = os.environ.get("RATE_LIMIT_BACKEND", "local").lower()
+    if kind == "none":
+        backend = None
+    elif kind == "fake":
+        backend = FakeSharedBackend()
+    elif kind == "redis":
+        url = os.environ.get("RATE_LIMIT_URL") or os.environ.get("CACHE_URL", "redis://localhost:6379/0")
+        backend = RedisBackend(url)
+    else:
+        backend = LocalBackend()
+
+    limits = dict(DEFAULT_LIMITS)
+    for item in os.environ.get("RATE_LIMITS", "").split(","):
+        if item.strip():
+            route, _, spec = item.partition("=")
+            limits[route.strip()] = spec
+    expensive = os.environ.get("EXPENSIVE_ROUTES")
+    expensive = [r.strip() for r in expensive.split(",") if r.strip()] if expensive else EXPENSIVE_ROUTES
+    return RateLimiter(backend, limits, expensive, int(os.environ.get("MAX_EXPENSIVE_REQUESTS", 8)))
+
+
+limiter = buildLimiter()
@@ -0,0 +1,272 @@
+"""
+Read-replica routing for the Adapter.
+
+With DB_REPLICAS set, connections borrowed with ``readonly=True`` go to a
+replica, each of which has its own pool; everything else uses the primary.
+Replicas are picked by DB_REPLICA_POLICY, ``round_robin`` (default) or
+``least_connections`` (fewest connections currently borrowed).
+
+A monitor thread checks every replica each DB_REPLICA_CHECK_INTERVAL
+seconds. One that is down, or more than DB_REPLICA_MAX_LAG seconds behind
+the primary, is skipped until a later check finds it healthy again; with no
+healthy replica, reads fall back to the primary.
+
+Reads are pinned per request: every read-only connection in one request uses
+the same server, so an ETag read before the body is never newer than it. A
+client that has just written reads from the primary for DB_STICKY_SECONDS
+(read-your-writes). The client is remembered here and, because this is per
+worker, the app also hands it a cookie that ``beginRequest`` honours.
+"""
+
+# replicas.py
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from pool import PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("round_robin", "least_connections")
+# Epoch time until which the client reads from the primary, set after each write
+STICKY_COOKIE = "meetez_primary_until"
+
+# Seconds the replica is behind: zero when it has replayed everything it received
+# (an idle primary sends nothing, so replay timestamps alone would look like lag).
+# After a restart the receive position restarts at a segment boundary, hence <=.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END;
+"""
+
+
+class Replica:
+    """One replica's pool plus the monitor's latest verdict on it."""
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = True  # optimistic until the first check says otherwise
+        self.lag = 0.0
+        self.error = None
+        self.active = 0  # connections currently borrowed through the router
+        self.checked_at = None
+        self.reads = 0
+
+    def stats(self):
+        pool = self.pool.stats()
+        return {"healthy": int(self.healthy), "lag_seconds": round(self.lag, 3), "active": self.active,
+                "reads": self.reads, "size": pool["size"], "in_use": pool["in_use"],
+                "connect_errors": pool["connect_errors"]}
+
+
+class StickyClients:
+    """Clients that wrote recently, LRU-bounded like the rate limiter's buckets."""
+    def __init__(self, seconds, max_keys=100000):
+        self.seconds = seconds
+        self.max_keys = max_keys
+        self._until = OrderedDict()  # client -> monotonic deadline
+        self._lock = threading.Lock()
+
+    def mark(self, client):
+        with self._lock:
+            self._until.pop(client, None)
+            self._until[client] = time.monotonic() + self.seconds
+            if len(self._until) > self.max_keys:
+                self._until.popitem(last=False)
+
+    def isSticky(self, client):
+        with self._lock:
+            until = self._until.get(client)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._until[client]
+                return False
+            return True
+
+    def __len__(self):
+        return len(self._until)
+
+
+class ReadContext:
+    """Per-request routing state: who is asking and which server their reads use."""
+    __slots__ = ("client", "sticky", "replica", "wrote")
+
+    def __init__(self, client, sticky):
+        self.client = client
+        self.sticky = sticky
+        self.replica = None
+        self.wrote = False
+
+
+_context = ContextVar("meetez_read_context", default=None)
+
+
+class ReplicaRouter:
+    def __init__(self, replicas, policy="round_robin", max_lag=5.0, sticky_seconds=5.0,
+                 check_interval=2.0, check_timeout=2.0):
+        if policy not in POLICIES:
+            raise ValueError(f"ERROR: DB_REPLICA_POLICY must be one of {', '.join(POLICIES)}")
+        self.replicas = list(replicas)
+        self.policy = policy
+        self.max_lag = max_lag
+        self.sticky_seconds = sticky_seconds
+        self.check_timeout = check_timeout
+        self.sticky = StickyClients(sticky_seconds)
+
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._closed = False
+        self._stats = {"replica_reads": 0, "primary_reads": 0, "sticky_reads": 0, "fallbacks": 0}
+
+        self._monitor = None
+        if check_interval:
+            self._monitor = threading.Thread(target=self._monitorLoop, args=(check_interval,),
+                                             name="db-replica-monitor", daemon=True)
+            self._monitor.start()
+
+    # --- requests -----------------------------------------------------------
+
+    def beginRequest(self, client, sticky_until=None):
+        """Start routing a request; returns the token to pass to endRequest.
+
+        ``sticky_until`` is the epoch time from the client's cookie, if any.
+        """
+        sticky = bool(sticky_until and sticky_until > time.time()) or (
+            client is not None and self.sticky.isSticky(client))
+        return _context.set(ReadContext(client, sticky))
+
+    def endRequest(self, token):
+        try:
+            _context.reset(token)
+        except ValueError:  # torn down in another context; just forget the request
+            _context.set(None)
+
+    def readsFromPrimary(self):
+        """True if the current request's reads go to the primary for read-your-writes."""
+        context = _context.get()
+        return context is not None and context.sticky
+
+    def wrote(self):
+        """True if the current request has written (so its client should stick to the primary)."""
+        context = _context.get()
+        return context is not None and context.wrote
+
+    def noteWrite(self):
+        """The current request used the primary for a write: keep its client there for a while."""
+        context = _context.get()
+        if context is None:
+            return
+        context.wrote = context.sticky = True
+        context.replica = None
+        if context.client is not None:
+            self.sticky.mark(context.client)
+
+    # --- selection ----------------------------------------------------------
+
+    def acquire(self):
+        """The replica for a read-only connection, or None to use the primary.
+
+        The caller must release() a returned replica.
+        """
+        context = _context.get()
+        with self._lock:
+            if context is not None and context.sticky:
+                self._stats["sticky_reads"] += 1
+                return None
+            replica = context.replica if context is not None else None
+            if replica is None or not replica.healthy:
+                replica = self._choose()
+            if replica is None:
+                self._stats["primary_reads"] += 1
+                return None
+            if context is not None:
+                context.replica = replica
+            replica.active += 1
+            replica.reads += 1
+            self._stats["replica_reads"] += 1
+            return replica
+
+    def _choose(self):
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        start = next(self._turn) % len(healthy)
+        rotated = healthy[start:] + healthy[:start]
+        if self.policy == "least_connections":
+            return min(rotated, key=lambda r: r.active)  # ties go round-robin
+        return rotated[0]
+
+    def release(self, replica):
+        with self._lock:
+            replica.active -= 1
+
+    def failed(self, replica, error):
+        """A checkout or query on ``replica`` failed: stop using it until the monitor clears it."""
+        with self._lock:
+            self._stats["fallbacks"] += 1
+            context = _context.get()
+            if context is not None and context.replica is replica:
+                context.replica = None
+            # Pool timeouts only mean the replica is busy; anything else means it is unreachable
+            if isinstance(error, PoolTimeout):
+                return
+            if replica.healthy:
+                logger.warning("Replica %s marked down: %s", replica.name, error)
+            replica.healthy = False
+            replica.error = str(error)
+
+    # --- health -------------------------------------------------------------
+
+    def check(self):
+        """Measure every replica's lag now and update which ones receive reads."""
+        for replica in self.replicas:
+            try:
+                with replica.pool.connection(timeout=self.check_timeout) as conn:
+                    cur = conn.cursor()
+                    cur.execute(LAG_SQL)
+                    lag = float(cur.fetchone()[0])
+                    cur.close()
+                error = None if lag <= self.max_lag else f"lagging {lag:.1f}s behind the primary"
+            except Exception as e:
+                lag, error = replica.lag, str(e)
+            with self._lock:
+                if error is None and not replica.healthy:
+                    logger.info("Replica %s is healthy again (lag %.2fs)", replica.name, lag)
+                elif error is not None and replica.healthy:
+                    logger.warning("Replica %s marked down: %s", replica.name, error)
+                replica.lag, replica.error = lag, error
+                replica.healthy = error is None
+                replica.checked_at = time.time()
+
+    def _monitorLoop(self, interval):
+        while not self._closed:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Replica health check failed")
+            time.sleep(interval)
+
+    def closeall(self):
+        self._closed = True
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+    # --- metrics ------------------------------------------------------------
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"replicas": len(self.replicas), "healthy": sum(r.healthy for r in self.replicas),
+                          "sticky_clients": len(self.sticky)})
+        return stats
+
+    def replicaStats(self):
+        """{replica name: its stats}, for /poolStats."""
+        return {replica.name: replica.stats() for replica in self.replicas}
@@ -0,0 +1,117 @@
+"""
+Typed row mapping and fast JSON encoding for the read endpoints.
+
+Each query's result shape is declared once here as a namedtuple, whose fields
+double as the SELECT column list and the JSON keys. ``recordMapper`` turns a
+list of DB-API rows into JSON-ready dicts in one compiled comprehension
+(no per-row index lookups or ``str()`` calls); dates stay ``date`` /
+``datetime`` objects and the encoder writes them as ISO 8601.
+
+Payloads stay dicts rather than record instances on purpose: orjson encodes
+dicts several times faster than slotted classes or namedtuples (which it would
+need a Python ``default`` hook for), and the dashboard reads them by key.
+
+``dumps`` uses orjson when it is installed and falls back to the standard
+library otherwise, producing the same JSON either way; JSON_ENCODER=stdlib
+forces the fallback. See benchmarks/bench_json.py for the numbers.
+"""
+
+# rows.py
+import json
+import os
+from collections import namedtuple
+from datetime import date, time
+
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is the fallback
+    orjson = None
+
+EventRow = namedtuple("EventRow", "event_id user_id title description event_date created_at")
+UserEventRow = namedtuple("UserEventRow", "event_id title description event_date created_at")
+SubscriberRow = namedtuple("SubscriberRow", "user_id name email")
+EventSubscriberRow = namedtuple("EventSubscriberRow", "event_id user_id name email")
+StatsRow = namedtuple("StatsRow", "event_id title event_date subscriber_count")
+SearchRow = namedtuple("SearchRow", EventRow._fields + ("rank",))
+
+
+def columns(row_type, alias=None):
+    """SELECT list for ``row_type``'s fields, optionally qualified by a table alias."""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + field for field in row_type._fields)
+
+
+def _dictLiteral(row_type):
+    return "{" + ", ".join(f"{field!r}: r[{i}]" for i, field in enumerate(row_type._fields)) + "}"
+
+
+def recordMapper(row_type):
+    """Compile ``rows -> [dict, ...]`` for rows laid out like ``row_type``.
+
+    Generated like namedtuple's own methods, so each row becomes a dict literal
+    instead of going through zip() or a per-field loop.
+    """
+    mapper = eval(f"lambda rows: [{_dictLiteral(row_type)} for r in rows]", {})
+    mapper.__name__ = f"map{row_type.__name__}s"
+    return mapper
+
+
+def recordOf(row_type):
+    """Single-row counterpart of recordMapper."""
+    mapper = eval(f"lambda r: {_dictLiteral(row_type)}", {})
+    mapper.__name__ = f"map{row_type.__name__}"
+    return mapper
+
+
+# --- encoding ---------------------------------------------------------------
+
+def _default(value):
+    if isinstance(value, (date, time)):  # datetime is a date subclass
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _stdlibDumps(obj):
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def _orjsonDumps(obj):
+    try:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:  # e.g. integers beyond 64 bits; the stdlib copes
+        return _stdlibDumps(obj)
+
+
+def encoderName():
+    choice = os.environ.get("JSON_ENCODER", "auto").lower()
+    if choice == "stdlib" or orjson is None:
+        return "stdlib"
+    return "orjson"
+
+
+_dumps = _orjsonDumps if encoderName() == "orjson" else _stdlibDumps
+
+
+def dumps(obj):
+    """Serialize ``obj`` to UTF-8 JSON bytes with the configured encoder."""
+    return _dumps(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through ``dumps``, timed as the request's ``serialize`` stage.
+
+    Quart's provider is Flask's, so asgi.py installs this class as well.
+    """
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with metrics.timeStage("serialize"):
+            return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,169 @@
+"""
+Lazy, cached access to application secrets.
+
+Nothing is fetched at import time: the Adapter asks for secrets when it first
+opens a database connection or sends an email, and related secrets are fetched
+concurrently in one go. Values are cached for SECRETS_TTL seconds and a
+background thread refreshes them before they expire, so rotated credentials
+are picked up without a restart and a brief Key Vault outage keeps serving the
+last known values.
+
+SECRETS_PROVIDER chooses where secrets come from:
+  keyvault (default)  Azure Key Vault via DefaultAzureCredential
+  env                 environment variables, ``db-host`` -> ``DB_HOST`` (see ENV_ALIASES)
+  file                a JSON object of name -> value at SECRETS_FILE
+"""
+
+# secretstore.py
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class KeyVaultProvider:
+    def __init__(self, vault_url, max_workers=8):
+        self.vault_url = vault_url
+        self.max_workers = max_workers
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Imported here so env/file deployments never load the Azure SDK
+                    from azure.identity import DefaultAzureCredential
+                    from azure.keyvault.secrets import SecretClient
+                    self._client = SecretClient(vault_url=self.vault_url, credential=DefaultAzureCredential())
+        return self._client
+
+    def fetch(self, names):
+        """Fetch ``names`` in parallel; returns {name: value} for the ones that succeeded."""
+        client = self.client
+
+        def one(name):
+            try:
+                return name, client.get_secret(name).value
+            except Exception as e:
+                logger.error("Error fetching %s: %s", name, e)
+                return name, None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(names)) or 1) as pool:
+            return {name: value for name, value in pool.map(one, names) if value is not None}
+
+
+# Secrets whose Key Vault names don't translate into a sensible variable name
+ENV_ALIASES = {
+    "azure-postgresql-password-bf846": "DB_PASSWORD",
+}
+
+
+class EnvProvider:
+    @staticmethod
+    def envName(name):
+        return ENV_ALIASES.get(name) or name.upper().replace("-", "_")
+
+    def fetch(self, names):
+        values = {name: os.environ.get(self.envName(name)) for name in names}
+        return {name: value for name, value in values.items() if value is not None}
+
+
+class FileProvider:
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, names):
+        # Re-read on every fetch so edits to the file behave like a rotation
+        with open(self.path) as f:
+            data = json.load(f)
+        return {name: data[name] for name in names if data.get(name) is not None}
+
+
+def buildProvider():
+    kind = os.environ.get("SECRETS_PROVIDER", "keyvault").lower()
+    if kind == "env":
+        return EnvProvider()
+    if kind == "file":
+        return FileProvider(os.environ.get("SECRETS_FILE", "secrets.json"))
+    return KeyVaultProvider(os.environ.get("KEY_VAULT_URL", "https://meetezkeyvault.vault.azure.net"))
+
+
+class SecretStore:
+    def __init__(self, provider, ttl=3600.0, refresh=True):
+        self.provider = provider
+        self.ttl = ttl
+        self.refresh = refresh
+        self._cache = {}  # name -> (value, fetched_at)
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()  # one provider round trip at a time
+        self._refresher = None
+
+    def get(self, name):
+        """Return a secret, fetching it on first use or once its cached copy has expired."""
+        return self.getMany([name]).get(name)
+
+    def getMany(self, names):
+        """Return {name: value} for ``names``, fetching all missing/expired ones in one batch."""
+        cached, stale = self._lookup(names)
+        if stale:
+            with self._fetch_lock:
+                # Another thread (e.g. the prefetch) may have loaded them while we waited
+                cached, stale = self._lookup(names)
+                if stale:
+                    self._load(stale)
+                    cached, _ = self._lookup(names)
+            self._startRefresher()
+        return {n: item[0] if item else None for n, item in cached.items()}
+
+    def _lookup(self, names):
+        now = time.monotonic()
+        with self._lock:
+            cached = {n: self._cache.get(n) for n in names}
+        stale = [n for n, item in cached.items() if item is None or now - item[1] >= self.ttl]
+        return cached, stale
+
+    def prefetch(self, names):
+        """Warm the cache in a background thread so startup never waits on the provider."""
+        threading.Thread(target=self.getMany, args=(list(names),), name="secret-prefetch", daemon=True).start()
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names or list(self._cache):
+                self._cache.pop(name, None)
+
+    def _load(self, names):
+        try:
+            fetched = self.provider.fetch(names)
+        except Exception as e:
+            # Keep serving whatever we already had rather than failing the caller
+            logger.error("Error fetching secrets %s: %s", names, e)
+            return
+        now = time.monotonic()
+        with self._lock:
+            for name, value in fetched.items():
+                self._cache[name] = (value, now)
+
+    def _startRefresher(self):
+        if not self.refresh or self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refreshLoop, name="secret-refresh", daemon=True)
+            self._refresher.start()
+
+    def _refreshLoop(self):
+        # Refresh ahead of expiry so request threads almost never block on a fetch
+        while True:
+            time.sleep(max(self.ttl * 0.75, 1.0))
+            with self._lock:
+                names = list(self._cache)
+            if names:
+                with self._fetch_lock:
+                    self._load(names)
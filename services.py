@@ -0,0 +1,991 @@
+"""
+Service layer shared by the Flask routes and the Dash callbacks.
+
+Every operation the API exposes lives here as a plain function taking Python
+arguments and returning JSON-ready dicts, so the dashboard can call it
+in-process instead of going back out through the public HTTPS endpoint.
+Invalid input raises ServiceError carrying the HTTP status to report; database
+failures propagate as psycopg2 / PoolError exceptions.
+"""
+
+# services.py
+import base64
+import binascii
+import hashlib
+import json
+import random
+import re
+import time
+from datetime import date, datetime
+
+import psycopg2
+from psycopg2 import errorcodes
+from psycopg2.extras import execute_values
+
+import emailtemplates
+import ical
+import metrics
+import rows as records
+from adapter import (debounceSettings, getConnection, notificationStatus, readsFromPrimary, unsubscribeLinks,
+                     wakeOutbox)
+from cache import queryCache
+from outbox import enqueueNotification
+
+EVENT_COLUMNS = records.columns(records.EventRow)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BULK_ROWS = 10000
+
+
+class ServiceError(Exception):
+    """Invalid request; ``status`` is the HTTP status code the API should return."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def cachedRead(key, load, tags=()):
+    """queryCache.getOrLoad for the read functions below.
+
+    A client reading its own writes skips the lookup, since a reader on a
+    lagging replica may have refilled the entry after the write invalidated
+    it. The client's primary read then replaces the entry.
+    """
+    return queryCache.getOrLoad(key, load, tags=tags, refresh=readsFromPrimary())
+
+
+# --- events ---------------------------------------------------------------
+
+def _encodeCursor(event_date, event_id):
+    """Opaque keyset cursor pointing just after (event_date, event_id)."""
+    raw = json.dumps([event_date.isoformat(), event_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decodeCursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    event_date, event_id = json.loads(raw)
+    return date.fromisoformat(event_date), int(event_id)
+
+# SQL shared with the async serving mode (asgi.py), which uses the same %s placeholders
+INSERT_EVENT_SQL = """
+    INSERT INTO events (user_id, title, description, event_date)
+    VALUES (%s, %s, %s, %s) RETURNING event_id;
+"""
+UPDATE_EVENT_SQL = """
+    UPDATE events
+    SET title = %s, description = %s, event_date = %s
+    WHERE event_id = %s;
+"""
+DELETE_EVENT_SQL = "DELETE FROM events WHERE event_id = %s;"
+
+def addEvent(user_id, title, description, event_date):
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(INSERT_EVENT_SQL, (user_id, title, description, event_date))
+        event_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    queryCache.invalidate("events")
+    return event_id
+
+def eventsQuery(limit=DEFAULT_PAGE_SIZE, cursor=None, date_from=None, date_to=None, user_id=None):
+    """Validate getEvents arguments; returns (cache key, SQL, params, limit)."""
+    try:
+        limit = int(limit)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ServiceError(f"limit must be an integer between 1 and {MAX_PAGE_SIZE}")
+
+    conditions, params = [], []
+    try:
+        if cursor:
+            conditions.append("(event_date, event_id) > (%s, %s)")
+            params.extend(_decodeCursor(cursor))
+        if date_from:
+            conditions.append("event_date >= %s")
+            params.append(date.fromisoformat(str(date_from)))
+        if date_to:
+            conditions.append("event_date <= %s")
+            params.append(date.fromisoformat(str(date_to)))
+        if user_id:
+            conditions.append("user_id = %s")
+            params.append(int(user_id))
+    except (ValueError, TypeError, binascii.Error):
+        raise ServiceError("Invalid cursor, from, to or user_id parameter")
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Fetch one extra row to learn whether another page exists
+    sql = f"""
+        SELECT {EVENT_COLUMNS}
+        FROM events
+        {where}
+        ORDER BY event_date, event_id
+        LIMIT %s;
+    """
+    key = "events:" + json.dumps([limit, cursor, date_from, date_to, user_id], default=str)
+    return key, sql, (*params, limit + 1), limit
+
+@metrics.stage("convert")
+def eventsPage(rows, limit):
+    """Turn the limit + 1 rows fetched by eventsQuery's SQL into a page payload."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = records.EventRow._make(rows[-1])
+        next_cursor = _encodeCursor(last.event_date, last.event_id)
+
+    return {"events": _eventRecords(rows), "next_cursor": next_cursor}
+
+_eventRecords = records.recordMapper(records.EventRow)
+
+def getEvents(limit=DEFAULT_PAGE_SIZE, cursor=None, date_from=None, date_to=None, user_id=None,
+              version=None):
+    """One page of events ordered by (event_date, event_id).
+
+    ``cursor`` is the previous page's next_cursor, ``date_from`` / ``date_to`` are
+    inclusive event_date bounds (YYYY-MM-DD) and ``user_id`` filters by organizer.
+    ``version`` is the ETag the caller stamps the page with (see versionedKey).
+    """
+    key, sql, params, limit = eventsQuery(limit, cursor, date_from, date_to, user_id)
+    key = versionedKey(key, version)
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            cur.close()
+        return eventsPage(rows, limit)
+
+    # Every page is tagged "events" because any event write can shift any page
+    return cachedRead(key, load, tags=("events",))
+
+# Columns the dashboard table may sort and filter on, with a parser for filter values
+TABLE_COLUMNS = {
+    "event_id": int,
+    "user_id": int,
+    "title": str,
+    "description": str,
+    "event_date": date.fromisoformat,
+    "created_at": datetime.fromisoformat,
+}
+TABLE_OPERATORS = {"eq": "=", "ne": "<>", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+MAX_TABLE_PAGE_SIZE = 500
+
+def eventsTableQuery(page=0, page_size=25, sort_by=(), filters=()):
+    """Validate a table request; returns (where SQL, where params, ORDER BY SQL, page, page_size).
+
+    ``sort_by`` is a list of (column, "asc" | "desc"); ``filters`` a list of
+    (column, operator, value) where operator is one of TABLE_OPERATORS or
+    ``contains`` (case-insensitive substring) / ``datestartswith``.
+    """
+    try:
+        page, page_size = int(page), int(page_size)
+        if page < 0 or not 1 <= page_size <= MAX_TABLE_PAGE_SIZE:
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ServiceError(f"page must be >= 0 and page_size between 1 and {MAX_TABLE_PAGE_SIZE}")
+
+    conditions, params = [], []
+    for column, operator, value in filters:
+        if column not in TABLE_COLUMNS:
+            raise ServiceError(f"Cannot filter on {column}")
+        if operator in ("contains", "datestartswith"):
+            pattern = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            pattern = f"%{pattern}%" if operator == "contains" else f"{pattern}%"
+            conditions.append(f"CAST({column} AS TEXT) ILIKE %s")
+            params.append(pattern)
+        elif operator in TABLE_OPERATORS:
+            try:
+                params.append(TABLE_COLUMNS[column](str(value)))
+            except ValueError:
+                raise ServiceError(f"Invalid value for {column}: {value}")
+            conditions.append(f"{column} {TABLE_OPERATORS[operator]} %s")
+        else:
+            raise ServiceError(f"Unsupported filter operator: {operator}")
+
+    order = []
+    for column, direction in sort_by:
+        if column not in TABLE_COLUMNS or direction not in ("asc", "desc"):
+            raise ServiceError(f"Cannot sort on {column} {direction}")
+        order.append(f"{column} {direction.upper()}")
+    order.append("event_id")  # unique tie-breaker so pages never overlap
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params, ", ".join(order), page, page_size
+
+@metrics.stage("convert")
+def eventsTablePayload(rows, total):
+    return {"events": _eventRecords(rows), "total": total}
+
+def getEventsTable(page=0, page_size=25, sort_by=(), filters=()):
+    """One page of the dashboard's event table with server-side sorting and filtering.
+
+    Unlike getEvents this pages by offset, because the table jumps to arbitrary
+    page numbers; ``total`` is the number of matching events.
+    """
+    sort_by = [tuple(s) for s in sort_by or ()]
+    filters = [tuple(f) for f in filters or ()]
+    where, params, order, page, page_size = eventsTableQuery(page, page_size, sort_by, filters)
+    key = "eventsTable:" + json.dumps([page, page_size, sort_by, filters], default=str)
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM events {where};", params)
+            total = cur.fetchone()[0]
+            cur.execute(f"""
+                SELECT {EVENT_COLUMNS}
+                FROM events
+                {where}
+                ORDER BY {order}
+                LIMIT %s OFFSET %s;
+            """, (*params, page_size, page * page_size))
+            rows = cur.fetchall()
+            cur.close()
+        return eventsTablePayload(rows, total)
+
+    return cachedRead(key, load, tags=("events",))
+
+# --- search -----------------------------------------------------------------
+
+SEARCH_TERM = re.compile(r"[^\W_]+")
+MAX_SEARCH_TERMS = 16
+SEARCH_PAGE_SIZE = 20
+
+def searchTsquery(q):
+    """Prefix tsquery text matching events that contain every word of ``q``.
+
+    Only letters and digits are kept, so user input can never inject tsquery
+    operators; ``parti`` matches "party" and "parties" alike.
+    """
+    terms = SEARCH_TERM.findall(str(q or "").lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise ServiceError("q must contain at least one word")
+    return " & ".join(f"{term}:*" for term in terms)
+
+def _encodeSearchCursor(rank, event_id):
+    raw = json.dumps([rank, event_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decodeSearchCursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    rank, event_id = json.loads(raw)
+    return float(rank), int(event_id)
+
+def searchQuery(q, limit=SEARCH_PAGE_SIZE, cursor=None):
+    """Validate searchEvents arguments; returns (cache key, SQL, params, limit).
+
+    The GIN index on search_vector finds the matches; only they are ranked.
+    Pages are keyed on (rank, event_id) like getEvents' cursor, so a page costs
+    the same however deep it is.
+    """
+    tsquery = searchTsquery(q)
+    try:
+        limit = int(limit)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ServiceError(f"limit must be an integer between 1 and {MAX_PAGE_SIZE}")
+
+    after, params = "", [tsquery]
+    if cursor:
+        try:
+            rank, event_id = _decodeSearchCursor(cursor)
+        except (ValueError, TypeError, binascii.Error):
+            raise ServiceError("Invalid cursor parameter")
+        after = "WHERE rank < %s::real OR (rank = %s::real AND event_id < %s)"
+        params.extend((rank, rank, event_id))
+
+    sql = f"""
+        SELECT {records.columns(records.SearchRow)}
+        FROM (
+            SELECT {EVENT_COLUMNS}, ts_rank_cd(search_vector, query) AS rank
+            FROM events, to_tsquery('english', %s) AS query
+            WHERE search_vector @@ query
+        ) matches
+        {after}
+        ORDER BY rank DESC, event_id DESC
+        LIMIT %s;
+    """
+    key = "search:" + json.dumps([tsquery, limit, cursor])
+    return key, sql, (*params, limit + 1), limit
+
+@metrics.stage("convert")
+def searchPage(rows, limit):
+    """Turn the limit + 1 rows fetched by searchQuery's SQL into a page payload."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = records.SearchRow._make(rows[-1])
+        next_cursor = _encodeSearchCursor(last.rank, last.event_id)
+    return {"events": _searchRecords(rows), "next_cursor": next_cursor}
+
+_searchRecords = records.recordMapper(records.SearchRow)
+
+def searchEvents(q, limit=SEARCH_PAGE_SIZE, cursor=None, version=None):
+    """Events whose title or description contains every word of ``q`` (as a prefix).
+
+    Best matches first: title hits outrank description hits, and ``rank`` is
+    returned with each event. ``cursor`` is the previous page's next_cursor.
+    """
+    key, sql, params, limit = searchQuery(q, limit, cursor)
+    key = versionedKey(key, version)
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            cur.close()
+        return searchPage(rows, limit)
+
+    return cachedRead(key, load, tags=("events",))
+
+def updateNotification(title, description, event_date):
+    """The message sent to subscribers when an event changes, rendered once for all of them.
+
+    An emailtemplates.Message whose recipient fields the outbox drainer fills per recipient.
+    """
+    return emailtemplates.render("event_updated", title=title, description=description,
+                                 event_date=event_date)
+
+def updateEvent(event_id, title, description, event_date):
+    """Update an event and queue a notification to its subscribers in one transaction."""
+    if not event_id:
+        raise ServiceError("Missing event_id")
+
+    message = updateNotification(title, description, event_date)
+
+    with getConnection() as conn:
+        cur = conn.cursor()
+
+        # 1. Update the event; nothing to notify about if it does not exist
+        cur.execute(UPDATE_EVENT_SQL, (title, description, event_date, event_id))
+        if cur.rowcount == 0:
+            conn.rollback()
+            cur.close()
+            raise ServiceError("Event not found", 404)
+
+        # 2. Record one outbox row per subscriber in the same transaction; a pending
+        #    notification from an earlier edit is folded into this one
+        debounce, max_wait = debounceSettings()
+        job_id, recipients = enqueueNotification(cur, event_id, message, debounce, max_wait)
+        conn.commit()
+        cur.close()
+    queryCache.invalidate("events", f"event:{event_id}")
+
+    # 3. Outbox drainers deliver the emails once the rows are committed
+    wakeOutbox()
+    return {"job_id": job_id, "recipients": recipients}
+
+def deleteEvent(event_id):
+    if not event_id:
+        raise ServiceError("Missing event_id")
+
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(DELETE_EVENT_SQL, (event_id,))
+        conn.commit()
+        cur.close()
+    queryCache.invalidate("events", f"event:{event_id}", f"event:{event_id}:subscribers")
+
+def getNotificationStatus(job_id):
+    if not job_id:
+        raise ServiceError("Missing job_id parameter")
+    status = notificationStatus(job_id)
+    if status is None:
+        raise ServiceError("Unknown notification job", 404)
+    return status
+
+
+# --- stats ----------------------------------------------------------------
+
+MAX_STATS_LIMIT = 100
+
+# subscriber_count is maintained by a trigger on notifications (migration 4)
+STATS_COLUMNS = records.columns(records.StatsRow)
+TOP_EVENTS_SQL = f"""
+    SELECT {STATS_COLUMNS}
+    FROM events
+    ORDER BY subscriber_count DESC, event_id
+    LIMIT %s;
+"""
+UPCOMING_EVENTS_SQL = f"""
+    SELECT {STATS_COLUMNS}
+    FROM events
+    WHERE event_date >= CURRENT_DATE
+    ORDER BY event_date, event_id
+    LIMIT %s;
+"""
+EVENT_STATS_SQL = f"SELECT {STATS_COLUMNS} FROM events WHERE event_id = %s;"
+
+def statsLimit(limit):
+    try:
+        limit = int(limit)
+        if not 1 <= limit <= MAX_STATS_LIMIT:
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ServiceError(f"limit must be an integer between 1 and {MAX_STATS_LIMIT}")
+    return limit
+
+statsRecord = records.recordOf(records.StatsRow)
+_statsRecords = records.recordMapper(records.StatsRow)
+
+@metrics.stage("convert")
+def eventStatsPayload(top, upcoming):
+    return {"top_events": _statsRecords(top), "upcoming": _statsRecords(upcoming)}
+
+def getEventStats(limit=10, event_id=None):
+    """Top events by subscribers and the next upcoming events, each with its subscriber count.
+
+    With ``event_id`` returns just that event's counts instead.
+    """
+    if event_id:
+        def loadOne():
+            with getConnection(readonly=True) as conn:
+                cur = conn.cursor()
+                cur.execute(EVENT_STATS_SQL, (event_id,))
+                row = cur.fetchone()
+                cur.close()
+            if row is None:
+                raise ServiceError("Unknown event", 404)
+            return statsRecord(row)
+        return cachedRead(f"eventStats:{event_id}", loadOne, tags=(f"event:{event_id}:subscribers", "events"))
+
+    limit = statsLimit(limit)
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(TOP_EVENTS_SQL, (limit,))
+            top = cur.fetchall()
+            cur.execute(UPCOMING_EVENTS_SQL, (limit,))
+            upcoming = cur.fetchall()
+            cur.close()
+        return eventStatsPayload(top, upcoming)
+
+    return cachedRead(f"eventStats:top:{limit}", load, tags=("events", "stats"))
+
+
+# --- users and subscriptions ---------------------------------------------
+
+INSERT_USER_SQL = "INSERT INTO users (name, email) VALUES (%s, %s) RETURNING user_id;"
+# notifications_user_event_key makes repeat subscriptions a no-op
+SUBSCRIBE_SQL = """
+    INSERT INTO notifications (user_id, event_id)
+    VALUES (%s, %s)
+    ON CONFLICT (user_id, event_id) DO NOTHING;
+"""
+SUBSCRIBERS_SQL = f"""
+    SELECT {records.columns(records.SubscriberRow, "u")}
+    FROM notifications n
+    JOIN users u ON n.user_id = u.user_id
+    WHERE n.event_id = %s;
+"""
+# notifications.event_date mirrors events.event_date (migration 7), so the range
+# and the ordering both come straight off notifications_user_date_idx
+USER_EVENTS_SQL = f"""
+    SELECT {records.columns(records.UserEventRow, "e")}
+    FROM notifications n
+    JOIN events e ON n.event_id = e.event_id
+    WHERE n.user_id = %s {{conditions}}
+    ORDER BY n.event_date {{order}}, n.event_id {{order}}
+    {{limit}};
+"""
+CALENDAR_SQL = f"""
+    SELECT u.name, {records.columns(records.UserEventRow, "e")}
+    FROM users u
+    LEFT JOIN notifications n ON n.user_id = u.user_id
+    LEFT JOIN events e ON n.event_id = e.event_id
+    WHERE u.user_id = %s
+    ORDER BY n.event_date, n.event_id;
+"""
+
+def addUser(name, email):
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(INSERT_USER_SQL, (name, email))
+        user_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    return user_id
+
+def subscribeEvent(user_id, event_id):
+    """Returns False if the user was already subscribed."""
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(SUBSCRIBE_SQL, (user_id, event_id))
+        added = cur.rowcount > 0
+        conn.commit()
+        cur.close()
+    queryCache.invalidate(f"event:{event_id}:subscribers", f"user:{user_id}:events", "stats")
+    return added
+
+UNSUBSCRIBE_SQL = "DELETE FROM notifications WHERE user_id = %s AND event_id = %s;"
+
+def unsubscribeEvent(user_id, event_id):
+    """Remove one subscription; returns False if the user was not subscribed."""
+    if not user_id or not event_id:
+        raise ServiceError("Missing user_id or event_id")
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(UNSUBSCRIBE_SQL, (user_id, event_id))
+        removed = cur.rowcount > 0
+        conn.commit()
+        cur.close()
+    queryCache.invalidate(f"event:{event_id}:subscribers", f"user:{user_id}:events", "stats")
+    return removed
+
+def checkUnsubscribeLink(user_id, event_id, signature):
+    """(user_id, event_id) from a signed email link; raises 403 if it was not signed by us."""
+    try:
+        user_id, event_id = int(user_id), int(event_id)
+    except (TypeError, ValueError):
+        raise ServiceError("Invalid unsubscribe link")
+    if not unsubscribeLinks().verify(user_id, event_id, signature):
+        raise ServiceError("Invalid unsubscribe link", 403)
+    return user_id, event_id
+
+# Set-based (un)subscribe of every user in one list to every event in another, one
+# statement each. Ids that do not exist are reported back instead of failing the batch.
+SUBSCRIBE_SET_SQL = """
+    WITH u AS (SELECT user_id FROM users WHERE user_id = ANY(%(user_ids)s)),
+         e AS (SELECT event_id FROM events WHERE event_id = ANY(%(event_ids)s)),
+         changed AS (
+             INSERT INTO notifications (user_id, event_id)
+             SELECT u.user_id, e.event_id FROM u CROSS JOIN e
+             ON CONFLICT (user_id, event_id) DO NOTHING
+             RETURNING 1
+         )
+    SELECT (SELECT COUNT(*) FROM changed),
+           ARRAY(SELECT x FROM unnest(%(user_ids)s::int[]) x WHERE x NOT IN (SELECT user_id FROM u)),
+           ARRAY(SELECT x FROM unnest(%(event_ids)s::int[]) x WHERE x NOT IN (SELECT event_id FROM e));
+"""
+UNSUBSCRIBE_SET_SQL = """
+    WITH changed AS (
+        DELETE FROM notifications
+        WHERE user_id = ANY(%(user_ids)s) AND event_id = ANY(%(event_ids)s)
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM changed;
+"""
+
+def subscriptionSet(user_ids, event_ids):
+    """Validate a set operation's ids (a single id or a list each); returns sorted unique lists."""
+    def ids(value, name):
+        values = value if isinstance(value, list) else [value]
+        try:
+            values = sorted({int(v) for v in values if v not in (None, "")})
+        except (TypeError, ValueError):
+            raise ServiceError(f"{name} must be integers")
+        if not values:
+            raise ServiceError(f"Missing {name}")
+        return values
+
+    user_ids, event_ids = ids(user_ids, "user_ids"), ids(event_ids, "event_ids")
+    if len(user_ids) * len(event_ids) > MAX_BULK_ROWS:
+        raise ServiceError(f"At most {MAX_BULK_ROWS} user/event pairs per request")
+    return {"user_ids": user_ids, "event_ids": event_ids}
+
+def invalidateSubscriptions(params):
+    tags = {f"user:{u}:events" for u in params["user_ids"]}
+    tags |= {f"event:{e}:subscribers" for e in params["event_ids"]}
+    queryCache.invalidate("stats", *tags)
+
+def subscriptionSetResult(params, changed, missing_users=(), missing_events=(), subscribe=True):
+    existing = (len(params["user_ids"]) - len(missing_users)) * (len(params["event_ids"]) - len(missing_events))
+    if subscribe:
+        return {"subscribed": changed, "already_subscribed": existing - changed,
+                "missing_user_ids": list(missing_users), "missing_event_ids": list(missing_events)}
+    return {"unsubscribed": changed, "not_subscribed": existing - changed}
+
+def subscribeMany(user_ids, event_ids):
+    """Subscribe every user in ``user_ids`` to every event in ``event_ids`` in one statement."""
+    params = subscriptionSet(user_ids, event_ids)
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(SUBSCRIBE_SET_SQL, params)
+        changed, missing_users, missing_events = cur.fetchone()
+        conn.commit()
+        cur.close()
+    invalidateSubscriptions(params)
+    return subscriptionSetResult(params, changed, missing_users, missing_events)
+
+def unsubscribeMany(user_ids, event_ids):
+    """Remove every (user, event) subscription in the cross product of the two lists."""
+    params = subscriptionSet(user_ids, event_ids)
+    with getConnection() as conn:
+        cur = conn.cursor()
+        cur.execute(UNSUBSCRIBE_SET_SQL, params)
+        changed = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    invalidateSubscriptions(params)
+    return subscriptionSetResult(params, changed, subscribe=False)
+
+_subscriberRecords = records.recordMapper(records.SubscriberRow)
+
+@metrics.stage("convert")
+def subscribersPayload(rows):
+    return {"subscribers": _subscriberRecords(rows)}
+
+def getSubscribers(event_id, version=None):
+    if not event_id:
+        raise ServiceError("Missing event_id parameter")
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(SUBSCRIBERS_SQL, (event_id,))
+            rows = cur.fetchall()
+            cur.close()
+        return subscribersPayload(rows)
+
+    return cachedRead(versionedKey(f"subscribers:{event_id}", version), load,
+                      tags=(f"event:{event_id}:subscribers",))
+
+_userEventRecords = records.recordMapper(records.UserEventRow)
+
+@metrics.stage("convert")
+def userEventsPayload(rows):
+    # Dates stay date objects; the JSON encoder writes them as ISO 8601
+    return {"events": _userEventRecords(rows)}
+
+def userEventsTags(user_id):
+    """Tag a user's event list with each listed event so editing or deleting one evicts it."""
+    def tags(payload):
+        return [f"user:{user_id}:events"] + [f"event:{e['event_id']}" for e in payload["events"]]
+    return tags
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+def userEventsQuery(user_id, date_from=None, date_to=None, upcoming=False, order="asc", limit=None):
+    """Validate getUserEvents arguments; returns (cache key, SQL, params, cache tags)."""
+    if not user_id:
+        raise ServiceError("Missing user_id parameter")
+    order = str(order or "asc").lower()
+    if order not in ("asc", "desc"):
+        raise ServiceError("order must be asc or desc")
+
+    conditions, params = [], [user_id]
+    try:
+        if date_from:
+            conditions.append("AND n.event_date >= %s")
+            params.append(date.fromisoformat(str(date_from)))
+        if date_to:
+            conditions.append("AND n.event_date <= %s")
+            params.append(date.fromisoformat(str(date_to)))
+        if limit not in (None, ""):
+            limit = int(limit)
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError
+            params.append(limit)
+    except (ValueError, TypeError):
+        raise ServiceError(f"from / to must be YYYY-MM-DD and limit between 1 and {MAX_PAGE_SIZE}")
+    upcoming = _flag(upcoming)
+    if upcoming:
+        conditions.append("AND n.event_date >= CURRENT_DATE")
+
+    sql = USER_EVENTS_SQL.format(conditions=" ".join(conditions), order=order.upper(),
+                                 limit="LIMIT %s" if limit not in (None, "") else "")
+    key = "userEvents:" + json.dumps([user_id, date_from, date_to, upcoming, order, limit], default=str)
+    tags = userEventsTags(user_id)
+    if conditions or limit not in (None, ""):
+        # A filtered list can gain an event whose date moved into range, which its own tags can't see
+        tags = (lambda payload, listed=tags: listed(payload) + ["events"])
+    return key, sql, params, tags
+
+def getUserEvents(user_id, date_from=None, date_to=None, upcoming=False, order="asc", limit=None,
+                  version=None):
+    """Events ``user_id`` is subscribed to, ordered by event_date.
+
+    ``date_from`` / ``date_to`` are inclusive YYYY-MM-DD bounds, ``upcoming``
+    drops past events, ``order`` is asc or desc and ``limit`` caps the count.
+    """
+    key, sql, params, tags = userEventsQuery(user_id, date_from, date_to, upcoming, order, limit)
+    key = versionedKey(key, version)
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            cur.close()
+        return userEventsPayload(rows)
+
+    return cachedRead(key, load, tags=tags)
+
+def calendarTags(user_id):
+    """Same invalidation as getUserEvents: the user's subscriptions and each listed event."""
+    def tags(payload):
+        return [f"user:{user_id}:events"] + [f"event:{event_id}" for event_id in payload["event_ids"]]
+    return tags
+
+@metrics.stage("convert")
+def calendarPayload(rows):
+    """The feed for CALENDAR_SQL's rows, with a content hash to use as its ETag."""
+    if not rows:
+        raise ServiceError("Unknown user", 404)
+    events = [row[1:] for row in rows if row[1] is not None]  # LEFT JOIN: a user without events
+    body = ical.renderCalendar(f"MeetEZ: {rows[0][0]}", events)
+    return {"etag": hashlib.sha256(body.encode("utf-8")).hexdigest()[:32], "body": body,
+            "event_ids": [event[0] for event in events]}
+
+def getUserCalendar(user_id):
+    """iCalendar feed of ``user_id``'s subscribed events.
+
+    Cached with the same tags as getUserEvents, so a polling calendar client
+    costs a cache lookup until one of the user's events or subscriptions changes.
+    """
+    if not user_id:
+        raise ServiceError("Missing user_id parameter")
+
+    def load():
+        with getConnection(readonly=True) as conn:
+            cur = conn.cursor()
+            cur.execute(CALENDAR_SQL, (user_id,))
+            rows = cur.fetchall()
+            cur.close()
+        return calendarPayload(rows)
+
+    return cachedRead(f"calendar:{user_id}", load, tags=calendarTags(user_id))
+
+
+# --- bulk writes ----------------------------------------------------------
+
+# Lock conflicts with a concurrent batch: the whole batch is retried, not blamed on its rows
+TRANSIENT_ERRORS = (errorcodes.DEADLOCK_DETECTED, errorcodes.SERIALIZATION_FAILURE)
+BULK_RETRIES = 3
+BULK_RETRY_BACKOFF = 0.05
+BULK_CONFLICT = "The batch kept conflicting with concurrent writes; retry it"
+
+def _bulkInsert(conn, sql, rows):
+    """Insert ``rows`` with a single execute_values round trip.
+
+    Returns ``(returned, errors)`` where ``returned`` holds the RETURNING rows of
+    every row that went in (in input order) and ``errors`` maps row index to a
+    message. If the set-based insert fails because a row breaks a constraint,
+    the batch is replayed row by row under savepoints so the good rows still
+    land and each bad row gets its own error. A deadlock or serialization
+    failure retries the whole batch with backoff instead, and is a 503 once
+    the retries run out.
+    """
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT bulk_insert;")
+    for attempt in range(BULK_RETRIES + 1):
+        try:
+            returned = execute_values(cur, sql, rows, page_size=len(rows), fetch=True)
+            cur.execute("RELEASE SAVEPOINT bulk_insert;")
+            cur.close()
+            return returned, {}
+        except psycopg2.Error as e:
+            # Also drops the locks the failed attempt took, so the other batch can finish
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_insert;")
+            if e.pgcode not in TRANSIENT_ERRORS:
+                break
+            if attempt == BULK_RETRIES:
+                cur.close()
+                raise ServiceError(BULK_CONFLICT, 503) from e
+            time.sleep(BULK_RETRY_BACKOFF * 2 ** attempt * (1 + random.random()))
+
+    returned, errors = [], {}
+    for index, row in enumerate(rows):
+        cur.execute("SAVEPOINT bulk_row;")
+        try:
+            returned.extend(execute_values(cur, sql, [row], fetch=True))
+            cur.execute("RELEASE SAVEPOINT bulk_row;")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_row;")
+            if e.pgcode in TRANSIENT_ERRORS:
+                cur.close()
+                raise ServiceError(BULK_CONFLICT, 503) from e
+            errors[index] = e.diag.message_primary or str(e)
+    cur.close()
+    return returned, errors
+
+def _bulkRows(items, key, fields, required):
+    """Split a bulk payload into value tuples and per-row validation errors."""
+    if not isinstance(items, list) or not items:
+        raise ServiceError(f"Expected a non-empty '{key}' array")
+    if len(items) > MAX_BULK_ROWS:
+        raise ServiceError(f"At most {MAX_BULK_ROWS} rows per request")
+
+    valid, errors = [], {}
+    for index, item in enumerate(items):
+        missing = [f for f in required if not isinstance(item, dict) or item.get(f) in (None, "")]
+        if missing:
+            errors[index] = f"Missing {', '.join(missing)}"
+        else:
+            valid.append((index, tuple(item.get(f) for f in fields)))
+    return valid, errors
+
+def _bulkResult(ids, errors, id_key):
+    return {
+        id_key: ids,
+        "inserted": sum(1 for i in ids if i is not None),
+        "errors": [{"index": i, "error": errors[i]} for i in sorted(errors)],
+        "total": len(ids),
+    }
+
+def _insertInOrder(sql, valid, errors, ids, key=None):
+    """Bulk insert for tables without ON CONFLICT, where RETURNING rows map 1:1 to input rows.
+
+    ``key`` sorts the rows first, so overlapping batches take their locks in the same order.
+    """
+    if key is not None:
+        valid = sorted(valid, key=lambda item: key(item[1]))
+    with getConnection() as conn:
+        returned, failed = _bulkInsert(conn, sql, [row for _, row in valid])
+        conn.commit()
+    ok = iter(returned)
+    for position, (index, _) in enumerate(valid):
+        if position in failed:
+            errors[index] = failed[position]
+        else:
+            ids[index] = next(ok)[0]
+
+def addEvents(items):
+    """Batch addEvent: a list of {user_id, title, description, event_date} dicts."""
+    valid, errors = _bulkRows(items, "events", ("user_id", "title", "description", "event_date"),
+                              ("user_id", "title", "event_date"))
+    ids = [None] * len(items)
+    if valid:
+        _insertInOrder("""
+            INSERT INTO events (user_id, title, description, event_date)
+            VALUES %s RETURNING event_id;
+        """, valid, errors, ids, key=lambda row: str(row[0]))  # by user_id; any fixed order will do
+        queryCache.invalidate("events")
+    return _bulkResult(ids, errors, "event_ids")
+
+def addUsers(items):
+    """Batch addUser: a list of {name, email} dicts."""
+    valid, errors = _bulkRows(items, "users", ("name", "email"), ("name", "email"))
+    # A repeated email would fail the set-based insert and force the row-by-row replay
+    seen = set()
+    for index, (_, email) in valid:
+        if email in seen:
+            errors[index] = "Duplicate email in this batch"
+        seen.add(email)
+    valid = [(index, row) for index, row in valid if index not in errors]
+    ids = [None] * len(items)
+    if valid:
+        _insertInOrder("""
+            INSERT INTO users (name, email)
+            VALUES %s RETURNING user_id;
+        """, valid, errors, ids, key=lambda row: str(row[1]))
+    return _bulkResult(ids, errors, "user_ids")
+
+def subscribeEvents(items):
+    """Batch subscribeEvent: a list of {user_id, event_id} dicts.
+
+    Rows that were already subscribed, or repeat an earlier row, come back with a
+    null notification_id.
+    """
+    valid, errors = _bulkRows(items, "subscriptions", ("user_id", "event_id"), ("user_id", "event_id"))
+    ids = [None] * len(items)
+    # Input indexes per distinct (user_id, event_id); inserted in key order so overlapping
+    # batches take the unique index and trigger locks in the same order
+    pairs = {}
+    for index, (user_id, event_id) in valid:
+        try:
+            pair = (int(str(user_id)), int(str(event_id)))
+        except ValueError:
+            errors[index] = "user_id and event_id must be integers"
+            continue
+        pairs.setdefault(pair, []).append(index)
+    if pairs:
+        rows = sorted(pairs)
+        with getConnection() as conn:
+            returned, failed = _bulkInsert(conn, """
+                INSERT INTO notifications (user_id, event_id)
+                VALUES %s
+                ON CONFLICT (user_id, event_id) DO NOTHING
+                RETURNING notification_id, user_id, event_id;
+            """, rows)
+            conn.commit()
+        # ON CONFLICT skips rows, so match RETURNING rows back by (user_id, event_id)
+        created = {(r[1], r[2]): r[0] for r in returned}
+        for position, pair in enumerate(rows):
+            if position in failed:
+                for index in pairs[pair]:
+                    errors[index] = failed[position]
+            else:
+                ids[pairs[pair][0]] = created.get(pair)
+        tags = {f"event:{event_id}:subscribers" for _, event_id in rows}
+        tags |= {f"user:{user_id}:events" for user_id, _ in rows}
+        queryCache.invalidate("stats", *tags)
+    return _bulkResult(ids, errors, "notification_ids")
+
+
+# --- version stamps -------------------------------------------------------
+
+# data_versions is maintained by triggers (migration 6); every stamp includes
+# 'all', which a TRUNCATE bumps
+DATA_VERSION_SQL = "SELECT scope, version, modified_at FROM data_versions WHERE scope = ANY(%s);"
+
+def eventsScopes():
+    return ("all", "events")
+
+def subscribersScopes(event_id):
+    if not event_id:
+        raise ServiceError("Missing event_id parameter")
+    return ("all", "users", f"event:{event_id}:subscribers")
+
+def userEventsScopes(user_id):
+    if not user_id:
+        raise ServiceError("Missing user_id parameter")
+    return ("all", "events", f"user:{user_id}:events")
+
+def versionStamp(scopes, rows):
+    """(ETag value, Last-Modified) for ``scopes`` from their data_versions rows.
+
+    Versions only grow, so the dotted list of them changes whenever any scope does.
+    """
+    found = {scope: (version, modified_at) for scope, version, modified_at in rows}
+    etag = ".".join(str(found[scope][0]) if scope in found else "0" for scope in scopes)
+    return etag, max((modified_at for _, modified_at in found.values()), default=None)
+
+def versionedKey(key, version):
+    """Cache key for a payload served under ETag ``version``.
+
+    The stamp is read before the payload, so an entry stored under a version is
+    never older than it. Keying on it means a worker whose cache missed another
+    process's invalidation cannot pair the new ETag with an old body, and a
+    client that wrote (and reads its stamp from the primary) never gets an entry
+    loaded from a replica that had not caught up with the write.
+    """
+    return f"{key}@{version}" if version else key
+
+def dataVersion(scopes):
+    with getConnection(readonly=True) as conn:
+        cur = conn.cursor()
+        cur.execute(DATA_VERSION_SQL, (list(scopes),))
+        rows = cur.fetchall()
+        cur.close()
+    return versionStamp(scopes, rows)
+
+# --- exports --------------------------------------------------------------
+
+def exportEventsQuery():
+    """(cursor name, SQL, params, row type) for streaming every event."""
+    return ("export_events", f"""
+        SELECT {EVENT_COLUMNS}
+        FROM events
+        ORDER BY event_date, event_id;
+    """, (), records.EventRow)
+
+def exportSubscribersQuery(event_id=None):
+    """Same as exportEventsQuery for subscriptions, optionally for one event."""
+    where, params = "", ()
+    if event_id:
+        where, params = "WHERE n.event_id = %s", (event_id,)
+    return ("export_subscribers", f"""
+        SELECT n.event_id, {records.columns(records.SubscriberRow, "u")}
+        FROM notifications n
+        JOIN users u ON n.user_id = u.user_id
+        {where}
+        ORDER BY n.event_id, u.user_id;
+    """, params, records.EventSubscriberRow)